@@ -3,19 +3,29 @@ from __future__ import annotations
 from asyncio import run
 from enum import StrEnum
 from pathlib import Path
-from typing import Final
+from typing import Final, Optional
 
 from rich import print
 from typer import Argument, Context, Exit, Option, Typer
 from typer.models import ArgumentInfo, OptionInfo
 
-from .helpers import _get_command, _inspect, inspect_directory, show_devices
+from .helpers import _faststart, _get_command, _inspect, _write_graph, check_devices, gen_faststart_paths, \
+  gen_video_paths, inspect_directory, load_plan, show_benchmark, show_calibration, show_devices, show_encoder_stats, \
+  show_plan
 from .. import CLI_ENTRY, COPYRIGHT_NOTICE, DESCRIPTION, LICENSE, PROJECT_HOME, __version__
 from ..core.base import DEFAULT_JOBS, DEFAULT_LOG_LEVEL, DEFAULT_MODEL, \
   DEFAULT_THREADS, bad_file_exit, setup_logging
-from ..core.enums import LogLevel, Rc, Strategy
+from ..core.enums import LogLevel, Priority, Rc, Strategy
 
+from ..core.convert.benchmark import benchmark as run_benchmark, calibrate as run_calibrate
+from ..core.convert.cache import BYTES_PER_GB, DEFAULT_CACHE_SIZE
+from ..core.convert.graph import GraphFormat
+from ..core.convert.journal import Journal
+from ..core.convert.plan import plan_paths
 from ..core.convert.run import convert_paths
+from ..core.convert.settings import Settings
+from ..core.convert.stats import DEFAULT_STATS
+from ..core.convert.verify import NO_SAMPLES
 from ..core.convert.watch import convert_videos
 from ..core.model.device import get_devices_from_file
 
@@ -35,7 +45,7 @@ class Panels(StrEnum):
 DEFAULT_NAME_OPT: Final[OptionInfo] = Option(
   DEFAULT_MODEL,
   '--name', '-n',
-  help='📛 Device model name',
+  help='📛 Device model name, separate several names with commas to make videos that play on all of them',
   rich_help_panel=Panels.device,
 )
 
@@ -47,6 +57,14 @@ DEFAULT_PATHS_ARG: Final[ArgumentInfo] = Argument(
   show_default=False,
 )
 
+DEFAULT_OPTIONAL_PATHS_ARG: Final[ArgumentInfo] = Argument(
+  default=None,
+  help='Path(s) to video(s), optional with --plan.',
+  resolve_path=True,
+  metavar='📂PATHS',
+  show_default=False,
+)
+
 DEFAULT_REPLACE_OPT: Final[OptionInfo] = Option(
   False,
   '--replace', '-r',
@@ -108,6 +126,170 @@ DEFAULT_SUBTITLE_OPT: Final[ArgumentInfo] = Option(
   rich_help_panel=Panels.encoder_options,
 )
 
+DEFAULT_AUTOTUNE_OPT: Final[OptionInfo] = Option(
+  False,
+  '--auto', '-a',
+  help='🎛️ Size jobs and threads automatically based on system load, ignoring --jobs and --threads.',
+  rich_help_panel=Panels.encoder_options,
+)
+
+DEFAULT_PRIORITY_OPT: Final[OptionInfo] = Option(
+  Priority.normal,
+  '--priority', '-p',
+  help='🐢 Set the CPU and I/O scheduling priority of FFmpeg.',
+  show_default=True,
+  rich_help_panel=Panels.encoder_options,
+)
+
+DEFAULT_PAUSE_LOAD_OPT: Final[OptionInfo] = Option(
+  None,
+  '--pause-load', '-P',
+  help='⏸️ Pause jobs while other processes use more than this fraction of CPU, from 0 to 1.',
+  min=0.0,
+  max=1.0,
+  show_default=False,
+  rich_help_panel=Panels.encoder_options,
+)
+
+DEFAULT_PIN_OPT: Final[OptionInfo] = Option(
+  False,
+  '--pin',
+  help='📌 Pin each job to its own set of cores, NUMA-local where possible.',
+  rich_help_panel=Panels.encoder_options,
+)
+
+DEFAULT_TOKENS_OPT: Final[OptionInfo] = Option(
+  None,
+  '--tokens', '-T',
+  help='🎟️ Directory of a CPU token pool to share with other cast-convert processes.',
+  file_okay=False,
+  resolve_path=True,
+  show_default=False,
+  rich_help_panel=Panels.encoder_options,
+)
+
+DEFAULT_ADAPTIVE_OPT: Final[OptionInfo] = Option(
+  False,
+  '--adaptive', '-A',
+  help='⚡ Use faster encoder presets as the backlog grows, and quality presets when it is short.',
+  rich_help_panel=Panels.encoder_options,
+)
+
+DEFAULT_FIXUP_OPT: Final[OptionInfo] = Option(
+  False,
+  '--fixup', '-F',
+  help='🩹 Rewrite mismatched levels and HEVC tags in place of re-encoding, when the stream already fits.',
+  rich_help_panel=Panels.encoder_options,
+)
+
+DEFAULT_FASTSTART_OPT: Final[OptionInfo] = Option(
+  False,
+  '--faststart',
+  help='🏁 Move the moov atom of MP4s to the front, without remuxing, when that is all they need.',
+  rich_help_panel=Panels.encoder_options,
+)
+
+DEFAULT_SIDECAR_OPT: Final[OptionInfo] = Option(
+  False,
+  '--sidecar', '-V',
+  help='💬 Write text subtitles to sidecar WebVTT files instead of converting them in the container.',
+  rich_help_panel=Panels.encoder_options,
+)
+
+DEFAULT_CANARY_OPT: Final[OptionInfo] = Option(
+  False,
+  '--canary', '-C',
+  help='🐤 Encode the first seconds of each re-encode and check it plays before converting the whole video.',
+  rich_help_panel=Panels.encoder_options,
+)
+
+DEFAULT_VERIFY_OPT: Final[OptionInfo] = Option(
+  NO_SAMPLES,
+  '--verify', '-y',
+  help='✅ Decode this many sampled frames of converted videos, after probing them, before they replace originals.',
+  min=0,
+  rich_help_panel=Panels.encoder_options,
+)
+
+DEFAULT_EACH_OPT: Final[OptionInfo] = Option(
+  False,
+  '--each', '-E',
+  help='🔀 With several device names, make an output for each device that needs different formats, from one decode.',
+  rich_help_panel=Panels.encoder_options,
+)
+
+DEFAULT_JOURNAL_OPT: Final[OptionInfo] = Option(
+  None,
+  '--journal', '-J',
+  help='📓 Path to job journal, used to resume interrupted jobs.',
+  resolve_path=True,
+  show_default=False,
+  rich_help_panel=Panels.encoder_options,
+)
+
+DEFAULT_SCRATCH_OPT: Final[OptionInfo] = Option(
+  None,
+  '--scratch', '-S',
+  help='🗃️ Directory to write transcoded videos to before moving them next to the originals.',
+  exists=True,
+  file_okay=False,
+  dir_okay=True,
+  resolve_path=True,
+  show_default=False,
+  rich_help_panel=Panels.encoder_options,
+)
+
+DEFAULT_CACHE_OPT: Final[OptionInfo] = Option(
+  None,
+  '--cache', '-K',
+  help='♻️ Directory of converted videos to reuse when the same video is converted for the same device again.',
+  file_okay=False,
+  dir_okay=True,
+  resolve_path=True,
+  show_default=False,
+  rich_help_panel=Panels.encoder_options,
+)
+
+DEFAULT_CACHE_SIZE_OPT: Final[OptionInfo] = Option(
+  DEFAULT_CACHE_SIZE // BYTES_PER_GB,
+  '--cache-size',
+  help='🧹 Remove the least recently used videos from the cache when it grows past this many GB.',
+  min=0,
+  rich_help_panel=Panels.encoder_options,
+)
+
+DEFAULT_PLAN_OPT: Final[OptionInfo] = Option(
+  None,
+  '--plan',
+  help='🗺️ Run a plan saved by the plan command, without probing its videos again.',
+  exists=True,
+  dir_okay=False,
+  resolve_path=True,
+  show_default=False,
+  rich_help_panel=Panels.encoder_options,
+)
+
+DEFAULT_SAVE_PLAN_OPT: Final[OptionInfo] = Option(
+  None,
+  '--save', '-o',
+  help='💾 Save the plan to this file, to run later with convert --plan.',
+  dir_okay=False,
+  resolve_path=True,
+  show_default=False,
+  rich_help_panel=Panels.analyze,
+)
+
+DEFAULT_GRAPH_FORMAT_OPT: Final[OptionInfo] = Option(
+  None,
+  '--format', '-f',
+  help=(
+    '🕸️ Write a job graph for all the videos in this format, where each output depends on its source, '
+    'originals are kept.'
+  ),
+  show_default=False,
+  rich_help_panel=Panels.analyze,
+)
+
 LONG_DESCRIPTION: Final[str] = f"""
 {DESCRIPTION}
 
@@ -136,12 +318,16 @@ def command(
   threads: int = DEFAULT_THREADS_OPT,
   error: Strategy = DEFAULT_STRATEGY_OPT,
   subtitle: Path | None = DEFAULT_SUBTITLE_OPT,
+  fmt: Optional[GraphFormat] = DEFAULT_GRAPH_FORMAT_OPT,
 ):
   """
   📜 Get FFmpeg transcoding command.
   """
   rc: int = Rc.ok
 
+  if fmt:
+    raise Exit(_write_graph(name, paths, fmt, threads, error, subtitle))
+
   for path in paths:
     if _get_command(name, path, replace, threads, error, subtitle):
       rc = Rc.must_convert
@@ -156,17 +342,77 @@ def command(
 @bad_file_exit
 def convert(
   name: str = DEFAULT_NAME_OPT,
-  paths: list[Path] = DEFAULT_PATHS_ARG,
+  paths: Optional[list[Path]] = DEFAULT_OPTIONAL_PATHS_ARG,
   replace: bool = DEFAULT_REPLACE_OPT,
   jobs: int = DEFAULT_JOBS_OPT,
   threads: int = DEFAULT_THREADS_OPT,
   error: Strategy = DEFAULT_STRATEGY_OPT,
   subtitle: Path | None = DEFAULT_SUBTITLE_OPT,
+  journal: Path | None = DEFAULT_JOURNAL_OPT,
+  scratch: Path | None = DEFAULT_SCRATCH_OPT,
+  auto: bool = DEFAULT_AUTOTUNE_OPT,
+  priority: Priority = DEFAULT_PRIORITY_OPT,
+  pause_load: Optional[float] = DEFAULT_PAUSE_LOAD_OPT,
+  pin: bool = DEFAULT_PIN_OPT,
+  tokens: Path | None = DEFAULT_TOKENS_OPT,
+  adaptive: bool = DEFAULT_ADAPTIVE_OPT,
+  fixup: bool = DEFAULT_FIXUP_OPT,
+  faststart: bool = DEFAULT_FASTSTART_OPT,
+  sidecar: bool = DEFAULT_SIDECAR_OPT,
+  canary: bool = DEFAULT_CANARY_OPT,
+  verify: int = DEFAULT_VERIFY_OPT,
+  each: bool = DEFAULT_EACH_OPT,
+  plan: Optional[Path] = DEFAULT_PLAN_OPT,
+  cache: Optional[Path] = DEFAULT_CACHE_OPT,
+  cache_size: int = DEFAULT_CACHE_SIZE_OPT,
 ):
   """
   📼 Convert videos so that they're compatible with specified device.
   """
-  coro = convert_paths(name, replace, threads, jobs, *paths, strategy=error, subtitle=subtitle)
+  _journal = Journal.load(journal) if journal else None
+  videos = None
+
+  settings = Settings(
+    replace=replace,
+    threads=threads,
+    jobs=jobs,
+    subtitle=subtitle,
+    scratch=scratch,
+    autotune=auto,
+    priority=priority,
+    pause_load=pause_load,
+    pin=pin,
+    tokens=tokens,
+    adaptive=adaptive,
+    fixup=fixup,
+    faststart=faststart,
+    sidecar=sidecar,
+    canary=canary,
+    verify=verify,
+    each=each,
+    cache=cache,
+    cache_size=cache_size * BYTES_PER_GB,
+  )
+
+  if plan:
+    _plan = load_plan(plan)
+    name, settings, videos = _plan.name, _plan.get_settings(settings), _plan.get_videos()
+    paths = paths or [entry.path for entry in _plan.pending]
+
+  elif not paths:
+    print('[b red]You need to supply paths to videos, or a plan.')
+    raise Exit(Rc.missing_args)
+
+  check_devices(name, settings.each)
+
+  coro = convert_paths(
+    name,
+    *paths,
+    settings=settings,
+    strategy=error,
+    journal=_journal,
+    videos=videos,
+  )
   run(coro)
 
 
@@ -195,6 +441,118 @@ def inspect(
   raise Exit(rc)
 
 
+@cli.command(
+  rich_help_panel=Panels.analyze,
+  no_args_is_help=True,
+)
+@bad_file_exit
+def benchmark(
+  name: str = DEFAULT_NAME_OPT,
+  paths: list[Path] = DEFAULT_PATHS_ARG,
+  jobs: int = DEFAULT_JOBS_OPT,
+  threads: int = DEFAULT_THREADS_OPT,
+  scratch: Path | None = DEFAULT_SCRATCH_OPT,
+  auto: bool = DEFAULT_AUTOTUNE_OPT,
+):
+  """
+  ⏱️ Compare conversion speed with and without pinning jobs to cores.
+  """
+  settings = Settings(threads=threads, jobs=jobs, scratch=scratch, autotune=auto)
+  results = run(run_benchmark(name, *paths, settings=settings))
+
+  if not results:
+    print('[b yellow]Nothing to convert, no benchmark to run.')
+    raise Exit(Rc.ok)
+
+  show_benchmark(results)
+
+
+@cli.command(
+  rich_help_panel=Panels.analyze,
+)
+def calibrate(
+  priority: Priority = DEFAULT_PRIORITY_OPT,
+):
+  """
+  📐 Measure how fast this host encodes, to estimate conversion times.
+  """
+  calibration = run_calibrate(priority=priority)
+
+  if not calibration.samples:
+    print("[b red]Couldn't run any encoders, is FFmpeg installed?")
+    raise Exit(Rc.err)
+
+  show_calibration(calibration)
+
+
+@cli.command(
+  rich_help_panel=Panels.analyze,
+)
+def stats():
+  """
+  📈 Show how fast each encoder converted videos on this host.
+  """
+  if not DEFAULT_STATS.path.exists() or not (encoder_stats := DEFAULT_STATS.get_encoder_stats()):
+    print('[b yellow]No conversions recorded on this host yet.')
+    raise Exit(Rc.ok)
+
+  print(f'[b]Conversions recorded in [blue]"{DEFAULT_STATS.path}"[/]:')
+  show_encoder_stats(encoder_stats)
+
+
+@cli.command(
+  rich_help_panel=Panels.analyze,
+  no_args_is_help=True,
+)
+@bad_file_exit
+def plan(
+  name: str = DEFAULT_NAME_OPT,
+  paths: list[Path] = DEFAULT_PATHS_ARG,
+  jobs: int = DEFAULT_JOBS_OPT,
+  threads: int = DEFAULT_THREADS_OPT,
+  error: Strategy = DEFAULT_STRATEGY_OPT,
+  fixup: bool = DEFAULT_FIXUP_OPT,
+  faststart: bool = DEFAULT_FASTSTART_OPT,
+  sidecar: bool = DEFAULT_SIDECAR_OPT,
+  each: bool = DEFAULT_EACH_OPT,
+  save: Optional[Path] = DEFAULT_SAVE_PLAN_OPT,
+):
+  """
+  🗺️ Plan converting a library, with estimated CPU-hours, output size and duration.
+  """
+  settings = Settings(threads=threads, jobs=jobs, fixup=fixup, faststart=faststart, sidecar=sidecar, each=each)
+  check_devices(name, each)
+
+  _plan = run(plan_paths(name, *gen_video_paths(*paths), settings=settings, strategy=error))
+
+  show_plan(_plan, jobs, threads)
+
+  if save:
+    _plan.save(save)
+    print(f'[b green]Saved plan to [blue]"{save}"[/], run it with [b]convert --plan[/].')
+
+  raise Exit(Rc.must_convert if _plan.pending else Rc.ok)
+
+
+@cli.command(
+  rich_help_panel=Panels.convert,
+  no_args_is_help=True,
+)
+def faststart(
+  paths: list[Path] = DEFAULT_PATHS_ARG,
+):
+  """
+  🏁 Move the moov atom of MP4s to the front of the file, in place.
+  """
+  rc: int = Rc.ok
+
+  for path in gen_faststart_paths(*paths):
+    if not _faststart(path):
+      rc = Rc.failed_conversion
+
+  raise Exit(rc)
+
+
 @cli.command(
   rich_help_panel=Panels.supported,
   # no_args_is_help=True,
@@ -224,18 +582,58 @@ def watch(
   threads: int = DEFAULT_THREADS_OPT,
   error: Strategy = DEFAULT_STRATEGY_OPT,
   subtitle: Path | None = DEFAULT_SUBTITLE_OPT,
+  journal: Path | None = DEFAULT_JOURNAL_OPT,
+  scratch: Path | None = DEFAULT_SCRATCH_OPT,
+  auto: bool = DEFAULT_AUTOTUNE_OPT,
+  priority: Priority = DEFAULT_PRIORITY_OPT,
+  pause_load: Optional[float] = DEFAULT_PAUSE_LOAD_OPT,
+  pin: bool = DEFAULT_PIN_OPT,
+  tokens: Path | None = DEFAULT_TOKENS_OPT,
+  adaptive: bool = DEFAULT_ADAPTIVE_OPT,
+  fixup: bool = DEFAULT_FIXUP_OPT,
+  faststart: bool = DEFAULT_FASTSTART_OPT,
+  sidecar: bool = DEFAULT_SIDECAR_OPT,
+  canary: bool = DEFAULT_CANARY_OPT,
+  verify: int = DEFAULT_VERIFY_OPT,
+  each: bool = DEFAULT_EACH_OPT,
+  cache: Optional[Path] = DEFAULT_CACHE_OPT,
+  cache_size: int = DEFAULT_CACHE_SIZE_OPT,
 ):
   """
   👀 Watch directories for new or modified videos and convert them.
   """
+  _journal = Journal.load(journal) if journal else None
+
+  settings = Settings(
+    replace=replace,
+    threads=threads,
+    jobs=jobs,
+    subtitle=subtitle,
+    scratch=scratch,
+    autotune=auto,
+    priority=priority,
+    pause_load=pause_load,
+    pin=pin,
+    tokens=tokens,
+    adaptive=adaptive,
+    fixup=fixup,
+    faststart=faststart,
+    sidecar=sidecar,
+    canary=canary,
+    verify=verify,
+    each=each,
+    cache=cache,
+    cache_size=cache_size * BYTES_PER_GB,
+  )
+
+  check_devices(name, each)
+
   coro = convert_videos(
     *paths,
     device=name,
-    jobs=jobs,
-    replace=replace,
-    threads=threads,
+    settings=settings,
     error=error,
-    subtitle=subtitle,
+    journal=_journal,
   )
   run(coro)
 
@@ -1,29 +1,45 @@
 from __future__ import annotations
 
+import sys
+from asyncio import run
 from collections.abc import AsyncIterable, Iterable
+from datetime import timedelta
 from pathlib import Path
 from typing import Final, NoReturn
 
 from aiopath import AsyncPath
 from rich import print
+from rich.filesize import decimal
 from rich.markup import escape
 from typer import Exit
 from filetype import is_video, is_audio
 
-from ..core.base import DEFAULT_REPLACE, DEFAULT_THREADS, get_error_handler
-from ..core.convert.run import get_ffmpeg_cmd, get_stream
+from ..core.base import DEFAULT_JOBS, DEFAULT_REPLACE, DEFAULT_THREADS, get_error_handler
+from ..core.convert.benchmark import BenchmarkResult
+from ..core.convert.calibration import Calibration
+from ..core.convert.cost import estimate_cost, get_job_cost
+from ..core.convert.faststart import FASTSTART_EXTENSIONS, faststart
+from ..core.convert.graph import GraphFormat, get_graph, get_steps
+from ..core.convert.jobs import Action, Job
+from ..core.convert.plan import Plan, Summary, estimate_verify_time, estimate_wall_time
+from ..core.convert.preflight import preflight
+from ..core.convert.rename import RenameFormats, get_rename
+from ..core.convert.stats import EncoderStats
+from ..core.convert.run import get_ffmpeg_cmd, get_rename_cmd, get_rename_path, get_stream
 from ..core.convert.transcode import should_transcode, show_transcode_dismissal
 from ..core.enums import Rc, Strategy
-from ..core.exceptions import UnknownFormat
+from ..core.exceptions import DeviceError, FormatError, GraphError, PlanError, PreflightError, UnknownFormat
 from ..core.fmt import esc, tabs
 from ..core.media.codecs import AudioCodec
-from ..core.model.device import Device, Devices, get_device_fuzzy, get_devices_from_file
+from ..core.model.device import Device, Devices, get_common_device, get_device_fuzzy, get_devices_from_file, \
+  split_names
 from ..core.model.video import Video
 from ..core.parse import DEVICE_INFO
 from ..core.types import Peekable
 
 
 GLOB_FILES_RECURSIVE: Final[str] = '**/*.*'
+SECONDS_PER_HOUR: Final[int] = 60 * 60
 
 
 def show_devices(devices: Devices, details: bool = False):
@@ -59,6 +75,10 @@ def _get_command(
   if not (device := _get_device_from_name(name)):
     raise Exit(Rc.no_matching_device)
 
+  if formats := get_rename(device, video):
+    print(f'[b]{escape(get_rename_cmd(video, formats, replace))}')
+    return True
+
   should_transcode_handled = get_error_handler(should_transcode, UnknownFormat, strategy=error)
 
   if not should_transcode_handled(device, video, subtitle):
@@ -66,6 +86,14 @@ def _get_command(
     return False
 
   formats = device.transcode_to(video)
+
+  try:
+    formats = preflight(device, video, formats)
+
+  except PreflightError as e:
+    show_preflight_error(video, e)
+    return True
+
   stream, _ = get_stream(video, formats, threads, replace)
 
   cmd = get_ffmpeg_cmd(stream, video.path)
@@ -74,6 +102,31 @@ def _get_command(
   return True
 
 
+def _write_graph(
+  name: str,
+  paths: Iterable[Path],
+  fmt: GraphFormat,
+  threads: int = DEFAULT_THREADS,
+  error: Strategy = Strategy.quit,
+  subtitle: Path | None = None,
+) -> Rc:
+  """Write a job graph for the videos to stdout"""
+  if not (device := _get_device_from_name(name)):
+    raise Exit(Rc.no_matching_device)
+
+  steps = run(get_steps(device, *gen_video_paths(*paths), threads=threads, subtitle=subtitle, strategy=error))
+
+  try:
+    graph = get_graph(steps, fmt)
+
+  except GraphError as e:
+    print(f'[b red][❌] {escape(str(e))}', file=sys.stderr)
+    raise Exit(Rc.err) from e
+
+  sys.stdout.write(graph)
+  return Rc.must_convert if steps else Rc.ok
+
+
 def _inspect(
   name: str,
   path: Path,
@@ -85,6 +138,10 @@ def _inspect(
   if not (device := _get_device_from_name(name)):
     raise Exit(Rc.no_matching_device)
 
+  if formats := get_rename(device, video):
+    show_rename(video, formats, device)
+    return True
+
   should_transcode_handled = get_error_handler(should_transcode, UnknownFormat, strategy=error)
 
   if not should_transcode_handled(device, video, subtitle):
@@ -102,25 +159,75 @@ def _inspect(
 
   formats = device.transcode_to(video)
 
+  try:
+    formats = preflight(device, video, formats)
+
+  except PreflightError as e:
+    show_preflight_error(video, e)
+    return True
+
   tabs('[b green]To:', out=True)
   tabs(formats.text, out=True, tick=True)
 
+  job = Job(path, device, video, formats)
+  tabs(f'[b]{job.action}[/], estimated cost [b blue]{get_job_cost(job):.1f}[/] core-seconds', out=True, tick=True)
+
   return True
 
 
+def show_preflight_error(video: Video, error: PreflightError):
+  print(f'[b red][🛑] Converting [b blue]"{esc(video.path)}"[/] would fail: {escape(str(error))}')
+
+
+def show_rename(video: Video, formats: RenameFormats, device: Device):
+  path = get_rename_path(video, formats)
+  cost = estimate_cost(Action.rename, video)
+
+  print(
+    f'[b yellow][📛] Only the extension of [b blue]"{esc(video.path)}"[/] '
+    f'is wrong to play on [yellow]{device.name}[/]...[/]'
+  )
+  tabs(video.formats.text, out=True, tick=True)
+
+  tabs('[b green]Rename to:', out=True)
+  text = f'[b blue]{esc(path.name)}[/] ([b]{Action.rename}[/], cost [b blue]{cost:.1f}[/], no re-encoding)'
+  tabs(text, out=True, tick=True)
+
+
 def _get_device_from_name(
   name: str,
   device_file: Path = DEVICE_INFO,
 ) -> Device | None:
   devices = get_devices_from_file(device_file)
+  found = list[Device]()
+
+  for part in split_names(name):
+    if not (dev := get_device_fuzzy(part.casefold(), devices)):
+      print(f'[b red][❌] Device name [yellow]"{part}"[/] not found[/], please use one of these:')
+      show_devices(devices)
+
+      return None
+
+    found.append(dev)
 
-  if not (dev := get_device_fuzzy(name, devices)):
-    print(f'[b red][❌] Device name [yellow]"{name}"[/] not found[/], please use one of these:')
-    show_devices(devices)
+  if len(found) == 1:
+    return dev
 
+  try:
+    return get_common_device(found)
+
+  except DeviceError as e:
+    print(f'[b red][❌] {e}')
     return None
 
-  return dev
+
+def check_devices(name: str, each: bool = False) -> None | NoReturn:
+  """Exit before any job starts if the named devices aren't found, or have no formats in common"""
+  names = split_names(name) if each else [name]
+
+  for part in names:
+    if not _get_device_from_name(part):
+      raise Exit(Rc.no_matching_device)
 
 
 def gen_paths(*paths: Path) -> Iterable[Path]:
@@ -156,3 +263,127 @@ def inspect_directory(name: str, path: Path, error: Strategy) -> Rc | None:
       rc = Rc.must_convert
 
   return rc
+
+
+def gen_faststart_paths(*paths: Path) -> Iterable[Path]:
+  for path in paths:
+    if not path.is_dir():
+      yield path
+      continue
+
+    for file in path.glob(GLOB_FILES_RECURSIVE):
+      if file.suffix.lower() in FASTSTART_EXTENSIONS:
+        yield file
+
+
+def gen_video_paths(*paths: Path) -> Iterable[Path]:
+  for path in paths:
+    if not path.is_dir():
+      yield path
+      continue
+
+    for file in path.glob(GLOB_FILES_RECURSIVE):
+      if is_video(file):
+        yield file
+
+
+def _faststart(path: Path) -> bool:
+  try:
+    moved = faststart(path)
+
+  except (FormatError, OSError) as e:
+    print(f'[b red][❌] Can\'t faststart [b blue]"{esc(path)}"[/]: {escape(str(e))}')
+    return False
+
+  if moved:
+    print(f'[green][🏁] Moved moov atom to the front of [b blue]"{esc(path)}"[/].')
+
+  else:
+    print(f'[green][✅] [b blue]"{esc(path)}"[/] is already faststart.')
+
+  return True
+
+
+def show_benchmark(results: list[BenchmarkResult]):
+  for result in results:
+    label = 'Pinned' if result.pinned else 'Unpinned'
+    text = f'[b]{label}[/]: [b blue]{result.fps:.1f}[/] fps ({result.frames:.0f} frames in {result.wall:.1f}s)'
+    tabs(text, out=True, tick=True)
+
+  match results:
+    case [unpinned, pinned] if unpinned.fps:
+      change = pinned.fps / unpinned.fps - 1
+      print(f'[b]Pinning changed aggregate throughput by [blue]{change:+.1%}[/].')
+
+
+def load_plan(path: Path) -> Plan | NoReturn:
+  try:
+    return Plan.load(path)
+
+  except PlanError as e:
+    print(f'[b red][❌] {escape(str(e))}')
+    raise Exit(Rc.err) from e
+
+
+def get_hours(seconds: float) -> str:
+  return str(timedelta(seconds=round(seconds)))
+
+
+def show_summary(action: Action, summary: Summary):
+  count, duration, cost, size = summary
+  text = f'[b]{action}[/]: [b blue]{count}[/] videos, {get_hours(duration)} of video'
+
+  if cost:
+    text += f', [b blue]{cost / SECONDS_PER_HOUR:.2f}[/] CPU-hours'
+
+  if size:
+    text += f', writes [b blue]{decimal(size)}[/]'
+
+  tabs(text, out=True, tick=True)
+
+
+def show_plan(plan: Plan, jobs: int = DEFAULT_JOBS, threads: int = DEFAULT_THREADS):
+  print(f'[b]Plan for [blue]{len(plan.entries)}[/] videos on [yellow]{esc(plan.name)}[/]:')
+
+  for action, summary in plan.summaries.items():
+    show_summary(action, summary)
+
+  for entry in plan.rejected:
+    tabs(f'[b red]{esc(str(entry.path))}[/]: {esc(entry.error or "")}', tabs=2, out=True, tick=True)
+
+  total = plan.total
+  wall = estimate_wall_time((entry.cost for entry in plan.pending), jobs, threads)
+
+  print(
+    f'[b]Converting [blue]{total.count}[/] videos takes about [blue]{total.cost / SECONDS_PER_HOUR:.2f}[/] CPU-hours, '
+    f'[blue]{get_hours(wall)}[/] with {jobs} jobs of {threads} threads, and writes [blue]{decimal(total.size)}[/].'
+  )
+
+  if verify := estimate_verify_time(plan.pending):
+    print(f'[b]Verifying the outputs takes about [blue]{get_hours(verify)}[/] more, spread over the jobs.')
+
+
+def show_calibration(calibration: Calibration):
+  encoders = dict.fromkeys(sample.encoder for sample in calibration.samples)
+
+  for encoder in encoders:
+    tabs(f'[b]{encoder}', out=True, tick=True)
+    samples = sorted(sample for sample in calibration.samples if sample.encoder == encoder)
+
+    for sample in samples:
+      kind = 'downscaled to' if sample.scale else 'at'
+      text = (
+        f'{kind} {sample.megapixels:.1f} Mpx with {sample.threads} threads: '
+        f'[b blue]{sample.rate:.2f}[/] Mpx/s per thread'
+      )
+      tabs(text, tabs=2, out=True, tick=True)
+
+
+def show_encoder_stats(stats: list[EncoderStats]):
+  for stat in stats:
+    tabs(
+      f'[b]{stat.encoder or "copy"}[/] ({stat.action}): [b blue]{stat.realtime:.2f}x[/] realtime '
+      f'over {stat.jobs} jobs, {stat.threads:.1f} threads, {stat.cpu_per_second:.2f} core-seconds per second of video',
+      out=True,
+      tick=True,
+    )
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
 import logging
+import os
 import sys
 from collections.abc import Iterable
 from functools import wraps
 from multiprocessing import cpu_count
+from pathlib import Path
 from typing import (Final, TYPE_CHECKING)
 
 from rich import print
@@ -12,6 +14,7 @@ from rich.logging import RichHandler
 from thefuzz import process
 from typer import Exit
 
+from .. import NAME
 from .enums import LogLevel, Rc, Strategy
 from .exceptions import UnknownFormat
 from .types import Decoratable, Decorated, Decorator, Item
@@ -42,10 +45,15 @@ MIN_FUZZY_MATCH_SCORE: Final[int] = 30
 
 FILESIZE_CHECK_WAIT: Final[float] = 2.0
 NO_SIZE: Final[int] = -1
+MS_PER_SECOND: Final[int] = 1_000
+BITS_PER_BYTE: Final[int] = 8
 
 CODEC_BIAS: Final[int] = 5
 INCREMENT: Final[int] = 1
 
+XDG_CACHE_HOME: Final[str] = 'XDG_CACHE_HOME'
+CACHE_DIR: Final[Path] = Path(os.environ.get(XDG_CACHE_HOME) or Path.home() / '.cache') / NAME
+
 
 DEFAULT_LOG_LEVEL: Final[LogLevel] = LogLevel.warn
 
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import logging
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Final
+
+
+log = logging.getLogger(__name__)
+
+NODE_DIR: Final[Path] = Path('/sys/devices/system/node')
+NODE_GLOB: Final[str] = 'node[0-9]*'
+CPULIST: Final[str] = 'cpulist'
+
+LIST_SEP: Final[str] = ','
+RANGE_SEP: Final[str] = '-'
+
+
+type Cpus = frozenset[int]
+Nodes = list[Cpus]
+
+
+def parse_cpulist(text: str) -> Cpus:
+  cpus = set[int]()
+
+  for part in text.strip().split(LIST_SEP):
+    match part.split(RANGE_SEP):
+      case ['']:
+        continue
+
+      case [cpu]:
+        cpus.add(int(cpu))
+
+      case [start, end]:
+        cpus.update(range(int(start), int(end) + 1))
+
+  return frozenset(cpus)
+
+
+def get_usable_cpus() -> Cpus:
+  try:
+    return frozenset(os.sched_getaffinity(0))
+
+  except AttributeError:
+    return frozenset(range(os.cpu_count() or 1))
+
+
+def get_numa_nodes(node_dir: Path = NODE_DIR) -> Nodes:
+  usable = get_usable_cpus()
+  nodes = Nodes()
+
+  for path in sorted(node_dir.glob(NODE_GLOB)):
+    try:
+      cpus = parse_cpulist((path / CPULIST).read_text())
+
+    except (OSError, ValueError) as e:
+      log.debug(f"[{e}] Can't read CPUs for NUMA node {path.name}")
+      continue
+
+    if cpus := cpus & usable:
+      nodes.append(cpus)
+
+  return nodes or [usable]
+
+
+@dataclass
+class CorePool:
+  """Hands out disjoint, NUMA-local where possible, sets of cores"""
+  nodes: Nodes = field(default_factory=get_numa_nodes)
+  used: set[int] = field(default_factory=set)
+
+  @property
+  def free(self) -> int:
+    return sum(len(node - self.used) for node in self.nodes)
+
+  def get_free(self, node: Cpus) -> list[int]:
+    return sorted(node - self.used)
+
+  def allocate(self, count: int) -> Cpus | None:
+    if count > self.free or count < 1:
+      return None
+
+    by_free = sorted(self.nodes, key=lambda node: len(node - self.used), reverse=True)
+    fits = [node for node in by_free if len(node - self.used) >= count]
+
+    if fits:
+      # smallest node that fits keeps bigger nodes free for bigger jobs
+      *_, node = fits
+      cpus = frozenset(self.get_free(node)[:count])
+
+    else:
+      cpus = set[int]()
+
+      for node in by_free:
+        cpus.update(self.get_free(node)[:count - len(cpus)])
+
+      cpus = frozenset(cpus)
+
+    self.used |= cpus
+    log.debug(f'Allocated cores {sorted(cpus)}')
+
+    return cpus
+
+  def release(self, cpus: Cpus | None):
+    if cpus:
+      self.used -= cpus
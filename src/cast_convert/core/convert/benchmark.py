@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import logging
+from asyncio import TaskGroup, to_thread
+from dataclasses import replace
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import monotonic
+from typing import Final, NamedTuple
+
+import ffmpeg
+from ffmpeg.nodes import OutputStream
+
+from .calibration import Calibration, Sample, get_calibration, get_calibration_path
+from .cost import PIXELS_PER_MEGAPIXEL, get_frames
+from .encoders import get_available, get_capabilities
+from .jobs import Job
+from .process import Process
+from .run import FfmpegOpt, FfmpegVal, PROBE_JOBS, SCALE_RESOLUTION, get_hwupload, needs_hwupload, plan_job, \
+  start_transcode
+from .schedule import Scheduler
+from .settings import DEFAULT_SETTINGS, Settings
+from .verify import NULL_FORMAT, NULL_OUTPUT
+from ..base import CACHE_DIR, DEFAULT_THREADS, get_error_handler
+from ..enums import Priority, Strategy
+from ..exceptions import TranscodeError, UnknownFormat
+from ..parse import Alias, Aliases, VIDEO_ENCODERS
+from ..types import Resolution
+
+
+log = logging.getLogger(__name__)
+
+NO_FPS: Final[float] = 0.0
+PINNED: Final[tuple[bool, ...]] = (False, True)
+
+TESTSRC: Final[str] = 'testsrc2'
+LAVFI: Final[str] = 'lavfi'
+CALIBRATION_FPS: Final[int] = 30
+CALIBRATION_SECONDS: Final[float] = 2.0
+CALIBRATION_ARGS: Final[tuple[str, ...]] = ('-v', 'error')
+
+HD: Final[Resolution] = Resolution.new(1280, 720)
+FULL_HD: Final[Resolution] = Resolution.new(1920, 1080)
+UHD: Final[Resolution] = Resolution.new(3840, 2160)
+
+
+class Clip(NamedTuple):
+  """Synthetic clip to encode, downscaled when the output is smaller than the source"""
+  source: Resolution
+  output: Resolution
+
+  @property
+  def scale(self) -> bool:
+    return self.output != self.source
+
+  @property
+  def megapixels(self) -> float:
+    return int(self.output.width) * int(self.output.height) / PIXELS_PER_MEGAPIXEL
+
+
+CALIBRATION_CLIPS: Final[tuple[Clip, ...]] = (
+  Clip(HD, HD),
+  Clip(FULL_HD, FULL_HD),
+  Clip(UHD, UHD),
+  Clip(FULL_HD, HD),
+  Clip(UHD, FULL_HD),
+)
+
+
+class BenchmarkResult(NamedTuple):
+  pinned: bool
+  frames: float
+  wall: float
+
+  @property
+  def fps(self) -> float:
+    return self.frames / self.wall if self.wall else NO_FPS
+
+
+def encode_and_discard(job: Job, settings: Settings, scratch: Path):
+  process, output = start_transcode(
+    job.video,
+    job.formats,
+    job.threads,
+    False,
+    settings.subtitle,
+    scratch,
+    settings.priority,
+    job.cpus,
+  )
+
+  try:
+    process.wait()
+
+  finally:
+    output.unlink(missing_ok=True)
+
+
+async def run_batch(jobs: list[Job], settings: Settings, scratch: Path) -> BenchmarkResult:
+  scheduler = Scheduler(settings)
+  started = monotonic()
+
+  async with TaskGroup() as tg:
+    for job in jobs:
+      job = replace(job, cpus=None, process=None)
+      tg.create_task(scheduler.run(job, encode_and_discard, settings, scratch))
+
+  wall = monotonic() - started
+  frames = sum(get_frames(job.video) for job in jobs)
+  result = BenchmarkResult(settings.pin, frames, wall)
+
+  log.info(f'Benchmark {result.pinned=}: {frames:.0f} frames in {wall:.1f}s, {result.fps:.1f} fps')
+  return result
+
+
+async def plan_jobs(name: str, *paths: Path, settings: Settings = DEFAULT_SETTINGS) -> list[Job]:
+  jobs = list[Job]()
+  handled_planner = get_error_handler(plan_job, UnknownFormat, strategy=Strategy.skip)
+
+  for start in range(0, len(paths), PROBE_JOBS):
+    batch = paths[start:start + PROBE_JOBS]
+
+    async with TaskGroup() as tg:
+      tasks = [tg.create_task(to_thread(handled_planner, name, path, settings.subtitle)) for path in batch]
+
+    jobs.extend(job for task in tasks if (job := task.result()))
+
+  return jobs
+
+
+async def benchmark(
+  name: str,
+  *paths: Path,
+  settings: Settings = DEFAULT_SETTINGS,
+) -> list[BenchmarkResult]:
+  if not (jobs := await plan_jobs(name, *paths, settings=settings)):
+    return []
+
+  results = list[BenchmarkResult]()
+
+  with TemporaryDirectory(dir=settings.scratch) as scratch:
+    for pinned in PINNED:
+      batch_settings = replace(settings, pin=pinned, replace=False)
+      results.append(await run_batch(jobs, batch_settings, Path(scratch)))
+
+  return results
+
+
+def get_thread_counts(cores: int = DEFAULT_THREADS) -> list[int]:
+  return sorted({1, max(cores // 2, 1), cores})
+
+
+def get_calibration_encoders() -> Aliases:
+  """Video encoders from the support file that this host can use"""
+  return [encoder for encoders in VIDEO_ENCODERS.values() for encoder in get_available(encoders)]
+
+
+def get_calibration_stream(encoder: Alias, clip: Clip, threads: int) -> OutputStream:
+  width, height = clip.source
+  opts = {FfmpegOpt.vcodec: encoder, FfmpegOpt.threads: threads}
+  input_opts = {FfmpegOpt.vaapi_device: FfmpegVal.vaapi_device} if needs_hwupload(opts) else {}
+
+  source = f'{TESTSRC}=size={width}x{height}:rate={CALIBRATION_FPS}:duration={CALIBRATION_SECONDS}'
+  stream = ffmpeg.input(source, f=LAVFI, **input_opts)
+
+  if clip.scale:
+    stream = stream.filter(FfmpegOpt.scale, SCALE_RESOLUTION, clip.output.height)
+
+  if needs_hwupload(opts):
+    stream = get_hwupload(stream)
+
+  return (
+    stream
+    .output(NULL_OUTPUT, f=NULL_FORMAT, **opts)
+    .global_args(*CALIBRATION_ARGS)
+  )
+
+
+def time_encoder(encoder: Alias, clip: Clip, threads: int, priority: Priority = Priority.normal) -> Sample | None:
+  process = Process(get_calibration_stream(encoder, clip, threads).compile(), priority)
+
+  try:
+    process.run()
+
+  except TranscodeError as e:
+    log.warning(f"[{e}] Can't calibrate {encoder} at {clip.output}, skipping.")
+    return None
+
+  frames = CALIBRATION_FPS * CALIBRATION_SECONDS
+  rate = frames * clip.megapixels / process.elapsed / threads if process.elapsed else NO_FPS
+  sample = Sample(encoder, threads, clip.megapixels, clip.scale, rate)
+
+  log.info(
+    f'Calibrated {encoder} from {clip.source} to {clip.output} with {threads} threads: {rate:.2f} Mpx/s per thread'
+  )
+  return sample
+
+
+def calibrate(
+  encoders: Aliases | None = None,
+  threads: list[int] | None = None,
+  priority: Priority = Priority.normal,
+  cache_dir: Path = CACHE_DIR,
+) -> Calibration:
+  """Time encoding synthetic clips, and save the speeds for estimating job costs on this host"""
+  samples = [
+    sample
+    for encoder in encoders or get_calibration_encoders()
+    for count in threads or get_thread_counts()
+    for clip in CALIBRATION_CLIPS
+    if (sample := time_encoder(encoder, clip, count, priority))
+  ]
+
+  capabilities = get_capabilities()
+  calibration = Calibration(capabilities.version if capabilities else '', samples)
+
+  if path := get_calibration_path(cache_dir):
+    calibration.save(path)
+    get_calibration.cache_clear()
+
+  return calibration
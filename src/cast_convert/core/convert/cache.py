@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import fcntl
+import logging
+import os
+import socket
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from hashlib import blake2b
+from pathlib import Path
+from typing import Final
+
+from .storage import PARTIAL_PREFIX, PARTIAL_SUFFIX, clone
+from ..base import NEW_LINE
+
+
+log = logging.getLogger(__name__)
+
+BYTES_PER_GB: Final[int] = 1024 ** 3
+DEFAULT_CACHE_SIZE: Final[int] = 100 * BYTES_PER_GB
+LOCK_FILENAME: Final[str] = '.lock'
+
+# hash the size and a few chunks instead of whole videos
+HASH_CHUNK: Final[int] = 1024 ** 2
+HASH_DIGEST_SIZE: Final[int] = 16
+
+
+def get_content_digest(path: Path) -> str:
+  """Fast content hash of the size, start, middle and end of the file"""
+  size = path.stat().st_size
+  digest = blake2b(str(size).encode(), digest_size=HASH_DIGEST_SIZE)
+  offsets = sorted({0, max(size // 2 - HASH_CHUNK // 2, 0), max(size - HASH_CHUNK, 0)})
+
+  with path.open('rb') as file:
+    for offset in offsets:
+      file.seek(offset)
+      digest.update(file.read(HASH_CHUNK))
+
+  return digest.hexdigest()
+
+
+def get_key(*parts: str) -> str:
+  return blake2b(NEW_LINE.join(parts).encode(), digest_size=HASH_DIGEST_SIZE).hexdigest()
+
+
+@dataclass(frozen=True)
+class OutputCache:
+  """Content-addressed store of converted videos, that hosts sharing its filesystem can use together"""
+  path: Path
+  max_size: int = DEFAULT_CACHE_SIZE
+
+  @contextmanager
+  def locked(self) -> Iterator[None]:
+    """POSIX locks are held across hosts on network filesystems that support them"""
+    self.path.mkdir(parents=True, exist_ok=True)
+
+    with (self.path / LOCK_FILENAME).open('a') as lock:
+      fcntl.lockf(lock, fcntl.LOCK_EX)
+
+      try:
+        yield
+
+      finally:
+        fcntl.lockf(lock, fcntl.LOCK_UN)
+
+  def get_entry_path(self, key: str, suffix: str) -> Path:
+    return self.path / f'{key}{suffix}'
+
+  def fetch(self, key: str, dst: Path) -> Path | None:
+    """Clone the cached output to `dst`, or return None if it isn't cached"""
+    entry = self.get_entry_path(key, dst.suffix)
+
+    try:
+      with self.locked():
+        if not entry.exists():
+          return None
+
+        # entries are never written after they're stored, so the modification time marks their last use
+        os.utime(entry)
+        clone(entry, dst)
+
+    except OSError as e:
+      log.warning(f"[{e}] Can't fetch {entry} from the output cache")
+      return None
+
+    log.info(f'Using cached output {entry} for {dst}')
+    return dst
+
+  def store(self, key: str, src: Path):
+    entry = self.get_entry_path(key, src.suffix)
+    partial = entry.with_name(f'{PARTIAL_PREFIX}{entry.name}-{socket.gethostname()}-{os.getpid()}{PARTIAL_SUFFIX}')
+
+    try:
+      # clone outside the lock, copying can be slow
+      self.path.mkdir(parents=True, exist_ok=True)
+      clone(src, partial)
+
+      with self.locked():
+        partial.replace(entry)
+        self.evict()
+
+    except OSError as e:
+      log.warning(f"[{e}] Can't store {src} in the output cache")
+      partial.unlink(missing_ok=True)
+      return
+
+    log.debug(f'Cached {src} as {entry}')
+
+  def evict(self):
+    """Remove the least recently used outputs until the cache fits, call while locked"""
+    entries = [
+      (path, path.stat())
+      for path in self.path.iterdir()
+      if not path.name.startswith(PARTIAL_PREFIX) and path.is_file()
+    ]
+
+    total = sum(stat.st_size for _, stat in entries)
+
+    for path, stat in sorted(entries, key=lambda entry: entry[1].st_mtime):
+      if total <= self.max_size:
+        break
+
+      log.info(f'Evicting {path} from the output cache')
+      path.unlink(missing_ok=True)
+      total -= stat.st_size
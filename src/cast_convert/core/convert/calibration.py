@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import json
+import logging
+import shutil
+from dataclasses import dataclass, field
+from functools import cache
+from pathlib import Path
+from statistics import fmean
+from time import time
+from typing import Final, NamedTuple, Self
+
+from .encoders import FFMPEG, get_cache_path, get_capabilities
+from ..base import CACHE_DIR
+from ..parse import Alias
+
+
+log = logging.getLogger(__name__)
+
+CALIBRATION_PREFIX: Final[str] = 'calibration-'
+NO_TIME: Final[float] = 0.0
+JSON_INDENT: Final[int] = 2
+
+
+class Sample(NamedTuple):
+  """Measured speed of an encoder"""
+  encoder: Alias
+  threads: int
+  megapixels: float  # of each output frame
+  scale: bool  # downscaled from a bigger source
+  rate: float  # frames per second times megapixels, per thread
+
+
+@dataclass
+class Calibration:
+  """Encoder speeds measured on this host"""
+  version: str = ''
+  samples: list[Sample] = field(default_factory=list)
+  time: float = field(default_factory=time)
+
+  def get_rate(self, encoder: Alias, threads: int, scale: bool = False) -> float | None:
+    """Mean rate at the nearest calibrated thread count, or None if the encoder wasn't calibrated"""
+    samples = [
+      sample
+      for sample in self.samples
+      if sample.encoder == encoder and sample.scale == scale and sample.rate
+    ]
+
+    if not samples:
+      return None
+
+    nearest = min(samples, key=lambda sample: abs(sample.threads - threads)).threads
+    return fmean(sample.rate for sample in samples if sample.threads == nearest)
+
+  def save(self, path: Path):
+    data = {
+      'version': self.version,
+      'time': self.time,
+      'samples': [sample._asdict() for sample in self.samples],
+    }
+
+    try:
+      path.parent.mkdir(parents=True, exist_ok=True)
+      path.write_text(json.dumps(data, indent=JSON_INDENT))
+
+    except OSError as e:
+      log.warning(f"[{e}] Can't save calibration to {path}")
+      return
+
+    log.info(f'Saved {len(self.samples)} calibration samples to {path}')
+
+  @classmethod
+  def load(cls: type[Self], path: Path) -> Self | None:
+    try:
+      data = json.loads(path.read_text())
+      samples = [Sample(**sample) for sample in data['samples']]
+
+    except (OSError, ValueError, KeyError, TypeError) as e:
+      log.debug(f"[{e}] Can't load calibration from {path}")
+      return None
+
+    return cls(data.get('version', ''), samples, data.get('time', NO_TIME))
+
+
+def get_calibration_path(cache_dir: Path = CACHE_DIR) -> Path | None:
+  """Calibration file for this host and FFmpeg build, or None if FFmpeg can't be run"""
+  if not (capabilities := get_capabilities()) or not (resolved := shutil.which(FFMPEG)):
+    return None
+
+  return get_cache_path(Path(resolved), capabilities.version, cache_dir, CALIBRATION_PREFIX)
+
+
+@cache
+def get_calibration(cache_dir: Path = CACHE_DIR) -> Calibration | None:
+  """Speeds measured by the calibrate command, or None if this host wasn't calibrated"""
+  if not (path := get_calibration_path(cache_dir)):
+    return None
+
+  return Calibration.load(path)
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+from tempfile import gettempdir
+from typing import Final
+
+from .jobs import Action, Job
+from ..exceptions import VerifyError
+from ..model.video import Video
+
+
+log = logging.getLogger(__name__)
+
+CANARY_SECONDS: Final[float] = 10.0
+CANARY_SUFFIX: Final[str] = '_canary'
+
+# sources barely longer than the slice aren't worth encoding twice
+MIN_CANARY_DURATION: Final[float] = 3 * CANARY_SECONDS
+
+# re-encodes expensive enough to fail fast on, copy-only jobs finish as quickly as a canary would
+CANARY_ACTIONS: Final[frozenset[Action]] = frozenset({Action.audio, Action.video, Action.scale})
+
+
+def needs_canary(job: Job) -> bool:
+  return job.action in CANARY_ACTIONS and job.video.duration > MIN_CANARY_DURATION
+
+
+def get_canary_dir(scratch: Path | None = None) -> Path:
+  return scratch or Path(gettempdir())
+
+
+def check_canary(job: Job, path: Path, elapsed: float) -> float | None:
+  """Verify the slice plays on the device, returns its realtime speed"""
+  try:
+    canary = Video.from_path(path)
+
+  finally:
+    path.unlink(missing_ok=True)
+
+  if not (duration := canary.duration):
+    raise VerifyError(f'Canary encode of {job.path} is empty')
+
+  if not job.device.can_play(canary):
+    raise VerifyError(f"Canary encode of {job.path} can't be played on {job.device.name}")
+
+  job.realtime = duration / elapsed if elapsed else None
+
+  if job.realtime:
+    log.info(
+      f'Canary encode of {job.path} ran at {job.realtime:.2f}x realtime, '
+      f'the full encode should take about {job.video.duration / job.realtime:.0f}s'
+    )
+
+  return job.realtime
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import logging
+from typing import Final, TYPE_CHECKING
+
+from .calibration import get_calibration
+from .encoders import get_available
+from .stats import get_history
+from .storage import estimate_output_size
+from ..base import DEFAULT_THREADS, first
+from ..enums import Action
+from ..media.formats import Formats
+from ..media.profiles import VideoProfile
+from ..model.video import Video
+from ..parse import Alias, VIDEO_ENCODERS
+from ..types import DEFAULT_PROFILE_FPS, Fps, Resolution
+
+
+if TYPE_CHECKING:
+  from .jobs import Job
+
+
+log = logging.getLogger(__name__)
+
+PIXELS_PER_MEGAPIXEL: Final[int] = 1_000_000
+NO_COST: Final[float] = 0.0
+NO_BYTES: Final[int] = 0
+
+
+type Cost = float  # core-seconds
+
+
+# core-seconds per second of source, per megapixel for pixel bound actions
+ACTION_COSTS: Final[dict[Action, Cost]] = {
+  Action.skip: NO_COST,
+  Action.reject: NO_COST,
+  Action.rename: NO_COST,
+  Action.faststart: 0.002,
+  Action.sidecar: 0.002,
+  Action.copy: 0.005,
+  Action.fixup: 0.005,
+  Action.audio: 0.02,
+  Action.video: 2.0,
+  Action.scale: 2.5,
+}
+
+PIXEL_BOUND: Final[frozenset[Action]] = frozenset({Action.video, Action.scale})
+
+# renamed in place, or only subtitles extracted
+NO_OUTPUT: Final[frozenset[Action]] = frozenset({Action.skip, Action.reject, Action.rename, Action.sidecar})
+
+
+def get_megapixels(video: Video, resolution: Resolution | None = None) -> float:
+  """Megapixels of the output, which is never bigger than the source"""
+  if not (profile := video.formats.video_profile) or not (source := profile.resolution):
+    return NO_COST
+
+  megapixels = int(source.width) * int(source.height) / PIXELS_PER_MEGAPIXEL
+
+  if resolution:
+    megapixels = min(int(resolution.width) * int(resolution.height) / PIXELS_PER_MEGAPIXEL, megapixels)
+
+  return megapixels
+
+
+def get_fps_ratio(video: Video, fps: Fps | None = None) -> float:
+  """Fraction of the source's frames the output keeps"""
+  if not fps or not (profile := video.formats.video_profile) or not profile.fps or profile.fps <= 0:
+    return 1.0
+
+  return min(float(fps) / float(profile.fps), 1.0)
+
+
+def get_frames(video: Video) -> float:
+  fps = DEFAULT_PROFILE_FPS
+
+  if (profile := video.formats.video_profile) and profile.fps and profile.fps > 0:
+    fps = profile.fps
+
+  return float(fps) * video.duration
+
+
+def estimate_cost(
+  action: Action,
+  video: Video,
+  resolution: Resolution | None = None,
+  fps: Fps | None = None,
+) -> Cost:
+  rate = ACTION_COSTS[action]
+
+  if action in PIXEL_BOUND:
+    rate *= get_megapixels(video, resolution) * get_fps_ratio(video, fps)
+
+  return rate * video.duration
+
+
+def get_profile_action(profile: VideoProfile | None) -> Action:
+  """Action needed to convert to a transcoded profile, whose attributes are None when they already match"""
+  if not profile:
+    return Action.copy
+
+  if profile.resolution:
+    return Action.scale
+
+  if profile.codec or profile.fps or profile.level:
+    return Action.video
+
+  return Action.copy
+
+
+def get_video_encoder(video: Video, profile: VideoProfile) -> Alias | None:
+  """Encoder the runner would pick for the profile, whose codec is None when it matches the source's"""
+  codec = profile.codec or ((source := video.formats.video_profile) and source.codec)
+
+  if not codec or not (encoders := VIDEO_ENCODERS.get(codec)):
+    return None
+
+  return first(get_available(encoders) or encoders)
+
+
+def get_work(action: Action, video: Video, profile: VideoProfile | None = None) -> float:
+  """Megapixel-frames of the output for pixel bound actions, otherwise seconds of source"""
+  if action not in PIXEL_BOUND or not profile:
+    return video.duration
+
+  return get_megapixels(video, profile.resolution) * get_frames(video) * get_fps_ratio(video, profile.fps)
+
+
+def estimate_calibrated_cost(
+  action: Action,
+  video: Video,
+  profile: VideoProfile,
+  threads: int = DEFAULT_THREADS,
+) -> Cost | None:
+  """Cost from the speeds measured by the calibrate command, or None if the encoder wasn't calibrated"""
+  if action not in PIXEL_BOUND or not (calibration := get_calibration()):
+    return None
+
+  if not (encoder := get_video_encoder(video, profile)):
+    return None
+
+  if not (rate := calibration.get_rate(encoder, threads, action is Action.scale)):
+    return None
+
+  return get_work(action, video, profile) / rate
+
+
+def estimate_learned_cost(action: Action, video: Video, profile: VideoProfile | None = None) -> Cost | None:
+  """Cost fitted from this host's finished jobs, or None if there aren't enough of them"""
+  if not (history := get_history()):
+    return None
+
+  encoder = get_video_encoder(video, profile) if profile and action in PIXEL_BOUND else None
+
+  if (cost := history.get_cost(action, encoder)) is None:
+    return None
+
+  return cost * get_work(action, video, profile)
+
+
+def estimate_video_cost(action: Action, video: Video, profile: VideoProfile, threads: int = DEFAULT_THREADS) -> Cost:
+  if (cost := estimate_learned_cost(action, video, profile)) is not None:
+    return cost
+
+  if (cost := estimate_calibrated_cost(action, video, profile, threads)) is not None:
+    return cost
+
+  return estimate_cost(action, video, profile.resolution, profile.fps)
+
+
+def estimate_profile_cost(video: Video, profile: VideoProfile, threads: int = DEFAULT_THREADS) -> Cost:
+  return estimate_video_cost(get_profile_action(profile), video, profile, threads)
+
+
+def estimate_plan_cost(
+  action: Action,
+  video: Video,
+  formats: Formats | None = None,
+  threads: int = DEFAULT_THREADS,
+) -> Cost:
+  if formats and (profile := formats.video_profile):
+    return estimate_video_cost(action, video, profile, threads)
+
+  if (cost := estimate_learned_cost(action, video)) is not None:
+    return cost
+
+  return estimate_cost(action, video)
+
+
+def get_job_cost(job: Job) -> Cost:
+  if job.realtime:
+    return job.video.duration / job.realtime * job.threads
+
+  if job.targets:
+    return sum(estimate_plan_cost(target.action, job.video, target.formats, job.threads) for target in job.targets)
+
+  return estimate_plan_cost(job.action, job.video, job.formats, job.threads)
+
+
+def get_job_duration(job: Job) -> float:
+  """Predicted wall time in seconds, with the job's threads"""
+  return get_job_cost(job) / max(job.threads, 1)
+
+
+def estimate_size(
+  action: Action,
+  video: Video,
+  resolution: Resolution | None = None,
+  fps: Fps | None = None,
+) -> int:
+  """Bytes written, assuming re-encodes keep the source's bits per pixel"""
+  if action in NO_OUTPUT:
+    return NO_BYTES
+
+  size = estimate_output_size(video)
+
+  if action in PIXEL_BOUND and (megapixels := get_megapixels(video)):
+    size *= get_megapixels(video, resolution) / megapixels * get_fps_ratio(video, fps)
+
+  return int(size)
+
+
+def estimate_plan_size(action: Action, video: Video, formats: Formats | None = None) -> int:
+  if not formats or not (profile := formats.video_profile):
+    return estimate_size(action, video)
+
+  return estimate_size(action, video, profile.resolution, profile.fps)
+
+
+def get_job_size(job: Job) -> int:
+  if job.targets:
+    return sum(estimate_plan_size(target.action, job.video, target.formats) for target in job.targets)
+
+  return estimate_plan_size(job.action, job.video, job.formats)
@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import json
+import logging
+import re
+import shutil
+import socket
+from functools import cache
+from hashlib import blake2b
+from pathlib import Path
+from subprocess import CalledProcessError, TimeoutExpired, run
+from threading import Lock
+from typing import Final, NamedTuple
+
+from ..base import CACHE_DIR, NEW_LINE
+from ..parse import Alias, Aliases
+
+
+log = logging.getLogger(__name__)
+
+FFMPEG: Final[str] = 'ffmpeg'
+VERSION_ARGS: Final[tuple[str, ...]] = ('-hide_banner', '-version')
+ENCODERS_ARGS: Final[tuple[str, ...]] = ('-hide_banner', '-encoders')
+HWACCELS_ARGS: Final[tuple[str, ...]] = ('-hide_banner', '-hwaccels')
+LIST_SEP: Final[str] = ' ------'
+HWACCELS_HEADER: Final[str] = 'Hardware acceleration methods:'
+
+CAPABILITIES_PREFIX: Final[str] = 'capabilities-'
+PROBES_PREFIX: Final[str] = 'probes-'
+CAPABILITIES_SUFFIX: Final[str] = '.json'
+CACHE_DIGEST_SIZE: Final[int] = 8
+
+# capability flags, then the encoder's name, see: ffmpeg -encoders
+ENCODER_LINE: Final[re.Pattern] = re.compile(r'^\s*[VAS][A-Z.]{5}\s+(\S+)')
+
+# hardware encoders are only built in, not usable, without their hwaccel, see: ffmpeg -hwaccels
+ENCODER_HWACCELS: Final[dict[str, str]] = {
+  '_vaapi': 'vaapi',
+  '_nvenc': 'cuda',
+  '_qsv': 'qsv',
+}
+
+# builds list hardware encoders whether or not the hardware is there, so they're probed before they're used
+HARDWARE_SUFFIXES: Final[tuple[str, ...]] = (*ENCODER_HWACCELS, '_amf', '_v4l2m2m', '_videotoolbox', '_mf')
+VAAPI_SUFFIX: Final[str] = '_vaapi'
+HWACCEL_DEVICE: Final[Path] = Path('/dev/dri/renderD128')
+
+PROBE_TIMEOUT: Final[float] = 30.0  # seconds
+PROBE_SOURCE: Final[str] = 'color=size=256x256:rate=25'
+PROBE_ARGS: Final[tuple[str, ...]] = ('-hide_banner', '-v', 'error', '-nostdin')
+PROBE_INPUT_ARGS: Final[tuple[str, ...]] = ('-f', 'lavfi', '-i', PROBE_SOURCE, '-frames:v', '1')
+PROBE_OUTPUT_ARGS: Final[tuple[str, ...]] = ('-f', 'null', '-')
+VAAPI_DEVICE_ARGS: Final[tuple[str, ...]] = ('-vaapi_device', str(HWACCEL_DEVICE))
+VAAPI_UPLOAD_ARGS: Final[tuple[str, ...]] = ('-vf', 'format=nv12,hwupload')
+
+PROBES_LOCK: Final[Lock] = Lock()
+
+
+class Capabilities(NamedTuple):
+  """Encoders and hardware acceleration methods an FFmpeg build supports"""
+  version: str
+  encoders: frozenset[Alias]
+  hwaccels: frozenset[str]
+
+
+def get_output(ffmpeg: str, args: tuple[str, ...]) -> str:
+  result = run([ffmpeg, *args], capture_output=True, text=True, check=True)
+  return result.stdout
+
+
+def parse_encoders(text: str) -> frozenset[Alias]:
+  _, _, listing = text.partition(LIST_SEP)
+
+  return frozenset(
+    match.group(1)
+    for line in listing.splitlines()
+    if (match := ENCODER_LINE.match(line))
+  )
+
+
+def parse_hwaccels(text: str) -> frozenset[str]:
+  _, _, listing = text.partition(HWACCELS_HEADER)
+  return frozenset(line.strip() for line in listing.splitlines() if line.strip())
+
+
+def get_cache_path(
+  ffmpeg: Path,
+  version: str,
+  cache_dir: Path = CACHE_DIR,
+  prefix: str = CAPABILITIES_PREFIX,
+) -> Path:
+  """Cache file for this host and FFmpeg build"""
+  key = NEW_LINE.join((socket.gethostname(), str(ffmpeg), version))
+  digest = blake2b(key.encode(), digest_size=CACHE_DIGEST_SIZE).hexdigest()
+
+  return cache_dir / f'{prefix}{digest}{CAPABILITIES_SUFFIX}'
+
+
+def load_capabilities(path: Path) -> Capabilities | None:
+  try:
+    data = json.loads(path.read_text())
+
+  except (OSError, ValueError) as e:
+    log.debug(f"[{e}] Can't load FFmpeg capabilities from {path}")
+    return None
+
+  return Capabilities(data['version'], frozenset(data['encoders']), frozenset(data['hwaccels']))
+
+
+def save_capabilities(path: Path, capabilities: Capabilities):
+  data = {
+    'version': capabilities.version,
+    'encoders': sorted(capabilities.encoders),
+    'hwaccels': sorted(capabilities.hwaccels),
+  }
+
+  try:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, indent=2))
+
+  except OSError as e:
+    log.warning(f"[{e}] Can't cache FFmpeg capabilities in {path}")
+
+
+@cache
+def get_capabilities(ffmpeg: str = FFMPEG, cache_dir: Path | None = None) -> Capabilities | None:
+  """Capabilities of the FFmpeg on the PATH, cached per host and FFmpeg version, or None if it can't be run"""
+  cache_dir = cache_dir or CACHE_DIR
+
+  try:
+    if not (resolved := shutil.which(ffmpeg)):
+      raise FileNotFoundError(f'{ffmpeg} not found')
+
+    version, *_ = get_output(resolved, VERSION_ARGS).splitlines() or ['']
+    path = get_cache_path(Path(resolved), version, cache_dir)
+
+    if capabilities := load_capabilities(path):
+      return capabilities
+
+    capabilities = Capabilities(
+      version,
+      parse_encoders(get_output(resolved, ENCODERS_ARGS)),
+      parse_hwaccels(get_output(resolved, HWACCELS_ARGS)),
+    )
+
+  except (OSError, CalledProcessError) as e:
+    log.warning(f"[{e}] Can't list FFmpeg encoders, assuming they're all available.")
+    return None
+
+  log.info(f'Found {len(capabilities.encoders)} encoders and hwaccels {sorted(capabilities.hwaccels)} in {version}')
+  save_capabilities(path, capabilities)
+
+  return capabilities
+
+
+def get_encoders() -> frozenset[Alias] | None:
+  """Encoders FFmpeg was built with, or None if FFmpeg can't be run"""
+  if not (capabilities := get_capabilities()):
+    return None
+
+  return capabilities.encoders
+
+
+def get_hwaccel(encoder: Alias) -> str | None:
+  for suffix, hwaccel in ENCODER_HWACCELS.items():
+    if encoder.endswith(suffix):
+      return hwaccel
+
+  return None
+
+
+def is_hardware(encoder: Alias) -> bool:
+  return encoder.endswith(HARDWARE_SUFFIXES)
+
+
+def get_probe_args(encoder: Alias) -> list[str]:
+  """Arguments to encode one frame from lavfi with the encoder"""
+  if encoder.endswith(VAAPI_SUFFIX):
+    return [*PROBE_ARGS, *VAAPI_DEVICE_ARGS, *PROBE_INPUT_ARGS, *VAAPI_UPLOAD_ARGS, '-c:v', encoder, *PROBE_OUTPUT_ARGS]
+
+  return [*PROBE_ARGS, *PROBE_INPUT_ARGS, '-c:v', encoder, *PROBE_OUTPUT_ARGS]
+
+
+def probe_encoder(encoder: Alias, ffmpeg: str = FFMPEG) -> bool:
+  """Encode a test frame, to tell if the hardware behind the encoder is there"""
+  try:
+    result = run([ffmpeg, *get_probe_args(encoder)], capture_output=True, text=True, timeout=PROBE_TIMEOUT)
+
+  except (OSError, TimeoutExpired) as e:
+    log.info(f"[{e}] Can't probe {encoder}, not using it.")
+    return False
+
+  if result.returncode:
+    error, *_ = result.stderr.strip().splitlines()[-1:] or [f'exited with code {result.returncode}']
+    log.info(f"[{error}] {encoder} can't encode on this host, not using it.")
+    return False
+
+  log.info(f'{encoder} can encode on this host.')
+  return True
+
+
+def get_probes_path() -> Path | None:
+  if not (capabilities := get_capabilities()) or not (resolved := shutil.which(FFMPEG)):
+    return None
+
+  return get_cache_path(Path(resolved), capabilities.version, CACHE_DIR, PROBES_PREFIX)
+
+
+@cache
+def get_probes() -> dict[Alias, bool]:
+  """Results of the encoders probed on this host, cached per host and FFmpeg version"""
+  if not (path := get_probes_path()) or not path.exists():
+    return {}
+
+  try:
+    return dict(json.loads(path.read_text()))
+
+  except (OSError, ValueError, TypeError) as e:
+    log.debug(f"[{e}] Can't load encoder probes from {path}")
+    return {}
+
+
+def save_probes(probes: dict[Alias, bool]):
+  if not (path := get_probes_path()):
+    return
+
+  try:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(probes, indent=2, sort_keys=True))
+
+  except OSError as e:
+    log.warning(f"[{e}] Can't cache encoder probes in {path}")
+
+
+def is_usable(encoder: Alias) -> bool:
+  """Probe the encoder once per host and FFmpeg version"""
+  with PROBES_LOCK:
+    probes = get_probes()
+
+    if encoder not in probes:
+      probes[encoder] = probe_encoder(encoder)
+      save_probes(probes)
+
+    return probes[encoder]
+
+
+def is_available(encoder: Alias) -> bool:
+  if not (capabilities := get_capabilities()):
+    return True
+
+  if encoder not in capabilities.encoders:
+    return False
+
+  if (hwaccel := get_hwaccel(encoder)) and hwaccel not in capabilities.hwaccels:
+    return False
+
+  return not is_hardware(encoder) or is_usable(encoder)
+
+
+def get_available(encoders: Aliases) -> Aliases:
+  """Encoders in order of preference, without the ones this host can't use"""
+  return [encoder for encoder in encoders if is_available(encoder)]
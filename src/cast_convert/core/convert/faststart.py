@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import logging
+import mmap
+import os
+import struct
+from collections.abc import Iterable
+from pathlib import Path
+from typing import BinaryIO, Final, NamedTuple, TYPE_CHECKING
+
+from .storage import fsync_path, get_partial
+from .transcode import TranscodeFormats
+from ..exceptions import FormatError
+from ..media.codecs import Container
+from ..model.video import Video
+
+
+if TYPE_CHECKING:
+  from ..model.device import Device
+
+
+log = logging.getLogger(__name__)
+
+HEADER: Final[struct.Struct] = struct.Struct('>I4s')
+LARGE_SIZE: Final[struct.Struct] = struct.Struct('>Q')
+FULL_HEADER: Final[struct.Struct] = struct.Struct('>I')  # version and flags
+COUNT: Final[struct.Struct] = struct.Struct('>I')
+STCO_OFFSET: Final[struct.Struct] = struct.Struct('>I')
+CO64_OFFSET: Final[struct.Struct] = struct.Struct('>Q')
+
+HAS_LARGE_SIZE: Final[int] = 1
+TO_END: Final[int] = 0
+MAX_STCO_OFFSET: Final[int] = 0xFFFF_FFFF
+
+MOOV: Final[bytes] = b'moov'
+MDAT: Final[bytes] = b'mdat'
+MOOF: Final[bytes] = b'moof'
+CMOV: Final[bytes] = b'cmov'
+STCO: Final[bytes] = b'stco'
+CO64: Final[bytes] = b'co64'
+
+# atoms on the path from moov to the chunk offset tables
+CONTAINERS: Final[frozenset[bytes]] = frozenset({MOOV, b'trak', b'mdia', b'minf', b'stbl'})
+
+FASTSTART_CONTAINERS: Final[frozenset[Container]] = frozenset({Container.mp4})
+FASTSTART_EXTENSIONS: Final[frozenset[str]] = frozenset({'.mp4', '.m4v', '.m4a', '.mov'})
+STREAMABLE_NO: Final[str] = 'No'
+
+CHUNK_SIZE: Final[int] = 8 * 1024 * 1024
+
+
+class Atom(NamedTuple):
+  kind: bytes
+  start: int
+  size: int
+  header: int
+
+  @property
+  def end(self) -> int:
+    return self.start + self.size
+
+  @property
+  def body(self) -> int:
+    return self.start + self.header
+
+
+class FaststartFormats(TranscodeFormats):
+  """Formats fixed by moving the moov atom to the front of the file"""
+
+
+def read_atoms(data: bytes | mmap.mmap | memoryview, start: int = 0, end: int | None = None) -> Iterable[Atom]:
+  end = len(data) if end is None else end
+  position = start
+
+  while position + HEADER.size <= end:
+    size, kind = HEADER.unpack_from(data, position)
+    header = HEADER.size
+
+    if size == HAS_LARGE_SIZE:
+      size, = LARGE_SIZE.unpack_from(data, position + header)
+      header += LARGE_SIZE.size
+
+    elif size == TO_END:
+      size = end - position
+
+    if size < header or position + size > end:
+      raise FormatError(f'Malformed {kind!r} atom at {position}')
+
+    yield Atom(kind, position, size, header)
+    position += size
+
+
+def get_top_level(data: mmap.mmap) -> list[Atom]:
+  atoms = list(read_atoms(data))
+  kinds = {atom.kind for atom in atoms}
+
+  if MOOF in kinds:
+    raise FormatError('Fragmented MP4s are already streamable')
+
+  if MOOV not in kinds or MDAT not in kinds:
+    raise FormatError('Missing moov or mdat atom')
+
+  return atoms
+
+
+def is_faststart(path: Path) -> bool:
+  with path.open('rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+    kinds = [atom.kind for atom in get_top_level(data)]
+
+  return kinds.index(MOOV) < kinds.index(MDAT)
+
+
+def get_offset_tables(moov: memoryview, start: int = 0, end: int | None = None) -> Iterable[Atom]:
+  for atom in read_atoms(moov, start, end):
+    if atom.kind == CMOV:
+      raise FormatError('Compressed moov atoms are not supported')
+
+    if atom.kind in CONTAINERS:
+      yield from get_offset_tables(moov, atom.body, atom.end)
+
+    elif atom.kind in (STCO, CO64):
+      yield atom
+
+
+def shift_offsets(moov: bytearray, shift: int):
+  for table in list(get_offset_tables(memoryview(moov))):
+    position = table.body + FULL_HEADER.size
+    count, = COUNT.unpack_from(moov, position)
+    position += COUNT.size
+
+    offset = STCO_OFFSET if table.kind == STCO else CO64_OFFSET
+
+    for index in range(count):
+      at = position + index * offset.size
+      new, = offset.unpack_from(moov, at)
+      new += shift
+
+      if offset is STCO_OFFSET and new > MAX_STCO_OFFSET:
+        raise FormatError('Chunk offsets overflow stco, the file must be remuxed')
+
+      offset.pack_into(moov, at, new)
+
+
+def write_range(file: BinaryIO, data: mmap.mmap, start: int, end: int, chunk: int = CHUNK_SIZE):
+  view = memoryview(data)
+
+  try:
+    for position in range(start, end, chunk):
+      file.write(view[position:min(position + chunk, end)])
+
+  finally:
+    view.release()
+
+
+def faststart(path: Path, output: Path | None = None) -> Path | None:
+  """Move the moov atom in front of the media data, returns None if it already is"""
+  output = output or path
+  partial = get_partial(output)
+
+  with path.open('rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+    atoms = get_top_level(data)
+    kinds = [atom.kind for atom in atoms]
+
+    if (first_mdat := kinds.index(MDAT)) > kinds.index(MOOV):
+      return None
+
+    moov, *_ = (atom for atom in atoms if atom.kind == MOOV)
+    moov_data = bytearray(data[moov.start:moov.end])
+
+    # atoms before the first mdat stay in front of the moov, the rest shift back by its size
+    shift_offsets(moov_data, moov.size)
+    head = atoms[:first_mdat]
+    tail = [atom for atom in atoms[first_mdat:] if atom.kind != MOOV]
+
+    try:
+      with partial.open('wb') as out:
+        for atom in head:
+          write_range(out, data, atom.start, atom.end)
+
+        out.write(moov_data)
+
+        for atom in tail:
+          write_range(out, data, atom.start, atom.end)
+
+        out.flush()
+        os.fsync(out.fileno())
+
+    except BaseException:
+      partial.unlink(missing_ok=True)
+      raise
+
+  partial.replace(output)
+  fsync_path(output.parent)
+
+  log.info(f'Moved moov atom of {path} to the front of {output}')
+  return output
+
+
+def needs_faststart(video: Video) -> bool:
+  if video.formats.container not in FASTSTART_CONTAINERS:
+    return False
+
+  return video.general.isstreamable == STREAMABLE_NO
+
+
+def get_faststart(device: Device, video: Video) -> FaststartFormats | None:
+  """Return the container if moov placement is the only problem"""
+  if not needs_faststart(video) or not device.can_play(video):
+    return None
+
+  log.info(f'Only the moov atom of {video.path} is misplaced, planning a faststart')
+  return FaststartFormats(container=video.formats.container)
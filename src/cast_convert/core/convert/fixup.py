@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import logging
+from math import isclose
+from pathlib import Path
+from typing import Final, NamedTuple, TYPE_CHECKING
+
+from .transcode import TranscodeFormats, TranscodeVideoProfile
+from ..exceptions import VerifyError
+from ..media.codecs import Container, VideoCodec
+from ..media.formats import Formats
+from ..model.video import Video
+from ..types import DEFAULT_PROFILE_FPS, Level
+
+
+if TYPE_CHECKING:
+  from ..model.device import Device
+
+
+log = logging.getLogger(__name__)
+
+HEV1: Final[str] = 'hev1'
+HVC1: Final[str] = 'hvc1'
+TAG_CONTAINERS: Final[frozenset[Container]] = frozenset({Container.mp4})
+
+SAMPLES_PER_MACROBLOCK: Final[int] = 16 * 16
+KBPS: Final[int] = 1_000
+
+# level_idc = level * scale, see: H.264 A.3.1, H.265 A.4.1
+LEVEL_SCALES: Final[dict[VideoCodec, int]] = {
+  VideoCodec.avc: 10,
+  VideoCodec.hevc: 30,
+}
+
+BITSTREAM_FILTERS: Final[dict[VideoCodec, str]] = {
+  VideoCodec.avc: 'h264_metadata',
+  VideoCodec.hevc: 'hevc_metadata',
+}
+
+DURATION_TOLERANCE: Final[float] = 0.5  # seconds
+
+
+class LevelLimits(NamedTuple):
+  samples: int  # luma samples per frame
+  rate: int  # luma samples per second
+  bitrate: int  # bits per second
+
+
+def get_h264_limits(max_fs: int, max_mbps: int, max_br: int) -> LevelLimits:
+  return LevelLimits(
+    max_fs * SAMPLES_PER_MACROBLOCK,
+    max_mbps * SAMPLES_PER_MACROBLOCK,
+    max_br * KBPS,
+  )
+
+
+# see: H.264 Table A-1, MaxFS, MaxMBPS and MaxBR
+H264_LIMITS: Final[dict[Level, LevelLimits]] = {
+  Level(level): get_h264_limits(*limits)
+  for level, limits in {
+    '1.0': (99, 1_485, 64),
+    '1.1': (396, 3_000, 192),
+    '1.2': (396, 6_000, 384),
+    '1.3': (396, 11_880, 768),
+    '2.0': (396, 11_880, 2_000),
+    '2.1': (792, 19_800, 4_000),
+    '2.2': (1_620, 20_250, 4_000),
+    '3.0': (1_620, 40_500, 10_000),
+    '3.1': (3_600, 108_000, 14_000),
+    '3.2': (5_120, 216_000, 20_000),
+    '4.0': (8_192, 245_760, 20_000),
+    '4.1': (8_192, 245_760, 50_000),
+    '4.2': (8_704, 522_240, 50_000),
+    '5.0': (22_080, 589_824, 135_000),
+    '5.1': (36_864, 983_040, 240_000),
+    '5.2': (36_864, 2_073_600, 240_000),
+    '6.0': (139_264, 4_177_920, 240_000),
+    '6.1': (139_264, 8_355_840, 480_000),
+    '6.2': (139_264, 16_711_680, 800_000),
+  }.items()
+}
+
+# see: H.265 Table A.8, MaxLumaPs, MaxLumaSr and MaxBR for the Main tier
+HEVC_LIMITS: Final[dict[Level, LevelLimits]] = {
+  Level(level): LevelLimits(samples, rate, max_br * KBPS)
+  for level, (samples, rate, max_br) in {
+    '1.0': (36_864, 552_960, 128),
+    '2.0': (122_880, 3_686_400, 1_500),
+    '2.1': (245_760, 7_372_800, 3_000),
+    '3.0': (552_960, 16_588_800, 6_000),
+    '3.1': (983_040, 33_177_600, 10_000),
+    '4.0': (2_228_224, 66_846_720, 12_000),
+    '4.1': (2_228_224, 133_693_440, 20_000),
+    '5.0': (8_912_896, 267_386_880, 25_000),
+    '5.1': (8_912_896, 534_773_760, 40_000),
+    '5.2': (8_912_896, 1_069_547_520, 60_000),
+    '6.0': (35_651_584, 1_069_547_520, 60_000),
+    '6.1': (35_651_584, 2_139_095_040, 120_000),
+    '6.2': (35_651_584, 4_278_190_080, 240_000),
+  }.items()
+}
+
+LEVEL_LIMITS: Final[dict[VideoCodec, dict[Level, LevelLimits]]] = {
+  VideoCodec.avc: H264_LIMITS,
+  VideoCodec.hevc: HEVC_LIMITS,
+}
+
+
+class FixupFormats(TranscodeFormats):
+  """Formats fixed by rewriting stream metadata, without re-encoding"""
+
+
+def get_video_bitrate(video: Video) -> int | None:
+  for track in video.data.video_tracks:
+    if bitrate := track.bit_rate or track.maximum_bit_rate:
+      return int(bitrate)
+
+  return video.bitrate
+
+
+def fits_level(video: Video, level: Level) -> bool:
+  if not (profile := video.formats.video_profile) or not profile.resolution:
+    return False
+
+  if not (limits := LEVEL_LIMITS.get(profile.codec, {}).get(level)):
+    return False
+
+  width, height = profile.resolution
+  fps = profile.fps if profile.fps and profile.fps > 0 else DEFAULT_PROFILE_FPS
+  samples = int(width) * int(height)
+
+  if samples > limits.samples or samples * float(fps) > limits.rate:
+    return False
+
+  if (bitrate := get_video_bitrate(video)) and bitrate > limits.bitrate:
+    return False
+
+  return True
+
+
+def needs_tag_fixup(video: Video) -> bool:
+  if video.formats.container not in TAG_CONTAINERS:
+    return False
+
+  return any(
+    (track.codec_id or '').lower() == HEV1
+    for track in video.data.video_tracks
+  )
+
+
+def get_level_fixup(formats: Formats | None) -> Level | None:
+  """Return the level if it's the only mismatch"""
+  if not formats:
+    return None
+
+  container, video_profile, audio_profile, subtitle = formats
+
+  if container or subtitle or audio_profile:
+    return None
+
+  if not video_profile:
+    return None
+
+  codec, resolution, fps, level = video_profile
+
+  if codec or resolution or fps:
+    return None
+
+  return level
+
+
+def get_fixup(device: Device, video: Video) -> FixupFormats | None:
+  if not (profile := video.formats.video_profile) or profile.codec not in LEVEL_LIMITS:
+    return None
+
+  tag = needs_tag_fixup(video)
+
+  if device.can_play(video):
+    if not tag:
+      return None
+
+    log.info(f'Planning {HEV1} to {HVC1} tag fixup for {video.path}')
+    return FixupFormats(video_profile=TranscodeVideoProfile(None, None, None, None))
+
+  if not (level := get_level_fixup(device.transcode_to(video))):
+    return None
+
+  if not fits_level(video, level):
+    log.info(f"{video.path} doesn't fit level {level}, it must be re-encoded.")
+    return None
+
+  log.info(f'Planning level {profile.level} to {level} fixup for {video.path}')
+  return FixupFormats(video_profile=TranscodeVideoProfile(None, None, None, level))
+
+
+def get_bitstream_filter(video: Video, level: Level) -> str | None:
+  if not (profile := video.formats.video_profile):
+    return None
+
+  if not (bsf := BITSTREAM_FILTERS.get(profile.codec)):
+    return None
+
+  level_idc = int(level * LEVEL_SCALES[profile.codec])
+  return f'{bsf}=level={level_idc}'
+
+
+def verify_fixup(video: Video, formats: FixupFormats, path: Path) -> Video:
+  fixed = Video.from_path(path)
+  profile, fixed_profile = video.formats.video_profile, fixed.formats.video_profile
+
+  errors = list[str]()
+
+  if not fixed_profile or fixed_profile.codec != profile.codec:
+    errors.append(f'codec changed to {fixed_profile and fixed_profile.codec}')
+
+  elif fixed_profile.resolution != profile.resolution:
+    errors.append(f'resolution changed to {fixed_profile.resolution}')
+
+  if (level := formats.video_profile.level) and fixed_profile and fixed_profile.level != level:
+    errors.append(f'level is {fixed_profile.level}, not {level}')
+
+  if needs_tag_fixup(fixed):
+    errors.append(f'still tagged {HEV1}')
+
+  if not isclose(fixed.duration, video.duration, abs_tol=DURATION_TOLERANCE):
+    errors.append(f'duration changed from {video.duration:.1f}s to {fixed.duration:.1f}s')
+
+  if errors:
+    path.unlink(missing_ok=True)
+    raise VerifyError(f"Fixup of {video.path} failed verification: {', '.join(errors)}")
+
+  log.info(f'Verified fixup of {video.path}')
+  return fixed
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import logging
+from asyncio import CancelledError, create_task, sleep
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager, suppress
+from dataclasses import dataclass, field
+from typing import Final
+
+import psutil
+
+from .process import Process
+from .schedule import NO_LOAD, PERCENT, Scheduler
+from ..base import DEFAULT_THREADS
+
+
+log = logging.getLogger(__name__)
+
+GOVERNOR_INTERVAL: Final[float] = 2.0
+RESUME_RATIO: Final[float] = 0.5
+
+
+@dataclass
+class Governor:
+  """Pauses running jobs while foreground load is high"""
+  scheduler: Scheduler
+  threshold: float
+  interval: float = GOVERNOR_INTERVAL
+  cores: int = DEFAULT_THREADS
+
+  paused: bool = False
+  procs: dict[int, psutil.Process] = field(default_factory=dict, repr=False)
+
+  @property
+  def resume_threshold(self) -> float:
+    return self.threshold * RESUME_RATIO
+
+  def get_usage(self, process: Process) -> float:
+    if not (pid := process.pid):
+      return NO_LOAD
+
+    try:
+      if not (proc := self.procs.get(pid)):
+        proc = self.procs[pid] = psutil.Process(pid)
+        proc.cpu_percent(interval=None)
+
+      return proc.cpu_percent(interval=None) / PERCENT
+
+    except psutil.Error:
+      self.procs.pop(pid, None)
+      return NO_LOAD
+
+  def get_foreground(self) -> float:
+    """Fraction of cores used by processes other than running jobs"""
+    load = self.scheduler.monitor.sample()
+    ours = sum(self.get_usage(process) for process in self.scheduler.processes)
+
+    return max(load.cpu - ours, NO_LOAD) / self.cores
+
+  def pause(self):
+    self.paused = self.scheduler.paused = True
+
+    for process in self.scheduler.processes:
+      process.pause()
+
+  def resume(self):
+    self.paused = self.scheduler.paused = False
+
+    for process in self.scheduler.processes:
+      process.resume()
+
+    self.scheduler.dispatch()
+
+  def check(self):
+    foreground = self.get_foreground()
+    log.debug(f'[Governor] Foreground load: {foreground:.0%}')
+
+    if not self.paused and foreground >= self.threshold:
+      log.warning(f'Foreground load {foreground:.0%} above {self.threshold:.0%}, pausing jobs.')
+      self.pause()
+
+    elif self.paused and foreground < self.resume_threshold:
+      log.warning(f'Foreground load {foreground:.0%} below {self.resume_threshold:.0%}, resuming jobs.')
+      self.resume()
+
+    elif self.paused:
+      self.pause()
+
+  async def run(self):
+    try:
+      while True:
+        await sleep(self.interval)
+        self.check()
+
+    finally:
+      self.resume()
+
+
+@asynccontextmanager
+async def governed(scheduler: Scheduler, threshold: float | None = None) -> AsyncIterator[Governor | None]:
+  if threshold is None:
+    yield None
+    return
+
+  governor = Governor(scheduler, threshold)
+  task = create_task(governor.run())
+
+  try:
+    yield governor
+
+  finally:
+    task.cancel()
+
+    with suppress(CancelledError):
+      await task
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import json
+import logging
+from asyncio import BoundedSemaphore, TaskGroup, to_thread
+from collections.abc import Callable, Iterable
+from enum import StrEnum, auto
+from pathlib import Path
+from shlex import join, quote
+from typing import Final, NamedTuple
+
+from .jobs import get_action
+from .preflight import preflight
+from .rename import RenameFormats, get_rename
+from .run import LINK_CMD, PROBE_JOBS, get_rename_path, get_stream
+from .storage import PARTIAL_PREFIX, PARTIAL_SUFFIX
+from .transcode import TranscodeFormats, should_transcode
+from ..base import DEFAULT_THREADS, NEW_LINE, get_error_handler
+from ..enums import Action, Strategy
+from ..exceptions import GraphError, PreflightError, UnknownFormat
+from ..model.device import Device
+from ..model.video import Video
+
+
+log = logging.getLogger(__name__)
+
+AND: Final[str] = ' && '
+FORCE_OPT: Final[str] = '-f'
+MOVE_ARGS: Final[tuple[str, ...]] = ('mv', FORCE_OPT)
+
+SH_HEADER: Final[str] = '#!/bin/sh'
+MAKE_HEADER: Final[str] = '.DELETE_ON_ERROR:'
+MAKE_ALL: Final[str] = 'all'
+NINJA_RULE: Final[str] = 'convert'
+NINJA_HEADER: Final[str] = f"""\
+rule {NINJA_RULE}
+  command = $cmd
+  description = $action $out
+"""
+
+# characters with special meaning in paths, see: https://ninja-build.org/manual.html#ref_lexer
+NINJA_ESCAPES: Final[dict[str, str]] = {'$': '$$', ' ': '$ ', ':': '$:'}
+MAKE_ESCAPES: Final[dict[str, str]] = {'$': '$$', ' ': '\\ ', ':': '\\:', '#': '\\#'}
+
+# make only unescapes % in rule targets, it's literal in prerequisites
+MAKE_TARGET_ESCAPES: Final[dict[str, str]] = MAKE_ESCAPES | {'%': '\\%'}
+
+# make has no escape for these in target or prerequisite names
+MAKE_UNSAFE: Final[frozenset[str]] = frozenset({';', '=', '\\', '\n', '\t'})
+
+
+type Args = tuple[str, ...]
+type Writer = Callable[[Iterable[Step]], Iterable[str]]
+
+
+class GraphFormat(StrEnum):
+  sh = auto()
+  make = auto()
+  ninja = auto()
+  jsonl = auto()
+
+
+class Step(NamedTuple):
+  """Commands that make the output from the source"""
+  source: Path
+  output: Path
+  action: Action
+  commands: tuple[Args, ...]
+
+  @property
+  def cmd(self) -> str:
+    return AND.join(join(args) for args in self.commands)
+
+  @property
+  def as_record(self) -> dict[str, str | list[list[str]]]:
+    return {
+      'source': str(self.source),
+      'output': str(self.output),
+      'action': self.action,
+      'commands': [list(args) for args in self.commands],
+      'cmd': self.cmd,
+    }
+
+
+def get_partial_path(path: Path) -> Path:
+  """Keeps the extension, FFmpeg picks the muxer from it"""
+  return path.with_name(f'{PARTIAL_PREFIX}{path.stem}{PARTIAL_SUFFIX}{path.suffix}')
+
+
+def get_rename_step(video: Video, formats: RenameFormats) -> Step:
+  output = get_rename_path(video, formats)
+  args = (LINK_CMD, FORCE_OPT, str(video.path), str(output))
+
+  return Step(video.path, output, Action.rename, (args,))
+
+
+def get_transcode_step(
+  video: Video,
+  formats: TranscodeFormats,
+  threads: int = DEFAULT_THREADS,
+  subtitle: Path | None = None,
+) -> Step:
+  stream, output = get_stream(video, formats, threads, subtitle=subtitle)
+  partial = get_partial_path(output)
+
+  # write next to the output and move it into place, so interrupted steps run again
+  args = tuple(str(partial) if arg == str(output) else arg for arg in stream.compile())  # type: ignore
+  move = (*MOVE_ARGS, str(partial), str(output))
+
+  return Step(video.path, output, get_action(formats), (args, move))
+
+
+def get_step(
+  device: Device,
+  video: Video,
+  threads: int = DEFAULT_THREADS,
+  subtitle: Path | None = None,
+) -> Step | None:
+  """Step to convert the video, or None if it already plays on the device"""
+  if formats := get_rename(device, video):
+    return get_rename_step(video, formats)
+
+  if not should_transcode(device, video, subtitle) or not (formats := device.transcode_to(video)):
+    return None
+
+  formats = preflight(device, video, formats)
+  return get_transcode_step(video, formats, threads, subtitle)
+
+
+def probe_step(
+  device: Device,
+  path: Path,
+  threads: int = DEFAULT_THREADS,
+  subtitle: Path | None = None,
+) -> Step | None:
+  video = Video.from_path(path)
+
+  try:
+    return get_step(device, video, threads, subtitle)
+
+  except PreflightError as e:
+    log.error(f'[{e}] Not converting {path}, the conversion would fail.')
+    return None
+
+
+async def get_steps(
+  device: Device,
+  *paths: Path,
+  threads: int = DEFAULT_THREADS,
+  subtitle: Path | None = None,
+  strategy: Strategy = Strategy.quit,
+) -> list[Step]:
+  """Probe the videos in parallel, and return their steps in the order of the paths"""
+  probes = BoundedSemaphore(PROBE_JOBS)
+  handled_prober = get_error_handler(probe_step, UnknownFormat, strategy=strategy)
+
+  async def probe(path: Path) -> Step | None:
+    async with probes:
+      return await to_thread(handled_prober, device, path, threads, subtitle)
+
+  async with TaskGroup() as tg:
+    tasks = [tg.create_task(probe(path)) for path in paths]
+
+  return [step for task in tasks if (step := task.result())]
+
+
+def escape_path(text: str | Path, escapes: dict[str, str]) -> str:
+  return ''.join(escapes.get(char, char) for char in str(text))
+
+
+def escape_make_path(path: Path, escapes: dict[str, str] = MAKE_ESCAPES) -> str:
+  if unsafe := sorted(MAKE_UNSAFE.intersection(str(path))):
+    raise GraphError(f"{path} can't be a make target because of {unsafe}, use another graph format")
+
+  return escape_path(path, escapes)
+
+
+def gen_sh(steps: Iterable[Step]) -> Iterable[str]:
+  """One independent line per step, to feed to xargs -P or parallel"""
+  yield SH_HEADER
+
+  for step in steps:
+    yield f'[ {quote(str(step.output))} -nt {quote(str(step.source))} ] || {{ {step.cmd}; }}'
+
+
+def gen_make(steps: Iterable[Step]) -> Iterable[str]:
+  steps = list(steps)
+
+  yield MAKE_HEADER
+  yield f'.PHONY: {MAKE_ALL}'
+  yield f'{MAKE_ALL}: {" ".join(escape_make_path(step.output) for step in steps)}'
+
+  for step in steps:
+    yield ''
+    yield f'{escape_make_path(step.output, MAKE_TARGET_ESCAPES)}: {escape_make_path(step.source)}'
+    yield f'\t{step.cmd.replace("$", "$$")}'
+
+
+def gen_ninja(steps: Iterable[Step]) -> Iterable[str]:
+  yield NINJA_HEADER
+
+  for step in steps:
+    yield f'build {escape_path(step.output, NINJA_ESCAPES)}: {NINJA_RULE} {escape_path(step.source, NINJA_ESCAPES)}'
+    yield f'  cmd = {step.cmd.replace("$", "$$")}'
+    yield f'  action = {step.action}'
+    yield ''
+
+
+def gen_jsonl(steps: Iterable[Step]) -> Iterable[str]:
+  for step in steps:
+    yield json.dumps(step.as_record)
+
+
+GRAPH_WRITERS: Final[dict[GraphFormat, Writer]] = {
+  GraphFormat.sh: gen_sh,
+  GraphFormat.make: gen_make,
+  GraphFormat.ninja: gen_ninja,
+  GraphFormat.jsonl: gen_jsonl,
+}
+
+
+def get_graph(steps: Iterable[Step], fmt: GraphFormat = GraphFormat.sh) -> str:
+  """Job graph where each output depends on its source, so reruns only convert changed videos"""
+  lines = GRAPH_WRITERS[fmt](steps)
+  return NEW_LINE.join(lines) + NEW_LINE
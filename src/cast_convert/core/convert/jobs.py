@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import NamedTuple, TYPE_CHECKING
+
+from .faststart import FaststartFormats
+from .fixup import FixupFormats
+from .rename import RenameFormats
+from .subtitles import SidecarFormats
+from ..base import DEFAULT_THREADS
+from ..enums import Action, Speed
+from ..media.formats import Formats
+from ..model.video import Video
+from ..parse import Alias
+
+
+if TYPE_CHECKING:
+  from .affinity import Cpus
+  from .process import Process
+  from ..model.device import Device
+
+
+class Target(NamedTuple):
+  """One output of a job, shared by the devices it plays on"""
+  formats: Formats
+  devices: tuple[Device, ...]
+
+  @property
+  def action(self) -> Action:
+    return get_action(self.formats)
+
+
+@dataclass
+class Job:
+  path: Path
+  device: Device
+  video: Video
+  formats: Formats | None = None
+  threads: int = DEFAULT_THREADS
+  cpus: Cpus | None = None
+  process: Process | None = None
+  speed: Speed | None = None
+  realtime: float | None = None  # measured encoding speed, in seconds of video per second
+  skip: set[Alias] = field(default_factory=set)  # encoders that failed on this job
+  targets: list[Target] = field(default_factory=list)  # outputs made from one decode of the video
+  verified: float = 0.0  # seconds spent verifying outputs
+
+  @property
+  def action(self) -> Action:
+    return get_action(self.formats)
+
+
+def get_action(formats: Formats | None) -> Action:
+  if not formats:
+    return Action.skip
+
+  if isinstance(formats, RenameFormats):
+    return Action.rename
+
+  if isinstance(formats, FaststartFormats):
+    return Action.faststart
+
+  if isinstance(formats, SidecarFormats):
+    return Action.sidecar
+
+  if isinstance(formats, FixupFormats):
+    return Action.fixup
+
+  if (profile := formats.video_profile) and profile.resolution:
+    return Action.scale
+
+  if profile:
+    return Action.video
+
+  if (profile := formats.audio_profile) and profile.codec:
+    return Action.audio
+
+  return Action.copy
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import fcntl
+import logging
+import os
+import shlex
+from abc import ABC, abstractmethod
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Final, Self
+
+from ..base import DEFAULT_THREADS
+
+
+log = logging.getLogger(__name__)
+
+MAKEFLAGS: Final[str] = 'MAKEFLAGS'
+AUTH_OPTS: Final[tuple[str, ...]] = ('--jobserver-auth=', '--jobserver-fds=')
+FIFO_PREFIX: Final[str] = 'fifo:'
+FD_SEP: Final[str] = ','
+PROC_FD: Final[Path] = Path('/proc/self/fd')
+
+TOKEN_SIZE: Final[int] = 1
+IMPLICIT: Final[bytes] = b''
+
+LOCK_GLOB: Final[str] = 'token-*.lock'
+LOCK_NAME: Final[str] = 'token-{}.lock'
+
+
+type Token = bytes | int
+Tokens = list[Token]
+
+
+class TokenPool(ABC):
+  """Shared pool of CPU tokens"""
+
+  @abstractmethod
+  def acquire(self, count: int) -> Tokens: ...
+
+  @abstractmethod
+  def release(self, tokens: Tokens): ...
+
+
+@dataclass
+class Jobserver(TokenPool):
+  """GNU make jobserver client"""
+  read_fd: int
+  write_fd: int
+  implicit: bool = True
+
+  @classmethod
+  def from_env(cls: type[Self], environ: Mapping[str, str] = os.environ) -> Self | None:
+    if not (flags := environ.get(MAKEFLAGS)):
+      return None
+
+    auth: str | None = None
+
+    for flag in shlex.split(flags):
+      for opt in AUTH_OPTS:
+        if flag.startswith(opt):
+          auth = flag.removeprefix(opt)
+
+    if not auth:
+      return None
+
+    try:
+      return cls.from_auth(auth)
+
+    except (OSError, ValueError) as e:
+      log.warning(f"[{e}] Can't connect to jobserver {auth}, ignoring it.")
+      return None
+
+  @classmethod
+  def from_auth(cls: type[Self], auth: str) -> Self:
+    if auth.startswith(FIFO_PREFIX):
+      fifo = auth.removeprefix(FIFO_PREFIX)
+      read_fd = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+      write_fd = os.open(fifo, os.O_WRONLY)
+
+    else:
+      read, write = map(int, auth.split(FD_SEP))
+      read_fd = reopen_nonblocking(read)
+      write_fd = write
+
+    log.info(f'Using jobserver {auth}')
+    return cls(read_fd, write_fd)
+
+  def acquire(self, count: int) -> Tokens:
+    tokens = Tokens()
+
+    if self.implicit and count:
+      self.implicit = False
+      tokens.append(IMPLICIT)
+
+    while len(tokens) < count:
+      try:
+        token = os.read(self.read_fd, TOKEN_SIZE)
+
+      except BlockingIOError:
+        break
+
+      if not token:
+        break
+
+      tokens.append(token)
+
+    return tokens
+
+  def release(self, tokens: Tokens):
+    for token in tokens:
+      if token == IMPLICIT:
+        self.implicit = True
+        continue
+
+      os.write(self.write_fd, token)
+
+
+def reopen_nonblocking(fd: int) -> int:
+  os.fstat(fd)
+
+  try:
+    # gets a private open file description, so O_NONBLOCK doesn't leak to make
+    return os.open(PROC_FD / str(fd), os.O_RDONLY | os.O_NONBLOCK)
+
+  except OSError:
+    log.warning(f"Can't reopen jobserver fd {fd}, sharing it in non-blocking mode.")
+    os.set_blocking(fd, False)
+    return fd
+
+
+@dataclass
+class LockPool(TokenPool):
+  """Token pool shared between processes through lock files"""
+  path: Path
+  size: int = DEFAULT_THREADS
+  held: dict[int, Path] = field(default_factory=dict)
+
+  def __post_init__(self):
+    self.path.mkdir(parents=True, exist_ok=True)
+
+    if not (locks := list(self.path.glob(LOCK_GLOB))):
+      for number in range(self.size):
+        (self.path / LOCK_NAME.format(number)).touch()
+
+    else:
+      self.size = len(locks)
+
+    log.info(f'Using token pool {self.path} with {self.size} tokens')
+
+  @property
+  def locks(self) -> list[Path]:
+    return sorted(self.path.glob(LOCK_GLOB))
+
+  def acquire(self, count: int) -> Tokens:
+    tokens = Tokens()
+    held = set(self.held.values())
+
+    for lock in self.locks:
+      if len(tokens) >= count:
+        break
+
+      if lock in held:
+        continue
+
+      fd = os.open(lock, os.O_RDWR)
+
+      try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+      except BlockingIOError:
+        os.close(fd)
+        continue
+
+      self.held[fd] = lock
+      tokens.append(fd)
+
+    return tokens
+
+  def release(self, tokens: Tokens):
+    for fd in tokens:
+      if self.held.pop(fd, None):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def get_token_pool(path: Path | None = None) -> TokenPool | None:
+  if path:
+    return LockPool(path)
+
+  return Jobserver.from_env()
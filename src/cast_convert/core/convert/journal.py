@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass, field
+from enum import StrEnum, auto
+from pathlib import Path
+from threading import Lock
+from time import time
+from typing import Any, Final, Self
+
+from .storage import fsync_path, get_partial
+from ..base import NEW_LINE, NO_SIZE
+
+
+log = logging.getLogger(__name__)
+
+ENCODING: Final[str] = 'utf-8'
+NO_MTIME: Final[float] = 0.0
+
+
+type Key = tuple[str, str]
+type Record = dict[str, Any]
+
+
+class JobState(StrEnum):
+  planned = auto()
+  running = auto()
+  done = auto()
+  failed = auto()
+
+
+INTERRUPTED: Final[frozenset[JobState]] = frozenset({JobState.planned, JobState.running})
+
+
+@dataclass(frozen=True)
+class Entry:
+  path: Path
+  device: str
+  state: JobState
+  output: Path | None = None
+  size: int = NO_SIZE
+  mtime: float = NO_MTIME
+  error: str | None = None
+  speed: str | None = None
+  time: float = field(default_factory=time)
+
+  @property
+  def key(self) -> Key:
+    return get_key(self.path, self.device)
+
+  @property
+  def as_record(self) -> Record:
+    record = asdict(self)
+    record['path'] = str(self.path)
+    record['output'] = str(self.output) if self.output else None
+
+    return record
+
+  @classmethod
+  def from_record(cls: type[Self], record: Record) -> Self:
+    output = record.get('output')
+
+    return cls(
+      path=Path(record['path']),
+      device=record['device'],
+      state=JobState(record['state']),
+      output=Path(output) if output else None,
+      size=record.get('size', NO_SIZE),
+      mtime=record.get('mtime', NO_MTIME),
+      error=record.get('error'),
+      speed=record.get('speed'),
+      time=record.get('time', NO_MTIME),
+    )
+
+  def is_current(self, path: Path | None = None) -> bool:
+    size, mtime = get_stat(path or self.path)
+    return size == self.size and mtime == self.mtime
+
+
+@dataclass
+class Journal:
+  """Append-only job journal, compacted to the latest entry of each job when it's loaded"""
+  path: Path
+  entries: dict[Key, Entry] = field(default_factory=dict)
+  lock: Lock = field(default_factory=Lock, repr=False, compare=False)
+
+  @classmethod
+  def load(cls: type[Self], path: Path) -> Self:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    journal = cls(path)
+
+    for entry in read_entries(path):
+      journal.entries[entry.key] = entry
+
+    log.info(f'Loaded {len(journal.entries)} jobs from journal {path}')
+
+    # drops superseded entries, and a line cut short by a crash that the next entry would be appended to
+    if path.exists():
+      journal.compact()
+
+    return journal
+
+  def compact(self):
+    """Rewrite the journal with only the latest entry of each job"""
+    partial = get_partial(self.path)
+
+    with self.lock:
+      try:
+        with partial.open('w', encoding=ENCODING) as file:
+          file.writelines(json.dumps(entry.as_record) + NEW_LINE for entry in self.entries.values())
+          file.flush()
+          os.fsync(file.fileno())
+
+        partial.replace(self.path)
+        fsync_path(self.path.parent)
+
+      except OSError as e:
+        log.warning(f"[{e}] Can't compact journal {self.path}")
+        partial.unlink(missing_ok=True)
+
+  def get(self, path: Path, device: str) -> Entry | None:
+    return self.entries.get(get_key(path, device))
+
+  def record(
+    self,
+    path: Path,
+    device: str,
+    state: JobState,
+    output: Path | None = None,
+    error: str | None = None,
+    speed: str | None = None,
+  ) -> Entry:
+    size, mtime = get_stat(path)
+
+    entry = Entry(
+      path=path,
+      device=device,
+      state=state,
+      output=output,
+      size=size,
+      mtime=mtime,
+      error=error,
+      speed=speed,
+    )
+
+    with self.lock:
+      self.entries[entry.key] = entry
+      write_entry(self.path, entry)
+
+    log.debug(f'[Journal] {state}: {path} -> {output}')
+    return entry
+
+  def is_done(self, path: Path, device: str) -> bool:
+    if not (entry := self.get(path, device)) or entry.state is not JobState.done:
+      return False
+
+    if entry.output and not entry.output.exists():
+      return False
+
+    return entry.is_current(path)
+
+  def interrupted(self, device: str | None = None) -> list[Entry]:
+    return [
+      entry
+      for entry in self.entries.values()
+      if entry.state in INTERRUPTED
+      and (device is None or entry.device == device)
+    ]
+
+  def recover(self, device: str | None = None) -> list[Path]:
+    paths = list[Path]()
+
+    for entry in self.interrupted(device):
+      if entry.state is JobState.running:
+        remove_partial(entry)
+
+      if entry.path.exists():
+        paths.append(entry.path)
+
+    log.info(f'Recovered {len(paths)} interrupted jobs from {self.path}')
+    return paths
+
+
+def get_key(path: Path, device: str) -> Key:
+  return str(path), device
+
+
+def get_stat(path: Path) -> tuple[int, float]:
+  try:
+    stat = path.stat()
+
+  except OSError:
+    return NO_SIZE, NO_MTIME
+
+  return stat.st_size, stat.st_mtime
+
+
+def remove_partial(entry: Entry):
+  """Remove the output of an interrupted job, unless the source is gone and the output is the only copy left"""
+  if not (output := entry.output):
+    return
+
+  # faststarts, and moves across filesystems, write here before renaming over the output
+  if (partial := get_partial(output)).exists():
+    log.warning(f'Removing partial output {partial} of interrupted job {entry.path}')
+    partial.unlink(missing_ok=True)
+
+  if output == entry.path:
+    return
+
+  # renames and replacements unlink the source once the output is in place
+  if not entry.path.exists():
+    log.warning(f'Keeping output {output} of interrupted job, its source {entry.path} was already replaced')
+    return
+
+  if output.exists():
+    log.warning(f'Removing partial output {output} of interrupted job {entry.path}')
+    output.unlink(missing_ok=True)
+
+
+def read_entries(path: Path) -> Iterable[Entry]:
+  if not path.exists():
+    return
+
+  with path.open(encoding=ENCODING) as file:
+    for number, line in enumerate(file, start=1):
+      if not (line := line.strip()):
+        continue
+
+      try:
+        yield Entry.from_record(json.loads(line))
+
+      except (ValueError, KeyError) as e:
+        log.warning(f'[{e}] Skipping malformed journal line {number} in {path}')
+
+
+def write_entry(path: Path, entry: Entry):
+  line = json.dumps(entry.as_record) + NEW_LINE
+
+  with path.open('a', encoding=ENCODING) as file:
+    file.write(line)
+    file.flush()
+    os.fsync(file.fileno())
@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import heapq
+import json
+import logging
+from asyncio import BoundedSemaphore, TaskGroup, to_thread
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass, field, replace
+from pathlib import Path
+from time import time
+from typing import Final, NamedTuple, Self
+
+from .cost import Cost, NO_BYTES, NO_COST, get_job_cost, get_job_size
+from .journal import ENCODING, NO_MTIME, Record, get_stat
+from .run import PROBE_JOBS, get_planner
+from .settings import DEFAULT_SETTINGS, Settings
+from .stats import get_history
+from ..base import DEFAULT_JOBS, DEFAULT_THREADS, NO_SIZE, get_error_handler
+from ..enums import Action, Strategy
+from ..exceptions import PlanError, PreflightError, UnknownFormat
+from ..model.video import Video
+
+
+log = logging.getLogger(__name__)
+
+PLAN_VERSION: Final[int] = 1
+NO_DURATION: Final[float] = 0.0
+JSON_INDENT: Final[int] = 2
+
+# nothing to run for these
+DONE: Final[frozenset[Action]] = frozenset({Action.skip, Action.reject})
+
+# outputs that are probed before they're placed
+VERIFIED: Final[frozenset[Action]] = frozenset({Action.copy, Action.fixup, Action.audio, Action.video, Action.scale})
+
+
+class Summary(NamedTuple):
+  """Totals for the videos planned for one action"""
+  count: int = 0
+  duration: float = NO_DURATION
+  cost: Cost = NO_COST
+  size: int = NO_BYTES
+
+
+@dataclass(frozen=True)
+class Entry:
+  """Planned conversion of one video"""
+  path: Path
+  action: Action
+  duration: float = NO_DURATION
+  cost: Cost = NO_COST
+  output_size: int = NO_BYTES
+  size: int = NO_SIZE
+  mtime: float = NO_MTIME
+  info: str = field(default='', repr=False)  # MediaInfo's XML, so the plan runs without probing again
+  error: str | None = None  # why the conversion would fail
+
+  @property
+  def as_record(self) -> Record:
+    record = asdict(self)
+    record['path'] = str(self.path)
+
+    return record
+
+  @classmethod
+  def from_record(cls: type[Self], record: Record) -> Self:
+    return cls(
+      path=Path(record['path']),
+      action=Action(record['action']),
+      duration=record.get('duration', NO_DURATION),
+      cost=record.get('cost', NO_COST),
+      output_size=record.get('output_size', NO_BYTES),
+      size=record.get('size', NO_SIZE),
+      mtime=record.get('mtime', NO_MTIME),
+      info=record.get('info', ''),
+      error=record.get('error'),
+    )
+
+  def is_current(self) -> bool:
+    return get_stat(self.path) == (self.size, self.mtime)
+
+  def get_video(self) -> Video | None:
+    if not self.info or not self.is_current():
+      return None
+
+    return Video.from_info(self.path, self.info)
+
+
+@dataclass
+class Plan:
+  """Conversions planned for a library, to estimate and run later without probing it again"""
+  name: str
+  entries: list[Entry] = field(default_factory=list)
+  fixup: bool = False
+  faststart: bool = False
+  sidecar: bool = False
+  each: bool = False
+  time: float = field(default_factory=time)
+
+  @property
+  def pending(self) -> list[Entry]:
+    return [entry for entry in self.entries if entry.action not in DONE]
+
+  @property
+  def rejected(self) -> list[Entry]:
+    return [entry for entry in self.entries if entry.action is Action.reject]
+
+  @property
+  def summaries(self) -> dict[Action, Summary]:
+    """Totals for each planned action, from cheapest to most expensive"""
+    summaries = dict[Action, Summary]()
+
+    for action in Action:
+      if entries := [entry for entry in self.entries if entry.action is action]:
+        summaries[action] = get_summary(entries)
+
+    return summaries
+
+  @property
+  def total(self) -> Summary:
+    return get_summary(self.pending)
+
+  def get_settings(self, settings: Settings = DEFAULT_SETTINGS) -> Settings:
+    """Settings with the planning options the plan was made with"""
+    return replace(settings, fixup=self.fixup, faststart=self.faststart, sidecar=self.sidecar, each=self.each)
+
+  def get_videos(self) -> dict[Path, Video]:
+    """Videos of pending entries, except the ones that changed since they were planned"""
+    videos = dict[Path, Video]()
+
+    for entry in self.pending:
+      if not (video := entry.get_video()):
+        log.warning(f'{entry.path} changed since it was planned, probing it again.')
+        continue
+
+      videos[entry.path] = video
+
+    return videos
+
+  def save(self, path: Path):
+    data = {
+      'version': PLAN_VERSION,
+      'name': self.name,
+      'fixup': self.fixup,
+      'faststart': self.faststart,
+      'sidecar': self.sidecar,
+      'each': self.each,
+      'time': self.time,
+      'entries': [entry.as_record for entry in self.entries],
+    }
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, indent=JSON_INDENT), encoding=ENCODING)
+
+    log.info(f'Saved plan for {len(self.entries)} videos to {path}')
+
+  @classmethod
+  def load(cls: type[Self], path: Path) -> Self:
+    try:
+      data = json.loads(path.read_text(encoding=ENCODING))
+
+      if (version := data.get('version')) != PLAN_VERSION:
+        raise PlanError(f'Unsupported plan version {version}, expected {PLAN_VERSION}')
+
+      plan = cls(
+        name=data['name'],
+        entries=[Entry.from_record(record) for record in data['entries']],
+        fixup=data.get('fixup', False),
+        faststart=data.get('faststart', False),
+        sidecar=data.get('sidecar', False),
+        each=data.get('each', False),
+        time=data.get('time', NO_MTIME),
+      )
+
+    except (OSError, ValueError, KeyError, TypeError) as e:
+      raise PlanError(f"[{e}] Can't load plan from {path}") from e
+
+    log.info(f'Loaded plan for {len(plan.entries)} videos from {path}')
+    return plan
+
+
+def get_summary(entries: Iterable[Entry]) -> Summary:
+  entries = list(entries)
+
+  return Summary(
+    count=len(entries),
+    duration=sum(entry.duration for entry in entries),
+    cost=sum(entry.cost for entry in entries),
+    size=sum(entry.output_size for entry in entries),
+  )
+
+
+def estimate_wall_time(
+  costs: Iterable[Cost],
+  jobs: int = DEFAULT_JOBS,
+  threads: int = DEFAULT_THREADS,
+  cores: int = DEFAULT_THREADS,
+) -> float:
+  """Seconds to run jobs of these costs, longest first, with the cores shared among the simultaneous jobs"""
+  costs = sorted(costs, reverse=True)
+  jobs = max(jobs, 1)
+  speed = max(min(threads, cores / jobs), 1)  # core-seconds per second, for each job
+  slots = [NO_DURATION] * jobs
+
+  for cost in costs:
+    heapq.heapreplace(slots, slots[0] + cost / speed)
+
+  return max(*slots, sum(costs) / cores)
+
+
+def estimate_verify_time(entries: Iterable[Entry]) -> float:
+  """Seconds spent verifying outputs, at the rate of this host's finished jobs, or 0 if it isn't known"""
+  if not (history := get_history()) or not history.verify:
+    return NO_DURATION
+
+  return sum(entry.duration for entry in entries if entry.action in VERIFIED) * history.verify
+
+
+def plan_entry(name: str, path: Path, settings: Settings = DEFAULT_SETTINGS) -> Entry:
+  video = Video.from_path(path)
+  size, mtime = get_stat(path)
+  planner = get_planner(settings)
+
+  try:
+    job = planner(
+      name, path, settings.subtitle, None, settings.fixup, settings.faststart, settings.sidecar, video, strict=True
+    )
+
+  except PreflightError as e:
+    return Entry(path, Action.reject, video.duration, size=size, mtime=mtime, info=video.info, error=str(e))
+
+  if not job:
+    return Entry(path, Action.skip, video.duration, size=size, mtime=mtime, info=video.info)
+
+  job.threads = settings.threads
+  return Entry(path, job.action, video.duration, get_job_cost(job), get_job_size(job), size, mtime, video.info)
+
+
+async def plan_paths(
+  name: str,
+  *paths: Path,
+  settings: Settings = DEFAULT_SETTINGS,
+  strategy: Strategy = Strategy.quit,
+) -> Plan:
+  """Probe and plan the videos in parallel"""
+  probes = BoundedSemaphore(PROBE_JOBS)
+  handled_planner = get_error_handler(plan_entry, UnknownFormat, strategy=strategy)
+
+  async def plan(path: Path) -> Entry | None:
+    async with probes:
+      return await to_thread(handled_planner, name, path, settings)
+
+  async with TaskGroup() as tg:
+    tasks = [tg.create_task(plan(path)) for path in paths]
+
+  entries = [entry for task in tasks if (entry := task.result())]
+
+  return Plan(
+    name=name,
+    entries=entries,
+    fixup=settings.fixup,
+    faststart=settings.faststart,
+    sidecar=settings.sidecar,
+    each=settings.each,
+  )
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import logging
+from typing import Final, NamedTuple, TYPE_CHECKING
+
+from .encoders import is_available
+from .subtitles import TEXT_SUBTITLES
+from .transcode import TranscodeAudioProfile, TranscodeFormats
+from ..exceptions import PreflightError
+from ..media.codecs import AudioCodec, Container, Subtitle, VideoCodec
+from ..media.formats import Formats
+from ..media.profiles import AudioProfile
+from ..model.video import Video
+from ..parse import AUDIO_ENCODERS, CODEC_CONTAINER_COMPAT, FfmpegCodecs, FmtAliases, SUBTITLE_ENCODERS, \
+  VIDEO_ENCODERS
+
+
+if TYPE_CHECKING:
+  from ..model.device import Device
+
+
+log = logging.getLogger(__name__)
+
+
+class Streams(NamedTuple):
+  """Codecs of the streams a plan will write"""
+  video: VideoCodec | None = None
+  audio: AudioCodec | None = None
+  subtitle: Subtitle | None = None
+
+
+class ContainerSupport(NamedTuple):
+  """Codecs a container can hold"""
+  video: frozenset[VideoCodec] = frozenset()
+  audio: frozenset[AudioCodec] = frozenset()
+  subtitles: frozenset[Subtitle] = frozenset()
+
+  def get_problems(self, streams: Streams) -> list[str]:
+    video, audio, subtitle = streams
+    problems = list[str]()
+
+    if video and video not in self.video:
+      problems.append(f'{video!r}')
+
+    if audio and audio not in self.audio:
+      problems.append(f'{audio!r}')
+
+    if subtitle and subtitle not in self.subtitles:
+      problems.append(f'{subtitle!r}')
+
+    return problems
+
+  def holds(self, streams: Streams) -> bool:
+    return not self.get_problems(streams)
+
+
+def get_container_support(compat: FfmpegCodecs = CODEC_CONTAINER_COMPAT) -> dict[Container, ContainerSupport]:
+  return {
+    Container.from_info(name): ContainerSupport(
+      video=frozenset(map(VideoCodec.from_info, codecs.get('video') or [])),
+      audio=frozenset(map(AudioCodec.from_info, codecs.get('audio') or [])),
+      subtitles=frozenset(map(Subtitle.from_info, codecs.get('subtitles') or [])),
+    )
+    for name, codecs in compat.items()
+  }
+
+
+CONTAINER_SUPPORT: Final[dict[Container, ContainerSupport]] = get_container_support()
+
+
+def get_output_streams(video: Video, formats: Formats) -> Streams:
+  _, video_profile, audio_profile, subtitle = video.formats
+  _, new_video, new_audio, new_subtitle = formats
+
+  video_codec = video_profile.codec if video_profile else None
+  audio_codec = audio_profile.codec if audio_profile else None
+
+  if new_video and new_video.codec:
+    video_codec = new_video.codec
+
+  if isinstance(new_audio, TranscodeAudioProfile) and new_audio.track is not None:
+    audio_codec = video.audio_profiles[new_audio.track].codec
+
+  if new_audio and new_audio.codec:
+    audio_codec = new_audio.codec
+
+  return Streams(
+    video=video_codec or None,
+    audio=audio_codec or None,
+    subtitle=new_subtitle or subtitle or None,
+  )
+
+
+def has_encoder(codec: VideoCodec | AudioCodec | Subtitle, encoders: FmtAliases) -> bool:
+  return any(is_available(encoder) for encoder in encoders.get(codec, []))
+
+
+def check_encoders(formats: Formats):
+  _, video_profile, audio_profile, subtitle = formats
+
+  wanted = [
+    (codec, encoders)
+    for codec, encoders in (
+      (video_profile and video_profile.codec, VIDEO_ENCODERS),
+      (audio_profile and audio_profile.codec, AUDIO_ENCODERS),
+      (subtitle, SUBTITLE_ENCODERS),
+    )
+    if codec
+  ]
+
+  for codec, encoders in wanted:
+    if not has_encoder(codec, encoders):
+      raise PreflightError(f'No FFmpeg encoder available for {codec!r}')
+
+
+def fix_container(device: Device, streams: Streams) -> Container | None:
+  for container in device.containers:
+    if (support := CONTAINER_SUPPORT.get(container)) and support.holds(streams):
+      return container
+
+  return None
+
+
+def fix_audio(device: Device, support: ContainerSupport, audio: AudioProfile | None) -> AudioProfile | None:
+  track = audio.track if isinstance(audio, TranscodeAudioProfile) else None
+
+  for profile in device.audio_profiles:
+    if (codec := profile.codec) in support.audio and has_encoder(codec, AUDIO_ENCODERS):
+      return TranscodeAudioProfile(codec=codec, track=track) if track is not None else AudioProfile(codec)
+
+  return None
+
+
+def fix_subtitle(support: ContainerSupport, subtitle: Subtitle) -> Subtitle | None:
+  if subtitle not in TEXT_SUBTITLES:
+    return None
+
+  for fix in support.subtitles:
+    if has_encoder(fix, SUBTITLE_ENCODERS):
+      return fix
+
+  return None
+
+
+def preflight(device: Device, video: Video, formats: TranscodeFormats) -> TranscodeFormats:
+  """Fix up or reject plans that FFmpeg would fail on, before spending any CPU on them"""
+  container = formats.container or video.formats.container
+  source = video.formats.subtitle
+
+  if formats.subtitle and source and source is not formats.subtitle and source not in TEXT_SUBTITLES:
+    raise PreflightError(f"{source!r} subtitles are images and can't be converted to {formats.subtitle!r}")
+
+  if not (support := CONTAINER_SUPPORT.get(container)):
+    check_encoders(formats)
+    return formats
+
+  streams = get_output_streams(video, formats)
+
+  if problems := support.get_problems(streams):
+    log.info(f"[Preflight] {container!r} can't hold {', '.join(problems)} from {video.path}")
+
+    if new_container := fix_container(device, streams):
+      log.info(f'[Preflight] Using {new_container!r} instead')
+      formats = formats._replace(container=new_container)
+
+    else:
+      formats = fix_streams(device, video, formats, support, streams)
+
+  check_encoders(formats)
+  return formats
+
+
+def fix_streams(
+  device: Device,
+  video: Video,
+  formats: TranscodeFormats,
+  support: ContainerSupport,
+  streams: Streams,
+) -> TranscodeFormats:
+  if streams.audio and streams.audio not in support.audio:
+    if not (audio := fix_audio(device, support, formats.audio_profile)):
+      raise PreflightError(f'No audio codec for {device.name} fits in the container')
+
+    log.info(f'[Preflight] Transcoding audio to {audio.codec!r}')
+    formats = formats._replace(audio_profile=audio)
+
+  if streams.subtitle and streams.subtitle not in support.subtitles:
+    if not (subtitle := fix_subtitle(support, streams.subtitle)):
+      raise PreflightError(f"{streams.subtitle!r} subtitles can't be converted to fit in the container")
+
+    log.info(f'[Preflight] Converting subtitles to {subtitle!r}')
+    formats = formats._replace(subtitle=subtitle)
+
+  if problems := support.get_problems(get_output_streams(video, formats)):
+    raise PreflightError(f"The container can't hold {', '.join(problems)} from {video.path}")
+
+  return formats
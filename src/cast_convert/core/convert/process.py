@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import logging
+import os
+import re
+import signal
+import sys
+from collections import deque
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from subprocess import PIPE, Popen
+from threading import Lock, Thread
+from time import monotonic
+from typing import Final
+
+import psutil
+
+from .affinity import Cpus
+from ..enums import Priority
+from ..exceptions import EncoderError, TranscodeError
+
+
+log = logging.getLogger(__name__)
+
+NO_TIME: Final[float] = 0.0
+READ_SIZE: Final[int] = 4096
+ERROR_LINES: Final[int] = 20
+
+LINE_ENDS: Final[re.Pattern] = re.compile(r'[\r\n]+')
+
+# FFmpeg's messages when an encoder, or the hardware behind it, can't be opened or fails mid-stream
+ENCODER_ERRORS: Final[re.Pattern] = re.compile(
+  r'Error while opening encoder|Could not open encoder|Error initializing output stream'
+  r'|Error (?:initializing|submitting .* to) the encoder|Error encoding|Unknown encoder'
+  r'|No (?:NVENC capable devices|device available)|OpenEncodeSessionEx failed|Cannot load lib'
+  r'|Failed to (?:initialise|create|open) .*(?:VAAPI|device|session)|Device creation failed',
+  re.IGNORECASE,
+)
+
+PRIORITY_NICE: Final[dict[Priority, int]] = {
+  Priority.normal: 0,
+  Priority.low: 10,
+  Priority.idle: 19,
+}
+
+IONICE_LOWEST: Final[int] = 7
+
+PRIORITY_IONICE: Final[dict[Priority, tuple[int, int | None]]] = {
+  Priority.normal: (psutil.IOPRIO_CLASS_BE, None),
+  Priority.low: (psutil.IOPRIO_CLASS_BE, IONICE_LOWEST),
+  Priority.idle: (psutil.IOPRIO_CLASS_IDLE, None),
+}
+
+
+type Args = list[str]
+
+
+def set_priority(priority: Priority):
+  os.nice(PRIORITY_NICE[priority])
+  ioclass, value = PRIORITY_IONICE[priority]
+
+  try:
+    psutil.Process().ionice(ioclass, value)
+
+  except (AttributeError, psutil.Error):
+    pass
+
+
+def get_error(cmd: str, rc: int, lines: Iterable[str]) -> TranscodeError:
+  """EncoderError if FFmpeg failed in an encoder, else TranscodeError for failures on the source or the output"""
+  errors = [line for line in lines if ENCODER_ERRORS.search(line)]
+
+  if errors:
+    return EncoderError(f'{cmd} exited with code {rc}: {errors[-1]}')
+
+  return TranscodeError(f'{cmd} exited with code {rc}')
+
+
+def get_preexec(priority: Priority, cpus: Cpus | None = None) -> Callable[[], None] | None:
+  if priority is Priority.normal and not cpus:
+    return None
+
+  def preexec():
+    if priority is not Priority.normal:
+      set_priority(priority)
+
+    if cpus:
+      os.sched_setaffinity(0, cpus)
+
+  return preexec
+
+
+@dataclass
+class Process:
+  """Running FFmpeg process"""
+  args: Args
+  priority: Priority = Priority.normal
+  cpus: Cpus | None = None
+
+  popen: Popen | None = field(default=None, repr=False)
+  started: float = NO_TIME
+  finished: float | None = None
+  paused: float = NO_TIME
+  paused_at: float | None = None
+  cpu_time: float = NO_TIME  # user and system time, once it exits
+  lines: deque[str] = field(default_factory=lambda: deque(maxlen=ERROR_LINES), repr=False)
+  reader: Thread | None = field(default=None, repr=False)
+  lock: Lock = field(default_factory=Lock, repr=False, compare=False)
+
+  @property
+  def pid(self) -> int | None:
+    return self.popen.pid if self.popen else None
+
+  @property
+  def is_running(self) -> bool:
+    return self.popen is not None and self.finished is None
+
+  @property
+  def is_paused(self) -> bool:
+    return self.paused_at is not None
+
+  @property
+  def elapsed(self) -> float:
+    """Wall time spent running, excluding time spent paused"""
+    end = self.finished or monotonic()
+    paused = self.paused
+
+    if self.paused_at is not None:
+      paused += end - self.paused_at
+
+    return max(end - self.started - paused, NO_TIME)
+
+  def start(self) -> Process:
+    log.debug(f'Starting process with priority {self.priority} on cores {self.cpus}: {self.args}')
+
+    self.popen = Popen(self.args, stderr=PIPE, preexec_fn=get_preexec(self.priority, self.cpus))
+    self.started = monotonic()
+
+    self.reader = Thread(target=self.read_stderr, daemon=True)
+    self.reader.start()
+
+    return self
+
+  def read_stderr(self):
+    """Pass FFmpeg's output through, and keep its last lines to tell why it failed"""
+    output = getattr(sys.stderr, 'buffer', None)
+    partial = ''
+
+    while chunk := self.popen.stderr.read1(READ_SIZE):
+      if output:
+        output.write(chunk)
+        output.flush()
+
+      *lines, partial = LINE_ENDS.split(partial + chunk.decode(errors='replace'))
+      self.lines.extend(line for line in lines if line)
+
+    if partial:
+      self.lines.append(partial)
+
+  def signal(self, signum: int) -> bool:
+    if not self.is_running:
+      return False
+
+    try:
+      self.popen.send_signal(signum)
+
+    except ProcessLookupError:
+      return False
+
+    return True
+
+  def pause(self):
+    with self.lock:
+      if self.is_paused or not self.signal(signal.SIGSTOP):
+        return
+
+      self.paused_at = monotonic()
+      log.info(f'Paused process {self.pid}')
+
+  def resume(self):
+    with self.lock:
+      if not self.is_paused:
+        return
+
+      self.signal(signal.SIGCONT)
+      self.paused += monotonic() - self.paused_at
+      self.paused_at = None
+
+      log.info(f'Resumed process {self.pid}')
+
+  def reap(self) -> int:
+    """Wait for the process to exit, and record the CPU time it used"""
+    try:
+      _, status, usage = os.wait4(self.popen.pid, 0)
+
+    except ChildProcessError:
+      return self.popen.wait()
+
+    self.cpu_time = usage.ru_utime + usage.ru_stime
+    self.popen.returncode = os.waitstatus_to_exitcode(status)
+
+    return self.popen.returncode
+
+  def wait(self) -> int:
+    rc = self.reap()
+
+    with self.lock:
+      self.finished = monotonic()
+
+      if self.paused_at is not None:
+        self.paused += self.finished - self.paused_at
+        self.paused_at = None
+
+    if self.reader:
+      self.reader.join()
+
+    if rc:
+      raise get_error(self.args[0], rc, self.lines)
+
+    return rc
+
+  def run(self) -> int:
+    return self.start().wait()
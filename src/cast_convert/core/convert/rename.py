@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import logging
+from typing import Final, TYPE_CHECKING
+
+from .transcode import TranscodeFormats
+from ..media.codecs import Container
+from ..model.video import Video
+
+
+if TYPE_CHECKING:
+  from ..model.device import Device
+
+
+log = logging.getLogger(__name__)
+
+UNRENAMEABLE: Final[frozenset[Container]] = frozenset({Container.invalid, Container.unknown})
+
+
+class RenameFormats(TranscodeFormats):
+  """Formats fixed by renaming the file to its container's extension"""
+
+
+def get_rename(device: Device, video: Video) -> RenameFormats | None:
+  """Return the container if the file's extension is the only problem"""
+  if not video.invalid_extension:
+    return None
+
+  container = video.formats.container
+
+  if container in UNRENAMEABLE or not container.to_extension():
+    return None
+
+  if not device.can_play(video):
+    return None
+
+  log.info(f'Only the extension of {video.path} is wrong, planning a rename to .{container.to_extension()}')
+  return RenameFormats(container=container)
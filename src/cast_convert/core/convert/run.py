@@ -1,36 +1,79 @@
 from __future__ import annotations
 
 import logging
+import re
 from asyncio import BoundedSemaphore, TaskGroup, to_thread
-from collections.abc import Iterable
+from collections.abc import Callable, Iterable, Mapping
 from enum import StrEnum, auto
 from pathlib import Path
 from shlex import quote
+from time import monotonic
 from typing import Final
 
 import ffmpeg
 from ffmpeg.nodes import FilterableStream, OutputStream
 
-from .transcode import should_transcode, show_transcode_dismissal
+from .affinity import Cpus
+from .cache import OutputCache, get_content_digest, get_key
+from .canary import CANARY_SECONDS, CANARY_SUFFIX, check_canary, get_canary_dir, needs_canary
+from .encoders import HWACCEL_DEVICE, get_available, get_capabilities
+from .faststart import FaststartFormats, faststart, get_faststart
+from .fixup import FixupFormats, HVC1, get_bitstream_filter, get_fixup, needs_tag_fixup, verify_fixup
+from .governor import governed
+from .cost import estimate_plan_cost, get_job_cost, get_job_duration, get_work
+from .jobs import Job, Target
+from .journal import JobState, Journal
+from .preflight import preflight
+from .process import Process
+from .rename import RenameFormats, get_rename
+from .schedule import Scheduler
+from .settings import DEFAULT_SETTINGS, Settings
+from .stats import DEFAULT_STATS, JobStats, Stats
+from .subtitles import SidecarFormats, extract_sidecars, get_sidecar, get_sidecar_path, write_vtt
+from .storage import Storage, estimate_output_size, get_partial, get_scratch_path, link, move, rename
+from .transcode import TranscodeAudioProfile, TranscodeFormats, should_transcode, show_transcode_dismissal
+from .verify import NO_SAMPLES, verify_output
 from ..base import DEFAULT_REPLACE, DEFAULT_THREADS, JOIN_COMMAND, first, get_error_handler
-from ..enums import Strategy
-from ..exceptions import UnknownFormat
+from ..enums import Priority, Speed, Strategy
+from ..exceptions import EncoderError, PreflightError, StorageError, UnknownFormat
+from ..media.base import OnTranscodeErr
 from ..media.codecs import AudioCodec, Codecs, Container, Subtitle, VideoCodec
 from ..media.formats import Formats
-from ..model.device import load_device_with_name
+from ..model.device import DEVICE_SEP, Device, load_device_with_name, split_names
 from ..model.video import Video
-from ..parse import AUDIO_ENCODERS, Alias, Aliases, Extension, SUBTITLE_ENCODERS, VIDEO_ENCODERS
+from ..parse import AUDIO_ENCODERS, Alias, Aliases, Extension, FmtAliases, SUBTITLE_ENCODERS, VIDEO_ENCODERS
 
 
 log = logging.getLogger(__name__)
 
 DOT: Final[str] = '.'
 
+LINK_CMD: Final[str] = 'ln'
+MOVE_CMD: Final[str] = 'mv -n'
+
 DEFAULT_EXT: Final[Extension] = Container.matroska.to_extension()
 TRANSCODE_SUFFIX: Final[str] = '_transcoded'
+TARGET_SEP: Final[str] = '-'
+SLUG_SEP: Final[str] = '_'
+SLUG_PATTERN: Final[re.Pattern] = re.compile(r'\W+')
+
+PROBE_JOBS: Final[int] = DEFAULT_THREADS
+NO_SPEED: Final[float] = 0.0
+
+VIDEO_STREAM: Final[str] = 'v:0'
+FIRST_VIDEO_STREAM: Final[str] = 'v:0?'  # optional in maps, but not in filter graphs
+AUDIO_STREAM: Final[str] = 'a:{}'
+FIRST_AUDIO_STREAM: Final[str] = 'a:0?'
+SUBTITLE_STREAM: Final[str] = 's:0?'
 
 SCALE_RESOLUTION: Final[int] = -2  # see: https://stackoverflow.com/a/29582287
-HWACCEL_DEVICE: Final[Path] = Path('/dev/dri/renderD128')
+
+# VAAPI encoders need frames uploaded to the GPU
+HWUPLOAD_SUFFIX: Final[str] = '_vaapi'
+HWUPLOAD_FORMAT: Final[str] = 'nv12'
+FORMAT_FILTER: Final[str] = 'format'
+HWUPLOAD_FILTER: Final[str] = 'hwupload'
+SPLIT_FILTER: Final[str] = 'split'
 
 
 class FfmpegOpt(StrEnum):
@@ -51,8 +94,17 @@ class FfmpegOpt(StrEnum):
 
   scale = auto()
   threads = auto()
+  flags = auto()
+
+  preset = auto()
+  deadline = auto()
+  cpu_used = 'cpu-used'
+
+  bsf_v = 'bsf:v'
+  tag_v = 'tag:v'
 
   vsync = auto()
+  t = auto()
 
 
 class FfmpegArg(StrEnum):
@@ -70,6 +122,8 @@ class FfmpegVal(StrEnum):
 
   vfr = auto()
 
+  good = auto()
+
 
 type Option = FfmpegOpt | str
 type Arg = FfmpegArg | str
@@ -102,8 +156,46 @@ GLOBAL_ARGS: Final[Args] = [
 
 GLOBAL_OPTS: Final[Options] = {}
 
+X26X_PRESETS: Final[dict[Speed, Options]] = {
+  Speed.quality: {FfmpegOpt.preset: 'medium'},
+  Speed.balanced: {FfmpegOpt.preset: 'faster'},
+  Speed.fast: {FfmpegOpt.preset: 'veryfast'},
+  Speed.fastest: {FfmpegOpt.preset: 'superfast'},
+}
 
-def get_encoder(codec: Codecs | Subtitle) -> Alias:
+VPX_PRESETS: Final[dict[Speed, Options]] = {
+  Speed.quality: {FfmpegOpt.deadline: FfmpegVal.good, FfmpegOpt.cpu_used: 1},
+  Speed.balanced: {FfmpegOpt.deadline: FfmpegVal.good, FfmpegOpt.cpu_used: 2},
+  Speed.fast: {FfmpegOpt.deadline: FfmpegVal.good, FfmpegOpt.cpu_used: 4},
+  Speed.fastest: {FfmpegOpt.deadline: FfmpegVal.good, FfmpegOpt.cpu_used: 5},
+}
+
+ENCODER_PRESETS: Final[dict[Alias, dict[Speed, Options]]] = {
+  'libx264': X26X_PRESETS,
+  'libx265': X26X_PRESETS,
+  'libvpx': VPX_PRESETS,
+  'libvpx-vp9': VPX_PRESETS,
+}
+
+ON_TRANSCODE_ERR: Final[tuple[OnTranscodeErr, ...]] = (
+  OnTranscodeErr.cycle_video_encoders,
+  OnTranscodeErr.cycle_audio_encoders,
+)
+
+FALLBACKS: Final[dict[OnTranscodeErr, tuple[FfmpegOpt, FmtAliases]]] = {
+  OnTranscodeErr.cycle_video_encoders: (FfmpegOpt.vcodec, VIDEO_ENCODERS),
+  OnTranscodeErr.cycle_audio_encoders: (FfmpegOpt.acodec, AUDIO_ENCODERS),
+}
+
+SCALE_FLAGS: Final[dict[Speed, str]] = {
+  Speed.quality: 'bicubic',
+  Speed.balanced: 'bicubic',
+  Speed.fast: 'bilinear',
+  Speed.fastest: 'fast_bilinear',
+}
+
+
+def get_encoder(codec: Codecs | Subtitle, skip: Iterable[Alias] = ()) -> Alias:
   encoders: Aliases
 
   match codec:
@@ -119,7 +211,23 @@ def get_encoder(codec: Codecs | Subtitle) -> Alias:
     case obj:
       raise TypeError(f"{obj} not a codec")
 
-  return first(encoders)
+  encoders = [encoder for encoder in encoders if encoder not in skip] or encoders
+  return first(get_available(encoders) or encoders)
+
+
+def get_fallback(opts: Options, skip: Iterable[Alias] = ()) -> Alias | None:
+  """Return the encoder to skip on the next attempt, if another encoder can take its place"""
+  for on_error in ON_TRANSCODE_ERR:
+    option, codecs = FALLBACKS[on_error]
+
+    if (encoder := opts.get(option)) is None or encoder is FfmpegVal.copy:
+      continue
+
+    for encoders in codecs.values():
+      if encoder in encoders and len(get_available([e for e in encoders if e not in skip])) > 1:
+        return encoder
+
+  return None
 
 
 def transcode_video(
@@ -128,24 +236,164 @@ def transcode_video(
   replace: bool = DEFAULT_REPLACE,
   threads: int = DEFAULT_THREADS,
   subtitle: Path | None = None,
+  scratch: Path | None = None,
+  priority: Priority = Priority.normal,
+  cpus: Cpus | None = None,
+  speed: Speed | None = None,
+  device: Device | None = None,
+  verify: int = NO_SAMPLES,
 ) -> Video:
-  stream, converted = get_stream(video, formats, threads, replace, subtitle)
+  process, converted = start_transcode(video, formats, threads, replace, subtitle, scratch, priority, cpus, speed)
+  return finish_transcode(video, formats, process, converted, replace, scratch, device, verify, priority)
+
+
+def start_transcode(
+  video: Video,
+  formats: Formats,
+  threads: int = DEFAULT_THREADS,
+  replace: bool = DEFAULT_REPLACE,
+  subtitle: Path | None = None,
+  scratch: Path | None = None,
+  priority: Priority = Priority.normal,
+  cpus: Cpus | None = None,
+  speed: Speed | None = None,
+  skip: Iterable[Alias] = (),
+) -> tuple[Process, Path]:
+  stream, converted = get_stream(video, formats, threads, replace, subtitle, scratch, speed, skip=skip)
   cmd = get_ffmpeg_cmd(stream, video.path)
 
   log.info(f'Running command: {cmd}')
-  stream.run()  # type: ignore
+  process = Process(stream.compile(), priority, cpus)  # type: ignore
+
+  return process.start(), converted
+
+
+def finish_transcode(
+  video: Video,
+  formats: Formats,
+  process: Process,
+  converted: Path,
+  replace: bool = DEFAULT_REPLACE,
+  scratch: Path | None = None,
+  device: Device | None = None,
+  verify: int = NO_SAMPLES,
+  priority: Priority = Priority.normal,
+) -> Video:
+  process.wait()
+  return place_output(video, formats, converted, replace, scratch, device, verify, priority)
+
+
+def place_output(
+  video: Video,
+  formats: Formats,
+  converted: Path,
+  replace: bool = DEFAULT_REPLACE,
+  scratch: Path | None = None,
+  device: Device | None = None,
+  verify: int = NO_SAMPLES,
+  priority: Priority = Priority.normal,
+) -> Video:
+  """Check the converted video and move it next to, or over, the original"""
+  if isinstance(formats, FixupFormats):
+    verify_fixup(video, formats, converted)
+
+  if device:
+    verify_output(video, device, converted, verify, priority)
 
   original: Path = video.path
+  destination: Path = converted
+
+  if replace:
+    destination = original.with_suffix(converted.suffix)
+
+  elif scratch:
+    destination = get_new_path(video, formats, replace)
 
-  if replace and converted:
-    if original != (new_name := original.with_suffix(converted.suffix)):
-      original.unlink(missing_ok=True)
+  if destination != converted:
+    converted = move(converted, destination)
 
-    converted = converted.rename(new_name)
+  if replace and original != destination:
+    original.unlink(missing_ok=True)
 
   return Video.from_path(converted)
 
 
+def run_canary(job: Job, settings: Settings = DEFAULT_SETTINGS) -> float | None:
+  """Encode the first seconds of the video to scratch, returns the measured realtime speed"""
+  scratch = get_canary_dir(settings.scratch)
+  stream, canary = get_stream(
+    job.video, job.formats, job.threads, False, settings.subtitle, scratch, job.speed, CANARY_SECONDS, CANARY_SUFFIX,
+    job.skip,
+  )
+
+  log.info(f'Running canary encode: {get_ffmpeg_cmd(stream, job.video.path)}')
+  job.process = Process(stream.compile(), settings.priority, job.cpus)  # type: ignore
+
+  try:
+    job.process.run()
+
+  except BaseException:
+    canary.unlink(missing_ok=True)
+    raise
+
+  return check_canary(job, canary, job.process.elapsed)
+
+
+def rename_video(
+  video: Video,
+  formats: RenameFormats,
+  replace: bool = DEFAULT_REPLACE,
+) -> Video:
+  destination = get_rename_path(video, formats, replace)
+
+  if replace:
+    renamed = rename(video.path, destination)
+
+  else:
+    renamed = link(video.path, destination)
+
+  log.info(f'Renamed {video.path} to {renamed}')
+  return Video.from_path(renamed)
+
+
+def faststart_video(
+  video: Video,
+  formats: FaststartFormats,
+  replace: bool = DEFAULT_REPLACE,
+) -> Video:
+  output = video.path if replace else get_new_path(video, formats, replace)
+
+  if not (moved := faststart(video.path, output)):
+    log.info(f'{video.path} is already faststart')
+    return video
+
+  return Video.from_path(moved)
+
+
+def get_rename_path(
+  video: Video,
+  formats: RenameFormats,
+  replace: bool = DEFAULT_REPLACE,
+) -> Path:
+  new_path = get_new_path(video, formats, replace)
+
+  if replace:
+    return video.path.with_suffix(new_path.suffix)
+
+  return new_path
+
+
+def get_rename_cmd(
+  video: Video,
+  formats: RenameFormats,
+  replace: bool = DEFAULT_REPLACE,
+) -> str:
+  cmd = MOVE_CMD if replace else LINK_CMD
+  destination = get_rename_path(video, formats, replace)
+
+  return JOIN_COMMAND.join((cmd, quote(str(video.path)), quote(str(destination))))
+
+
 def get_ffmpeg_cmd(
   stream: OutputStream,
   path: Path,
@@ -166,23 +414,37 @@ def get_stream(
   threads: int = DEFAULT_THREADS,
   replace: bool = DEFAULT_REPLACE,
   subtitle: Path | None = None,
+  scratch: Path | None = None,
+  speed: Speed | None = None,
+  duration: float | None = None,
+  suffix: str = TRANSCODE_SUFFIX,
+  skip: Iterable[Alias] = (),
 ) -> tuple[OutputStream, Path]:
-  input_opts = get_input_opts(formats)
-  output_opts = get_output_opts(video, formats, threads)
-  new_path = get_new_path(video, formats, replace)
+  output_opts = get_output_opts(video, formats, threads, speed, skip)
+  input_opts = get_input_opts(formats, output_opts)
+  new_path = get_new_path(video, formats, replace, suffix, scratch)
+
+  if duration:
+    output_opts[FfmpegOpt.t] = duration
 
-  stream = ffmpeg.input(
+  source = ffmpeg.input(
     str(video.path),
     **input_opts,
   )
 
-  if filters := get_video_filters(stream, formats):
+  stream = source
+
+  if filters := get_video_filters(source, formats, speed):
     if output_opts.get(FfmpegOpt.vcodec) is FfmpegVal.copy:
       output_opts.pop(FfmpegOpt.vcodec)
 
     stream = filters
 
-  stream = stream.output(
+  if needs_hwupload(output_opts):
+    stream = get_hwupload(source[VIDEO_STREAM] if stream is source else stream)
+
+  stream = ffmpeg.output(
+    *get_mapped_streams(source, stream, formats),
     str(new_path),
     **output_opts,
   )
@@ -195,11 +457,107 @@ def get_stream(
   return stream, new_path
 
 
+def get_mapped_streams(
+  source: FilterableStream,
+  stream: FilterableStream,
+  formats: Formats,
+) -> list[FilterableStream]:
+  profile = formats.audio_profile
+  track = profile.track if isinstance(profile, TranscodeAudioProfile) else None
+
+  if stream is source and track is None:
+    return [stream]
+
+  # filtered video only maps its own output, so map the rest of the streams explicitly
+  video = source[FIRST_VIDEO_STREAM] if stream is source else stream
+  audio = source[FIRST_AUDIO_STREAM] if track is None else source[AUDIO_STREAM.format(track)]
+
+  return [video, audio, source[SUBTITLE_STREAM]]
+
+
+def get_slug(name: str) -> str:
+  return SLUG_PATTERN.sub(SLUG_SEP, name.casefold()).strip(SLUG_SEP)
+
+
+def get_target_path(video: Video, target: Target, scratch: Path | None = None) -> Path:
+  slug = TARGET_SEP.join(get_slug(device.name) for device in target.devices)
+  return get_new_path(video, target.formats, False, f'{TRANSCODE_SUFFIX}{TARGET_SEP}{slug}', scratch)
+
+
+def has_video_filters(formats: Formats, opts: Options) -> bool:
+  return bool((profile := formats.video_profile) and profile.resolution) or needs_hwupload(opts)
+
+
+def get_targets_stream(
+  video: Video,
+  targets: list[Target],
+  threads: int = DEFAULT_THREADS,
+  scratch: Path | None = None,
+  speed: Speed | None = None,
+  skip: Iterable[Alias] = (),
+) -> tuple[OutputStream, list[Path]]:
+  """Build one graph that decodes the video once and writes an output for each target"""
+  target_opts = [get_output_opts(video, target.formats, threads, speed, skip) for target in targets]
+  input_opts: Options = {}
+
+  for target, output_opts in zip(targets, target_opts):
+    input_opts |= get_input_opts(target.formats, output_opts)
+
+  source = ffmpeg.input(str(video.path), **input_opts)
+  decoded = source[VIDEO_STREAM]
+
+  # filter graph outputs can only be used once, so filtered targets each get a copy of the decoded video
+  if (filtered := sum(map(has_video_filters, (target.formats for target in targets), target_opts))) > 1:
+    split = decoded.filter_multi_output(SPLIT_FILTER, filtered)
+    copies = iter([split[index] for index in range(filtered)])
+
+  else:
+    copies = iter([decoded])
+
+  outputs = list[OutputStream]()
+  paths = list[Path]()
+
+  for target, output_opts in zip(targets, target_opts):
+    stream = decoded
+
+    if has_video_filters(target.formats, output_opts):
+      stream = next(copies)
+
+      if filters := get_video_filters(stream, target.formats, speed):
+        if output_opts.get(FfmpegOpt.vcodec) is FfmpegVal.copy:
+          output_opts.pop(FfmpegOpt.vcodec)
+
+        stream = filters
+
+      if needs_hwupload(output_opts):
+        stream = get_hwupload(stream)
+
+    path = get_target_path(video, target, scratch)
+    outputs.append(ffmpeg.output(*get_mapped_streams(source, stream, target.formats), str(path), **output_opts))
+    paths.append(path)
+
+  stream = ffmpeg.merge_outputs(*outputs).global_args(
+    *GLOBAL_ARGS,
+    **GLOBAL_OPTS,
+  )
+
+  return stream, paths
+
+
+def needs_hwupload(opts: Options) -> bool:
+  return str(opts.get(FfmpegOpt.vcodec, '')).endswith(HWUPLOAD_SUFFIX)
+
+
+def get_hwupload(stream: FilterableStream) -> FilterableStream:
+  return stream.filter(FORMAT_FILTER, HWUPLOAD_FORMAT).filter(HWUPLOAD_FILTER)
+
+
 def get_new_path(
   video: Video,
   formats: Formats,
   replace: bool = DEFAULT_REPLACE,
   suffix: str = TRANSCODE_SUFFIX,
+  scratch: Path | None = None,
 ) -> Path:
   container, video_profile, audio, subtitle = formats
   # codec, *_ = video_profile
@@ -218,6 +576,9 @@ def get_new_path(
     .with_suffix(ext)
   )
 
+  if scratch:
+    return get_scratch_path(new_path, scratch)
+
   return new_path
 
 
@@ -225,15 +586,20 @@ def get_output_opts(
   video: Video,
   formats: Formats,
   threads: int = DEFAULT_THREADS,
+  speed: Speed | None = None,
+  skip: Iterable[Alias] = (),
 ) -> Options:
   opts: Options = DEFAULT_OUTPUT_OPTS.copy()
   opts[FfmpegOpt.threads] = threads
 
+  if isinstance(formats, FixupFormats):
+    return opts | get_fixup_opts(video, formats)
+
   if (profile := formats.audio_profile) and (codec := profile.codec):
-    opts[FfmpegOpt.acodec] = get_encoder(codec)
+    opts[FfmpegOpt.acodec] = get_encoder(codec, skip)
 
   if (profile := formats.video_profile) and (codec := profile.codec):
-    opts[FfmpegOpt.vcodec] = get_encoder(codec)
+    opts[FfmpegOpt.vcodec] = get_encoder(codec, skip)
 
   if subtitle := formats.subtitle:
     opts[FfmpegOpt.scodec] = get_encoder(subtitle)
@@ -252,14 +618,32 @@ def get_output_opts(
 
     if FfmpegOpt.vcodec not in opts:
       codec = video.formats.video_profile.codec
-      opts[FfmpegOpt.vcodec] = get_encoder(codec)
+      opts[FfmpegOpt.vcodec] = get_encoder(codec, skip)
+
+  if speed and (presets := ENCODER_PRESETS.get(opts[FfmpegOpt.vcodec])):
+    opts |= presets[speed]
+
+  return opts
+
+
+def get_fixup_opts(video: Video, formats: FixupFormats) -> Options:
+  opts: Options = {}
+
+  if (level := formats.video_profile.level) and (bsf := get_bitstream_filter(video, level)):
+    opts[FfmpegOpt.bsf_v] = bsf
+
+  if needs_tag_fixup(video):
+    opts[FfmpegOpt.tag_v] = HVC1
 
   return opts
 
 
-def get_input_opts(formats: Formats) -> Options:
+def get_input_opts(formats: Formats, output_opts: Options | None = None) -> Options:
   opts: Options = DEFAULT_INPUT_OPTS.copy()
 
+  if output_opts and needs_hwupload(output_opts):
+    opts[FfmpegOpt.vaapi_device] = FfmpegVal.vaapi_device
+
   if not formats.video_profile:
     return opts
 
@@ -271,6 +655,7 @@ def get_input_opts(formats: Formats) -> Options:
 def get_video_filters(
   stream: FilterableStream,
   formats: Formats,
+  speed: Speed | None = None,
 ) -> FilterableStream | None:
   if not (profile := formats.video_profile):
     return None
@@ -285,54 +670,578 @@ def get_video_filters(
       FfmpegOpt.scale,
       height,  # resolution
       FfmpegVal.scale_resolution,
+      **get_scale_opts(speed),
     )
 
   return filters
 
 
-def convert_from_name_path(
+def get_scale_opts(speed: Speed | None = None) -> Options:
+  if not speed:
+    return {}
+
+  return {FfmpegOpt.flags: SCALE_FLAGS[speed]}
+
+
+def plan_job(
   name: str,
   path: Path,
-  replace: bool = DEFAULT_REPLACE,
-  threads: int = DEFAULT_THREADS,
   subtitle: Path | None = None,
-) -> Video | None:
-  video = Video.from_path(path)
+  journal: Journal | None = None,
+  fixup: bool = False,
+  faststart: bool = False,
+  sidecar: bool = False,
+  video: Video | None = None,
+  strict: bool = False,
+) -> Job | None:
+  """Job to convert the video, or None if it plays already, or would fail unless `strict` is set"""
   device = load_device_with_name(name)
 
+  if journal and journal.is_done(path, device.name):
+    log.info(f'Already converted {path} for {device.name}, skipping.')
+    return None
+
+  video = video or Video.from_path(path)
+
+  if formats := get_rename(device, video):
+    return record_planned(Job(path, device, video, formats), journal)
+
+  if fixup and (formats := get_fixup(device, video)):
+    return record_planned(Job(path, device, video, formats), journal)
+
+  if faststart and (formats := get_faststart(device, video)):
+    return record_planned(Job(path, device, video, formats), journal)
+
+  if sidecar and (formats := get_sidecar(device, video, subtitle)):
+    return record_planned(Job(path, device, video, formats), journal)
+
   if not should_transcode(device, video, subtitle):
     show_transcode_dismissal(video, device)
+
+    if journal:
+      journal.record(path, device.name, JobState.done)
+
     return None
 
   if not (formats := device.transcode_to(video)):
     return None
 
   try:
-    return transcode_video(video, formats, replace, threads, subtitle)
+    formats = preflight(device, video, formats)
+
+  except PreflightError as e:
+    log.error(f'[{e}] Not converting {path}, the conversion would fail.')
+
+    if journal:
+      journal.record(path, device.name, JobState.failed, error=str(e))
+
+    if strict:
+      raise
+
+    return None
+
+  job = Job(path, device, video, formats)
+  log.info(f'Planned {job.action} of {path} for {device.name}, estimated cost {get_job_cost(job):.1f} core-seconds')
+
+  return record_planned(job, journal)
+
+
+def record_planned(job: Job, journal: Journal | None = None) -> Job:
+  if journal:
+    journal.record(job.path, job.device.name, JobState.planned)
+
+  return job
+
+
+def plan_targets(
+  name: str,
+  path: Path,
+  subtitle: Path | None = None,
+  journal: Journal | None = None,
+  fixup: bool = False,
+  faststart: bool = False,
+  sidecar: bool = False,
+  video: Video | None = None,
+  strict: bool = False,
+) -> Job | None:
+  """Plan one job with an output for each group of the named devices that needs the same formats"""
+  names = split_names(name)
+
+  if len(names) <= 1:
+    return plan_job(name, path, subtitle, journal, fixup, faststart, sidecar, video, strict)
+
+  video = video or Video.from_path(path)
+
+  # outputs are remuxed or re-encoded, fixups and renames in place would change the source for the other devices
+  jobs = [
+    job
+    for part in names
+    if (job := plan_job(part, path, subtitle, journal, video=video, strict=strict))
+  ]
+
+  if not jobs:
+    return None
+
+  groups = dict[TranscodeFormats, list[Device]]()
+
+  for job in jobs:
+    groups.setdefault(TranscodeFormats(*job.formats), []).append(job.device)
+
+  targets = [Target(formats, tuple(devices)) for formats, devices in groups.items()]
+
+  if len(jobs) == 1 and len(targets) == 1:
+    return first(jobs)
+
+  main = max(targets, key=lambda target: estimate_plan_cost(target.action, video, target.formats))
+  log.info(f'Planned {len(targets)} outputs for {len(jobs)} devices from one decode of {path}')
+
+  return Job(path, first(main.devices), video, main.formats, targets=targets)
+
+
+def get_planner(settings: Settings = DEFAULT_SETTINGS) -> Callable[..., Job | None]:
+  return plan_targets if settings.each else plan_job
+
+
+def run_job(
+  job: Job,
+  settings: Settings = DEFAULT_SETTINGS,
+  journal: Journal | None = None,
+) -> Video | None:
+  if job.targets:
+    return run_targets_job(job, settings, journal)
+
+  path, device, video, formats = job.path, job.device, job.video, job.formats
+  replace, subtitle, scratch = settings.replace, settings.subtitle, settings.scratch
+
+  match formats:
+    case RenameFormats():
+      output = get_rename_path(video, formats, replace)
+
+    case FaststartFormats():
+      output = video.path if replace else get_new_path(video, formats, replace)
+
+    case SidecarFormats():
+      output = get_sidecar_path(video.path)
+
+    case _:
+      output = get_new_path(video, formats, replace, scratch=scratch)
+
+  if journal:
+    journal.record(path, device.name, JobState.running, output, speed=job.speed)
+
+  sidecars = list[Path]()
+
+  try:
+    match formats:
+      case RenameFormats():
+        converted = rename_video(video, formats, replace)
+
+      case FaststartFormats():
+        converted = faststart_video(video, formats, replace)
+
+      case SidecarFormats():
+        sidecars = extract_sidecars(video, settings.priority)
+        converted = video
+
+      case _:
+        converted = transcode_job(job, settings)
 
   except Exception as e:
     log.exception(e)
     log.error(f'Error while converting {video} to {formats}')
 
+    if journal:
+      journal.record(path, device.name, JobState.failed, output, error=str(e), speed=job.speed)
+
     return None
 
+  if isinstance(formats, SidecarFormats) and subtitle:
+    write_vtt(subtitle, get_sidecar_path(converted.path, len(sidecars)))
+
+  if journal:
+    record_converted(journal, path, device.name, converted.path, job.speed)
+
+  record_stats(job, converted.size)
+  show_throughput(job)
+
+  return converted
+
+
+def transcode_targets(job: Job, settings: Settings = DEFAULT_SETTINGS) -> list[Video]:
+  """Transcode the targets from one decode, with the same cache and encoder fallback as transcode_job"""
+  cache = get_output_cache(settings)
+  keys = [get_cache_key(job, settings, target) if cache else None for target in job.targets]
+
+  cached = [
+    fetch_cached_target(job, target, cache, key, settings) if cache and key else None
+    for target, key in zip(job.targets, keys)
+  ]
+
+  if not (pending := [target for target, output in zip(job.targets, cached) if not output]):
+    return cached
+
+  encoded = fall_back(job, lambda: encode_targets(job, pending, settings), [target.formats for target in pending])
+  outputs = iter(encoded)
+  converted = [output or next(outputs) for output in cached]
+
+  if cache:
+    for key, output, hit in zip(keys, converted, cached):
+      if key and not hit:
+        cache.store(key, output.path)
+
+  return converted
+
+
+def encode_targets(job: Job, targets: list[Target], settings: Settings = DEFAULT_SETTINGS) -> list[Video]:
+  video, scratch, priority = job.video, settings.scratch, settings.priority
+  stream, paths = get_targets_stream(video, targets, job.threads, scratch, job.speed, job.skip)
+
+  log.info(f'Converting {job.path} to {len(targets)} outputs, predicted to take {get_job_duration(job):.0f}s')
+  log.info(f'Running command: {get_ffmpeg_cmd(stream, video.path)}')
+  job.process = Process(stream.compile(), priority, job.cpus)  # type: ignore
+
+  try:
+    job.process.run()
+
+    for target, path in zip(targets, paths):
+      verify_job(job, path, target.devices, settings)
+
+  except BaseException:
+    for path in paths:
+      path.unlink(missing_ok=True)
+
+    raise
+
+  return [place_target(video, target, path, scratch) for target, path in zip(targets, paths)]
+
+
+def place_target(video: Video, target: Target, path: Path, scratch: Path | None = None) -> Video:
+  if scratch:
+    path = move(path, get_target_path(video, target))
+
+  return Video.from_path(path)
+
+
+def fetch_cached_target(
+  job: Job,
+  target: Target,
+  cache: OutputCache,
+  key: str,
+  settings: Settings = DEFAULT_SETTINGS,
+) -> Video | None:
+  """Place a previous conversion of the same source for the target, or None if there isn't one"""
+  video, scratch = job.video, settings.scratch
+
+  if not (path := cache.fetch(key, get_target_path(video, target, scratch))):
+    return None
+
+  verify_job(job, path, target.devices, settings)
+  return place_target(video, target, path, scratch)
+
+
+def run_targets_job(
+  job: Job,
+  settings: Settings = DEFAULT_SETTINGS,
+  journal: Journal | None = None,
+) -> Video | None:
+  path, video = job.path, job.video
+  names = [device.name for target in job.targets for device in target.devices]
+
+  if settings.replace:
+    log.warning(f"Not replacing {path}, it's converted for {len(names)} devices.")
+
+  if journal:
+    for name in names:
+      journal.record(path, name, JobState.running, speed=job.speed)
+
+  try:
+    converted = transcode_targets(job, settings)
+
+  except Exception as e:
+    log.exception(e)
+    log.error(f'Error while converting {video} for {", ".join(names)}')
+
+    if journal:
+      for name in names:
+        journal.record(path, name, JobState.failed, error=str(e), speed=job.speed)
+
+    return None
+
+  if journal:
+    for target, output in zip(job.targets, converted):
+      for device in target.devices:
+        record_converted(journal, path, device.name, output.path, job.speed)
+
+  record_stats(job, sum(output.size for output in converted))
+  show_throughput(job)
+
+  return first(converted)
+
+
+def transcode_job(job: Job, settings: Settings = DEFAULT_SETTINGS) -> Video:
+  """Transcode the job, or reuse a cached conversion, falling back to the next available encoder when one fails"""
+  cache = get_output_cache(settings)
+
+  # key the request before it's replaced, or encoders are skipped
+  key = get_cache_key(job, settings) if cache else None
+
+  if cache and key and (converted := fetch_cached(job, cache, key, settings)):
+    return converted
+
+  converted = fall_back(job, lambda: encode_job(job, settings), [job.formats])
+
+  if cache and key:
+    cache.store(key, converted.path)
+
+  return converted
+
+
+def encode_job(job: Job, settings: Settings = DEFAULT_SETTINGS) -> Video:
+  video, formats, replace, scratch = job.video, job.formats, settings.replace, settings.scratch
+
+  if settings.canary and needs_canary(job):
+    run_canary(job, settings)
+
+  log.info(f'Converting {job.path} with {job.threads} threads, predicted to take {get_job_duration(job):.0f}s')
+  job.process, output = start_transcode(
+    video, formats, job.threads, replace, settings.subtitle, scratch, settings.priority, job.cpus, job.speed,
+    job.skip,
+  )
+
+  job.process.wait()
+  verify_job(job, output, (job.device,), settings)
+
+  return place_output(video, formats, output, replace, scratch, priority=settings.priority)
+
+
+def verify_job(job: Job, path: Path, devices: Iterable[Device], settings: Settings = DEFAULT_SETTINGS):
+  """Check the output before it can replace anything, and count the time it takes toward the job"""
+  start = monotonic()
+
+  try:
+    for device in devices:
+      verify_output(job.video, device, path, settings.verify, settings.priority)
+
+  finally:
+    job.verified += monotonic() - start
+
+
+def fall_back[T](job: Job, transcode: Callable[[], T], formats: Iterable[Formats]) -> T:
+  """Run the transcode, retrying with the next available encoder while FFmpeg fails in one"""
+  formats = list(formats)
+
+  while True:
+    try:
+      return transcode()
+
+    # only encoder failures, a broken source or a failed verification would fail with every encoder
+    except EncoderError as e:
+      if not (encoder := get_job_fallback(job, formats)):
+        raise
+
+      # only this job skips it, the encoder can still work for other sources
+      log.warning(f'[{e}] {encoder} failed on {job.path}, retrying with the next encoder.')
+      job.skip.add(encoder)
+
+
+def get_job_fallback(job: Job, formats: Iterable[Formats]) -> Alias | None:
+  for fmt in formats:
+    opts = get_output_opts(job.video, fmt, job.threads, job.speed, job.skip)
+
+    if encoder := get_fallback(opts, job.skip):
+      return encoder
+
+  return None
+
+
+def get_output_cache(settings: Settings = DEFAULT_SETTINGS) -> OutputCache | None:
+  return OutputCache(settings.cache, settings.cache_size) if settings.cache else None
+
+
+def get_cache_key(job: Job, settings: Settings = DEFAULT_SETTINGS, target: Target | None = None) -> str:
+  """Key of the output from the source's content, the devices, the requested formats and the FFmpeg build"""
+  formats, devices = (target.formats, target.devices) if target else (job.formats, (job.device,))
+  names = DEVICE_SEP.join(device.name for device in devices)
+
+  digest = get_content_digest(job.path)
+  subtitle = get_content_digest(settings.subtitle) if settings.subtitle else ''
+  version = capabilities.version if (capabilities := get_capabilities()) else ''
+
+  return get_key(digest, names, repr(formats), str(job.speed), subtitle, version)
+
+
+def fetch_cached(job: Job, cache: OutputCache, key: str, settings: Settings = DEFAULT_SETTINGS) -> Video | None:
+  """Place a previous conversion of the same source instead of running FFmpeg, or None if there isn't one"""
+  video, formats, replace, scratch = job.video, job.formats, settings.replace, settings.scratch
+  output = get_new_path(video, formats, replace, scratch=scratch)
+
+  if not cache.fetch(key, output):
+    return None
+
+  verify_job(job, output, (job.device,), settings)
+  return place_output(video, formats, output, replace, scratch, priority=settings.priority)
+
+
+def show_throughput(job: Job):
+  if not (process := job.process):
+    return
+
+  speed = job.video.duration / elapsed if (elapsed := process.elapsed) else NO_SPEED
+  preset = f' at {job.speed} speed' if job.speed else ''
+
+  log.info(
+    f'Converted {job.path} in {elapsed:.1f}s, paused for {process.paused:.1f}s, '
+    f'{speed:.2f}x realtime with {job.threads} threads{preset}, verified in {job.verified:.1f}s'
+  )
+
+
+def get_job_encoder(job: Job) -> Alias | None:
+  """Encoder that converted the job, the video encoder if it re-encoded video"""
+  opts = get_output_opts(job.video, job.formats, job.threads, job.speed, job.skip)
+
+  for option in (FfmpegOpt.vcodec, FfmpegOpt.acodec):
+    if (encoder := opts.get(option)) and encoder != FfmpegVal.copy:
+      return str(encoder)
+
+  return None
+
+
+def get_job_stats(job: Job, size: int) -> JobStats:
+  container, video_profile, audio_profile, _ = job.video.formats
+  profile = job.formats.video_profile if job.formats else None
+
+  return JobStats(
+    path=str(job.path),
+    device=job.device.name,
+    container=str(container) if container else None,
+    video_codec=str(video_profile.codec) if video_profile else None,
+    resolution=str(video_profile.resolution) if video_profile and video_profile.resolution else None,
+    fps=float(video_profile.fps) if video_profile and video_profile.fps else None,
+    audio_codec=str(audio_profile.codec) if audio_profile else None,
+    action=job.action,
+    encoder=get_job_encoder(job),
+    threads=job.threads,
+    duration=job.video.duration,
+    work=get_work(job.action, job.video, profile),
+    wall=job.process.elapsed,
+    cpu=job.process.cpu_time,
+    size=size,
+    verify=job.verified,
+  )
+
+
+def record_stats(job: Job, size: int, stats: Stats = DEFAULT_STATS):
+  """Record a finished FFmpeg job, to learn this host's conversion costs"""
+  if not (process := job.process) or process.finished is None:
+    return
+
+  stats.record(get_job_stats(job, size))
+
+
+def convert_from_name_path(
+  name: str,
+  path: Path,
+  settings: Settings = DEFAULT_SETTINGS,
+  journal: Journal | None = None,
+) -> Video | None:
+  job = plan_job(name, path, settings.subtitle, journal, settings.fixup, settings.faststart, settings.sidecar)
+
+  if not job:
+    return None
+
+  job.threads = settings.threads
+  return run_job(job, settings, journal)
+
+
+def get_outputs(job: Job, settings: Settings = DEFAULT_SETTINGS) -> list[Path]:
+  """Files the job writes before they're moved into place, none for renames and sidecars"""
+  video, formats, replace, scratch = job.video, job.formats, settings.replace, settings.scratch
+
+  if job.targets:
+    return [get_target_path(video, target, scratch) for target in job.targets]
+
+  match formats:
+    case RenameFormats() | SidecarFormats():
+      return []
+
+    case FaststartFormats():
+      output = video.path if replace else get_new_path(video, formats, replace)
+      return [get_partial(output)]
+
+    case _:
+      return [get_new_path(video, formats, replace, scratch=scratch)]
+
+
+async def schedule_job(
+  job: Job,
+  scheduler: Scheduler,
+  settings: Settings = DEFAULT_SETTINGS,
+  journal: Journal | None = None,
+  storage: Storage | None = None,
+) -> Video | None:
+  """Wait for space for the job's outputs before taking a scheduler slot, and hold it until they're in place"""
+  if not storage or not (outputs := get_outputs(job, settings)):
+    return await scheduler.run(job, run_job, settings, journal)
+
+  video, scratch = job.video, settings.scratch
+  dirs = [video.path.parent, scratch] if scratch else [video.path.parent]
+
+  try:
+    reservation = await storage.acquire(estimate_output_size(video) * len(outputs), *dirs, outputs=outputs)
+
+  except StorageError as e:
+    log.error(f'[{e}] Not converting {job.path}')
+
+    if journal:
+      devices = [device for target in job.targets for device in target.devices] or [job.device]
+
+      for device in devices:
+        journal.record(job.path, device.name, JobState.failed, error=str(e), speed=job.speed)
+
+    return None
+
+  try:
+    return await scheduler.run(job, run_job, settings, journal)
+
+  finally:
+    storage.release(reservation)
+
+
+def record_converted(journal: Journal, path: Path, device: str, output: Path, speed: Speed | None = None):
+  journal.record(path, device, JobState.done, output, speed=speed)
+
+  if output != path:
+    journal.record(output, device, JobState.done, output, speed=speed)
+
 
 async def convert_paths(
   name: str,
-  replace: bool,
-  threads: int,
-  jobs: int,
   *paths: Path,
+  settings: Settings = DEFAULT_SETTINGS,
   strategy: Strategy = Strategy.quit,
-  subtitle: Path | None = None,
+  journal: Journal | None = None,
+  videos: Mapping[Path, Video] | None = None,
 ):
-  sem = BoundedSemaphore(jobs)
-  handled_converter = get_error_handler(convert_from_name_path, UnknownFormat, strategy=strategy)
+  """Convert the videos at the paths, using the already probed videos where given"""
+  videos = videos or {}
+  probes = BoundedSemaphore(PROBE_JOBS)
+  scheduler = Scheduler(settings)
+  storage = Storage()
+  handled_planner = get_error_handler(get_planner(settings), UnknownFormat, strategy=strategy)
+
+  if journal:
+    journal.recover()
 
   async def convert(path: Path):
-    async with sem:
-      await to_thread(handled_converter, name, path, replace, threads, subtitle)
+    async with probes:
+      job = await to_thread(
+        handled_planner, name, path, settings.subtitle, journal, settings.fixup, settings.faststart, settings.sidecar,
+        videos.get(path),
+      )
+
+    if job:
+      await schedule_job(job, scheduler, settings, journal, storage)
 
-  async with TaskGroup() as tg:
+  async with governed(scheduler, settings.pause_load), TaskGroup() as tg:
     for path in paths:
       tg.create_task(convert(path))
@@ -0,0 +1,376 @@
+from __future__ import annotations
+
+import logging
+from asyncio import CancelledError, Future, get_running_loop, shield, to_thread, wait_for
+from collections import Counter
+from collections.abc import AsyncIterator, Callable, Iterator
+from contextlib import asynccontextmanager, suppress
+from dataclasses import dataclass, field
+from heapq import heappop, heappush
+from itertools import count
+from math import floor
+from pathlib import Path
+from time import monotonic
+from typing import Final, NamedTuple
+
+import psutil
+
+from .affinity import CorePool
+from .cost import Cost, get_job_cost
+from .jobs import Action, Job
+from .jobserver import TokenPool, Tokens, get_token_pool
+from .process import Process
+from .settings import DEFAULT_SETTINGS, Settings
+from ..base import DEFAULT_THREADS, MS_PER_SECOND
+from ..enums import Speed
+
+
+log = logging.getLogger(__name__)
+
+PERCENT: Final[float] = 100.0
+
+SAMPLE_INTERVAL: Final[float] = 0.5
+DISPATCH_WAIT: Final[float] = 1.0
+
+MIN_THREADS: Final[int] = 1
+MIN_VIDEO_THREADS: Final[int] = 2
+MAX_VIDEO_THREADS: Final[int] = 16
+MAX_IO_BUSY: Final[float] = 0.9
+NO_LOAD: Final[float] = 0.0
+
+# core-seconds of priority a queued job gains per second waited
+DEFAULT_AGING: Final[float] = float(DEFAULT_THREADS)
+
+ACTION_THREADS: Final[dict[Action, int]] = {
+  Action.skip: MIN_THREADS,
+  Action.reject: MIN_THREADS,
+  Action.rename: MIN_THREADS,
+  Action.faststart: MIN_THREADS,
+  Action.sidecar: MIN_THREADS,
+  Action.copy: MIN_THREADS,
+  Action.fixup: MIN_THREADS,
+  Action.audio: MIN_VIDEO_THREADS,
+}
+
+IO_BOUND: Final[frozenset[Action]] = frozenset({
+  Action.skip, Action.faststart, Action.sidecar, Action.copy, Action.fixup,
+})
+
+SECONDS_PER_MINUTE: Final[int] = 60
+SECONDS_PER_HOUR: Final[int] = 60 * SECONDS_PER_MINUTE
+
+# best quality speed whose backlog, in seconds, and queue depth limits aren't exceeded
+SPEED_LIMITS: Final[tuple[tuple[Speed, float, int], ...]] = (
+  (Speed.quality, 10 * SECONDS_PER_MINUTE, 4),
+  (Speed.balanced, SECONDS_PER_HOUR, 16),
+  (Speed.fast, 4 * SECONDS_PER_HOUR, 64),
+)
+
+
+class Load(NamedTuple):
+  cpu: float = NO_LOAD  # busy cores
+  io: float = NO_LOAD  # busiest disk's utilization
+
+
+@dataclass
+class LoadMonitor:
+  """Samples system CPU and disk load"""
+  interval: float = SAMPLE_INTERVAL
+  cores: int = DEFAULT_THREADS
+
+  last: Load = field(default_factory=Load)
+  sampled: float = field(default_factory=monotonic)
+  busy: dict[str, int] = field(default_factory=dict)
+
+  def __post_init__(self):
+    psutil.cpu_percent(interval=None)
+    self.busy = get_busy_times()
+
+  def sample(self) -> Load:
+    now = monotonic()
+
+    if (elapsed := now - self.sampled) < self.interval:
+      return self.last
+
+    cpu = psutil.cpu_percent(interval=None) / PERCENT * self.cores
+
+    busy = get_busy_times()
+    io = max(
+      ((busy[disk] - self.busy.get(disk, busy[disk])) / MS_PER_SECOND / elapsed for disk in busy),
+      default=NO_LOAD,
+    )
+
+    self.last = Load(cpu, min(io, 1.0))
+    self.sampled = now
+    self.busy = busy
+
+    log.debug(f'[Load] {self.last}')
+    return self.last
+
+
+def get_busy_times() -> dict[str, int]:
+  try:
+    disks = psutil.disk_io_counters(perdisk=True) or {}
+
+  except Exception as e:
+    log.debug(f"[{e}] Can't read disk counters")
+    return {}
+
+  return {
+    disk: busy
+    for disk, counters in disks.items()
+    if (busy := getattr(counters, 'busy_time', None)) is not None
+  }
+
+
+def get_speed(backlog: float, depth: int) -> Speed:
+  for speed, max_backlog, max_depth in SPEED_LIMITS:
+    if backlog < max_backlog and depth < max_depth:
+      return speed
+
+  return Speed.fastest
+
+
+def get_elapsed(job: Job, started: float, now: float) -> float:
+  if process := job.process:
+    return process.elapsed
+
+  return now - started
+
+
+@dataclass(order=True)
+class Queued:
+  """Queued job"""
+  key: float
+  seq: int
+  job: Job = field(compare=False)
+  cost: Cost = field(compare=False)
+  enqueued: float = field(compare=False)
+  future: Future[int] = field(compare=False, repr=False)
+  tokens: Tokens = field(default_factory=list, compare=False, repr=False)
+
+  @property
+  def waited(self) -> float:
+    return monotonic() - self.enqueued
+
+
+class QueueItem(NamedTuple):
+  path: Path
+  action: Action
+  cost: Cost
+  waited: float
+  eta: float  # seconds from now until the job finishes
+
+
+@dataclass
+class Scheduler:
+  """Admits jobs cheapest first, with aging, and sizes their threads within a core budget"""
+  settings: Settings = DEFAULT_SETTINGS
+  budget: int = DEFAULT_THREADS
+  aging: float = DEFAULT_AGING
+
+  monitor: LoadMonitor = field(default_factory=LoadMonitor)
+  used: int = 0
+  running: Counter[Action] = field(default_factory=Counter)
+  active: dict[int, tuple[Queued, int, float]] = field(default_factory=dict)
+  pending: list[Queued] = field(default_factory=list)
+  seq: Iterator[int] = field(default_factory=count, repr=False)
+  paused: bool = False
+  cores: CorePool = field(default_factory=CorePool)
+  tokens: TokenPool | None = None
+
+  def __post_init__(self):
+    if self.tokens is None:
+      self.tokens = get_token_pool(self.settings.tokens)
+
+  @property
+  def capacity(self) -> int:
+    if self.settings.autotune:
+      return self.budget
+
+    return max(min(self.settings.jobs * self.settings.threads, self.budget), MIN_THREADS)
+
+  @property
+  def remaining(self) -> Cost:
+    """Estimated core-seconds left for running jobs"""
+    now = monotonic()
+
+    return sum(
+      max(get_job_cost(queued.job) - get_elapsed(queued.job, started, now) * threads, NO_LOAD)
+      for queued, threads, started in self.active.values()
+    )
+
+  @property
+  def queue(self) -> list[QueueItem]:
+    capacity = self.capacity
+    backlog = self.remaining
+    items = list[QueueItem]()
+
+    for queued in sorted(self.pending):
+      backlog += queued.cost
+      items.append(QueueItem(queued.job.path, queued.job.action, queued.cost, queued.waited, backlog / capacity))
+
+    return items
+
+  @property
+  def processes(self) -> list[Process]:
+    return [
+      process
+      for queued, *_ in self.active.values()
+      if (process := queued.job.process) and process.is_running
+    ]
+
+  @property
+  def backlog(self) -> float:
+    """Estimated seconds until the queue drains"""
+    pending = sum(queued.cost for queued in self.pending if not queued.future.done())
+    return (self.remaining + pending) / self.capacity
+
+  def get_speed(self) -> Speed | None:
+    if not self.settings.adaptive:
+      return None
+
+    return get_speed(self.backlog, len(self.pending))
+
+  def get_threads(self, job: Job) -> int | None:
+    if (threads := self.get_wanted_threads(job)) is None or not self.settings.pin:
+      return threads
+
+    if not (free := self.cores.free):
+      return None
+
+    return min(threads, free)
+
+  def get_wanted_threads(self, job: Job) -> int | None:
+    if not self.settings.autotune:
+      return self.settings.threads if len(self.active) < self.settings.jobs else None
+
+    load = self.monitor.sample()
+    external = max(load.cpu - self.used, NO_LOAD)
+    available = floor(self.budget - self.used - external)
+    action = job.action
+
+    if action in IO_BOUND and self.running[action] and load.io >= MAX_IO_BUSY:
+      return None
+
+    if not (threads := ACTION_THREADS.get(action)):
+      max_threads = min(self.budget, MAX_VIDEO_THREADS)
+      threads = min(available, max_threads) if available >= MIN_VIDEO_THREADS else MIN_VIDEO_THREADS
+
+    if not self.active:
+      return max(min(threads, self.budget), MIN_THREADS)
+
+    if threads > available:
+      return None
+
+    return threads
+
+  def enqueue(self, job: Job) -> Queued:
+    cost = get_job_cost(job)
+    enqueued = monotonic()
+
+    queued = Queued(
+      key=cost + self.aging * enqueued,
+      seq=next(self.seq),
+      job=job,
+      cost=cost,
+      enqueued=enqueued,
+      future=get_running_loop().create_future(),
+    )
+
+    heappush(self.pending, queued)
+    log.info(f'Queued {job.action} job with cost {cost:.1f}: {job.path} ({len(self.pending)} queued)')
+
+    return queued
+
+  def dispatch(self):
+    while self.pending and not self.paused:
+      head, *_ = self.pending
+
+      if head.future.done():
+        heappop(self.pending)
+        continue
+
+      if (threads := self.get_threads(head.job)) is None:
+        break
+
+      if self.tokens:
+        if not (tokens := self.tokens.acquire(threads)):
+          break
+
+        head.tokens = tokens
+        threads = len(tokens)
+
+      heappop(self.pending)
+      head.job.speed = self.get_speed()
+      self.acquire(head, threads)
+      head.future.set_result(threads)
+
+  def acquire(self, queued: Queued, threads: int):
+    if self.settings.pin:
+      queued.job.cpus = self.cores.allocate(threads)
+
+    self.used += threads
+    self.running[queued.job.action] += 1
+    self.active[queued.seq] = queued, threads, monotonic()
+
+  def release(self, queued: Queued, threads: int):
+    if self.tokens:
+      self.tokens.release(queued.tokens)
+
+    self.cores.release(queued.job.cpus)
+    self.used -= threads
+    self.running[queued.job.action] -= 1
+    self.active.pop(queued.seq, None)
+
+    self.dispatch()
+
+  def show_queue(self):
+    if not (queue := self.queue):
+      return
+
+    log.info(f'{len(queue)} jobs queued, {len(self.active)} running, estimated {queue[-1].eta:.0f}s until done')
+
+    for item in queue:
+      log.debug(
+        f'[Queue] {item.action} {item.path}: cost {item.cost:.1f}, waited {item.waited:.0f}s, eta {item.eta:.0f}s'
+      )
+
+  @asynccontextmanager
+  async def slot(self, job: Job) -> AsyncIterator[int]:
+    queued = self.enqueue(job)
+    self.dispatch()
+
+    try:
+      while not queued.future.done():
+        with suppress(TimeoutError):
+          await wait_for(shield(queued.future), DISPATCH_WAIT)
+
+        self.dispatch()
+
+    except CancelledError:
+      if queued.future.done() and not queued.future.cancelled():
+        self.release(queued, queued.future.result())
+
+      queued.future.cancel()
+      raise
+
+    threads = queued.future.result()
+
+    speed = f' at {job.speed} speed' if job.speed else ''
+    log.info(
+      f'Starting {job.action} job with {threads} threads{speed}: {job.path} '
+      f'({len(self.active)} running, {self.used} threads)'
+    )
+    self.show_queue()
+
+    try:
+      yield threads
+
+    finally:
+      self.release(queued, threads)
+
+  async def run[T](self, job: Job, func: Callable[..., T], *args) -> T:
+    async with self.slot(job) as threads:
+      job.threads = threads
+      return await to_thread(func, job, *args)
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Final
+
+from .cache import DEFAULT_CACHE_SIZE
+from .verify import NO_SAMPLES
+from ..base import DEFAULT_JOBS, DEFAULT_REPLACE, DEFAULT_THREADS
+from ..enums import Priority
+
+
+@dataclass(frozen=True)
+class Settings:
+  """Conversion settings"""
+  replace: bool = DEFAULT_REPLACE
+  threads: int = DEFAULT_THREADS
+  jobs: int = DEFAULT_JOBS
+  subtitle: Path | None = None
+  scratch: Path | None = None
+  autotune: bool = False
+  priority: Priority = Priority.normal
+  pause_load: float | None = None
+  pin: bool = False
+  tokens: Path | None = None
+  adaptive: bool = False
+  fixup: bool = False
+  faststart: bool = False
+  sidecar: bool = False
+  canary: bool = False
+  each: bool = False
+  verify: int = NO_SAMPLES  # frames to decode when verifying, outputs are always probed
+  cache: Path | None = None  # directory of converted videos to reuse, None to always convert
+  cache_size: int = DEFAULT_CACHE_SIZE
+
+
+DEFAULT_SETTINGS: Final[Settings] = Settings()
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import logging
+import socket
+import sqlite3
+from collections.abc import Iterator
+from contextlib import closing, contextmanager
+from dataclasses import dataclass
+from functools import cache
+from pathlib import Path
+from time import time
+from typing import Final, NamedTuple
+
+from ..base import CACHE_DIR
+from ..enums import Action
+from ..parse import Alias
+
+
+log = logging.getLogger(__name__)
+
+STATS_FILENAME: Final[str] = 'stats.sqlite3'
+STATS_PATH: Final[Path] = CACHE_DIR / STATS_FILENAME
+LOCK_TIMEOUT: Final[float] = 10.0  # seconds
+NO_RATE: Final[float] = 0.0
+
+# fits from fewer jobs are noise
+MIN_SAMPLES: Final[int] = 3
+
+SCHEMA: Final[str] = """
+CREATE TABLE IF NOT EXISTS jobs (
+  id INTEGER PRIMARY KEY,
+  time REAL NOT NULL,
+  host TEXT NOT NULL,
+  path TEXT NOT NULL,
+  device TEXT NOT NULL,
+  container TEXT,
+  video_codec TEXT,
+  resolution TEXT,
+  fps REAL,
+  audio_codec TEXT,
+  action TEXT NOT NULL,
+  encoder TEXT,
+  threads INTEGER NOT NULL,
+  duration REAL NOT NULL,
+  work REAL NOT NULL,
+  wall REAL NOT NULL,
+  cpu REAL NOT NULL,
+  size INTEGER NOT NULL,
+  verify REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_host_action ON jobs (host, action, encoder);
+"""
+
+INSERT: Final[str] = """
+INSERT INTO jobs (
+  time, host, path, device, container, video_codec, resolution, fps, audio_codec,
+  action, encoder, threads, duration, work, wall, cpu, size, verify
+)
+VALUES (
+  :time, :host, :path, :device, :container, :video_codec, :resolution, :fps, :audio_codec,
+  :action, :encoder, :threads, :duration, :work, :wall, :cpu, :size, :verify
+)
+"""
+
+# columns added after the first release of the table
+ADDED_COLUMNS: Final[dict[str, str]] = {'verify': 'REAL NOT NULL DEFAULT 0'}
+SELECT_COLUMNS: Final[str] = 'PRAGMA table_info(jobs)'
+ADD_COLUMN: Final[str] = 'ALTER TABLE jobs ADD COLUMN {} {}'
+
+SELECT_RATES: Final[str] = """
+SELECT action, encoder, COUNT(*), SUM(cpu), SUM(work)
+FROM jobs
+WHERE host = ? AND work > 0
+GROUP BY action, encoder
+"""
+
+SELECT_ENCODERS: Final[str] = """
+SELECT encoder, action, COUNT(*), SUM(duration), SUM(wall), SUM(cpu), AVG(threads)
+FROM jobs
+WHERE host = ?
+GROUP BY encoder, action
+ORDER BY encoder, action
+"""
+
+SELECT_VERIFY: Final[str] = """
+SELECT COUNT(*), SUM(verify), SUM(duration)
+FROM jobs
+WHERE host = ? AND verify > 0
+"""
+
+
+type Key = tuple[Action, Alias | None]
+
+
+class JobStats(NamedTuple):
+  """Measurements of a finished job"""
+  path: str
+  device: str
+  container: str | None
+  video_codec: str | None
+  resolution: str | None
+  fps: float | None
+  audio_codec: str | None
+  action: Action
+  encoder: Alias | None
+  threads: int
+  duration: float  # seconds of source
+  work: float  # megapixel-frames of the output for pixel bound actions, otherwise seconds of source
+  wall: float
+  cpu: float
+  size: int  # bytes written
+  verify: float = 0.0  # seconds spent verifying outputs
+  time: float = 0.0
+  host: str = ''
+
+
+class Rate(NamedTuple):
+  """Fitted cost of an action, in core-seconds per unit of work"""
+  samples: int
+  cpu: float
+  work: float
+
+
+class EncoderStats(NamedTuple):
+  """Totals for the jobs an encoder ran for an action"""
+  encoder: Alias | None
+  action: Action
+  jobs: int
+  duration: float
+  wall: float
+  cpu: float
+  threads: float
+
+  @property
+  def realtime(self) -> float:
+    return self.duration / self.wall if self.wall else NO_RATE
+
+  @property
+  def cpu_per_second(self) -> float:
+    return self.cpu / self.duration if self.duration else NO_RATE
+
+
+@dataclass(frozen=True)
+class History:
+  """Job costs fitted from this host's finished jobs"""
+  rates: dict[Key, Rate]
+  verify: float | None = None  # seconds spent verifying per second of source
+
+  def get_cost(self, action: Action, encoder: Alias | None = None) -> float | None:
+    """Core-seconds per unit of work, from jobs with the encoder, or any encoder if it isn't given"""
+    rates = [
+      rate
+      for (rate_action, rate_encoder), rate in self.rates.items()
+      if rate_action is action and (encoder is None or rate_encoder == encoder)
+    ]
+
+    samples = sum(rate.samples for rate in rates)
+
+    if samples < MIN_SAMPLES or not (work := sum(rate.work for rate in rates)):
+      return None
+
+    return sum(rate.cpu for rate in rates) / work
+
+
+@dataclass(frozen=True)
+class Stats:
+  """SQLite store of finished jobs"""
+  path: Path = STATS_PATH
+
+  @contextmanager
+  def connect(self) -> Iterator[sqlite3.Connection]:
+    self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    with closing(sqlite3.connect(self.path, timeout=LOCK_TIMEOUT)) as connection:
+      with connection:
+        connection.executescript(SCHEMA)
+        add_columns(connection)
+        yield connection
+
+  def record(self, stats: JobStats):
+    stats = stats._replace(time=stats.time or time(), host=stats.host or socket.gethostname())
+
+    try:
+      with self.connect() as connection:
+        connection.execute(INSERT, stats._asdict())
+
+    except (OSError, sqlite3.Error) as e:
+      log.warning(f"[{e}] Can't record stats of {stats.path} in {self.path}")
+      return
+
+    log.debug(f'[Stats] {stats}')
+    get_history.cache_clear()
+
+  def get_history(self, host: str | None = None) -> History:
+    rates = dict[Key, Rate]()
+    host = host or socket.gethostname()
+
+    with self.connect() as connection:
+      for action, encoder, samples, cpu, work in connection.execute(SELECT_RATES, (host,)):
+        rates[Action(action), encoder] = Rate(samples, cpu, work)
+
+      samples, verify, duration = connection.execute(SELECT_VERIFY, (host,)).fetchone()
+
+    if samples < MIN_SAMPLES or not duration:
+      return History(rates)
+
+    return History(rates, verify / duration)
+
+  def get_encoder_stats(self, host: str | None = None) -> list[EncoderStats]:
+    with self.connect() as connection:
+      rows = connection.execute(SELECT_ENCODERS, (host or socket.gethostname(),)).fetchall()
+
+    return [
+      EncoderStats(encoder, Action(action), jobs, duration, wall, cpu, threads)
+      for encoder, action, jobs, duration, wall, cpu, threads in rows
+    ]
+
+
+def add_columns(connection: sqlite3.Connection):
+  """Upgrade tables made by older versions"""
+  columns = {name for _, name, *_ in connection.execute(SELECT_COLUMNS)}
+
+  for name, definition in ADDED_COLUMNS.items():
+    if name not in columns:
+      connection.execute(ADD_COLUMN.format(name, definition))
+
+
+DEFAULT_STATS: Final[Stats] = Stats()
+
+
+@cache
+def get_history(stats: Stats = DEFAULT_STATS) -> History | None:
+  """Costs learned from finished jobs, or None if there's no history"""
+  if not stats.path.exists():
+    return None
+
+  try:
+    return stats.get_history()
+
+  except (OSError, sqlite3.Error) as e:
+    log.warning(f"[{e}] Can't load job history from {stats.path}")
+    return None
@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import asyncio
+import errno
+import fcntl
+import logging
+import os
+import shutil
+from collections.abc import AsyncIterator, Iterable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from hashlib import blake2b
+from pathlib import Path
+from threading import Lock
+from time import monotonic
+from typing import Final
+
+from ..base import BITS_PER_BYTE, FILESIZE_CHECK_WAIT
+from ..exceptions import StorageError
+from ..model.video import Video
+
+
+log = logging.getLogger(__name__)
+
+SIZE_MARGIN: Final[float] = 1.1
+SPACE_CHECK_WAIT: Final[float] = FILESIZE_CHECK_WAIT * 5
+NO_RESERVATION: Final[int] = 0
+
+# other processes might never free their space, unlike jobs that are running
+SPACE_TIMEOUT: Final[float] = 30 * 60  # seconds
+
+PARTIAL_PREFIX: Final[str] = '.'
+PARTIAL_SUFFIX: Final[str] = '.partial'
+SCRATCH_SEP: Final[str] = '-'
+SCRATCH_DIGEST_SIZE: Final[int] = 4
+
+# share the extents of a file, see: ioctl_ficlone(2)
+FICLONE: Final[int] = 0x40049409
+
+# filesystem doesn't support hard links
+NO_LINK_ERRORS: Final[frozenset[int]] = frozenset({errno.EPERM, errno.EMLINK, errno.EXDEV, errno.EOPNOTSUPP})
+
+
+type DeviceId = int
+
+
+def estimate_output_size(video: Video, margin: float = SIZE_MARGIN) -> int:
+  if (bitrate := video.bitrate) and (duration := video.duration):
+    size = bitrate * duration / BITS_PER_BYTE
+
+  else:
+    size = max(video.size, 0)
+
+  return int(size * margin)
+
+
+def get_existing(path: Path) -> Path:
+  for parent in (path, *path.parents):
+    if parent.exists():
+      return parent
+
+  return path
+
+
+def get_device_id(path: Path) -> DeviceId:
+  return get_existing(path).stat().st_dev
+
+
+def get_size(path: Path) -> int:
+  try:
+    return path.stat().st_size
+
+  except OSError:
+    return NO_RESERVATION
+
+
+def get_free_space(path: Path) -> int:
+  return shutil.disk_usage(get_existing(path)).free
+
+
+def get_scratch_path(path: Path, scratch: Path) -> Path:
+  digest = blake2b(str(path.parent).encode(), digest_size=SCRATCH_DIGEST_SIZE).hexdigest()
+  return scratch / f'{digest}{SCRATCH_SEP}{path.name}'
+
+
+def get_partial(path: Path) -> Path:
+  """Hidden file next to `path` that's written before it's renamed into place"""
+  return path.with_name(f'{PARTIAL_PREFIX}{path.name}{PARTIAL_SUFFIX}')
+
+
+type Needed = dict[DeviceId, tuple[Path, int]]
+
+
+@dataclass(eq=False)
+class Reservation:
+  """Space held for a job's outputs, that shrinks as they're written"""
+  needed: Needed
+  outputs: tuple[Path, ...] = ()
+
+  def get_outstanding(self, dev: DeviceId) -> int:
+    if dev not in self.needed:
+      return NO_RESERVATION
+
+    _, total = self.needed[dev]
+    written = sum(get_size(path) for path in self.outputs if get_device_id(path) == dev)
+
+    return max(total - written, NO_RESERVATION)
+
+
+@dataclass
+class Storage:
+  """Disk space admission control"""
+  wait: float = SPACE_CHECK_WAIT
+  timeout: float = SPACE_TIMEOUT
+  reservations: list[Reservation] = field(default_factory=list)
+  lock: Lock = field(default_factory=Lock, repr=False, compare=False)
+
+  def get_needed(self, size: int, *dirs: Path) -> Needed:
+    needed = dict[DeviceId, tuple[Path, int]]()
+
+    for path in dirs:
+      dev = get_device_id(path)
+      _, total = needed.get(dev, (path, NO_RESERVATION))
+      needed[dev] = path, total + size
+
+    return needed
+
+  def get_reserved(self, dev: DeviceId) -> int:
+    """Bytes reserved on the device that haven't been written yet"""
+    return sum(reservation.get_outstanding(dev) for reservation in self.reservations)
+
+  def has_room(self, needed: Needed) -> bool:
+    for dev, (path, total) in needed.items():
+      if get_free_space(path) - (reserved := self.get_reserved(dev)) < total:
+        log.info(f'Not enough free space in {path} for {total} bytes, {reserved} reserved')
+        return False
+
+    return True
+
+  def try_reserve(self, size: int, *dirs: Path, outputs: Iterable[Path] = ()) -> Reservation | None:
+    needed = self.get_needed(size, *dirs)
+
+    with self.lock:
+      if not self.has_room(needed):
+        return None
+
+      reservation = Reservation(needed, tuple(outputs))
+      self.reservations.append(reservation)
+
+    return reservation
+
+  async def acquire(self, size: int, *dirs: Path, outputs: Iterable[Path] = ()) -> Reservation:
+    """Wait until there's room for the outputs, before the job takes a scheduler slot"""
+    outputs = tuple(outputs)
+    deadline: float | None = None
+
+    while not (reservation := self.try_reserve(size, *dirs, outputs=outputs)):
+      if self.reservations:
+        deadline = None
+
+      elif deadline is None:
+        deadline = monotonic() + self.timeout
+
+      elif monotonic() > deadline:
+        raise StorageError(f'Not enough free space for {size} bytes in {", ".join(map(str, dirs))}')
+
+      log.warning(f'Waiting for free space for {size} bytes in {", ".join(map(str, dirs))}')
+      await asyncio.sleep(self.wait)
+
+    return reservation
+
+  def release(self, reservation: Reservation):
+    with self.lock:
+      self.reservations.remove(reservation)
+
+  @asynccontextmanager
+  async def reserve(self, size: int, *dirs: Path, outputs: Iterable[Path] = ()) -> AsyncIterator[Reservation]:
+    reservation = await self.acquire(size, *dirs, outputs=outputs)
+
+    try:
+      yield reservation
+
+    finally:
+      self.release(reservation)
+
+
+def fsync_path(path: Path):
+  fd = os.open(path, os.O_RDONLY)
+
+  try:
+    os.fsync(fd)
+
+  finally:
+    os.close(fd)
+
+
+def link(src: Path, dst: Path) -> Path:
+  """Hard link `src` to `dst`, copying it if links aren't supported, without overwriting `dst`"""
+  try:
+    os.link(src, dst)
+    return dst
+
+  except OSError as e:
+    if e.errno not in NO_LINK_ERRORS:
+      raise
+
+    log.warning(f"[{e}] Can't link {src} to {dst}, copying it.")
+
+  if dst.exists():
+    raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), str(dst))
+
+  shutil.copyfile(src, dst)
+  return dst
+
+
+def reflink(src: Path, dst: Path) -> bool:
+  """Copy-on-write copy of `src` to `dst`, returns False if the filesystem can't share extents"""
+  with src.open('rb') as source, dst.open('xb') as destination:
+    try:
+      fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+      return True
+
+    except OSError as e:
+      log.debug(f"[{e}] Can't reflink {src} to {dst}")
+
+  dst.unlink(missing_ok=True)
+  return False
+
+
+def clone(src: Path, dst: Path) -> Path:
+  """Reflink `src` to `dst`, else copy it, so neither sees writes to the other"""
+  if reflink(src, dst):
+    return dst
+
+  shutil.copyfile(src, dst)
+  return dst
+
+
+def rename(src: Path, dst: Path) -> Path:
+  """Rename `src` to `dst` without overwriting `dst`"""
+  try:
+    os.link(src, dst)
+
+  except OSError as e:
+    if e.errno not in NO_LINK_ERRORS:
+      raise
+
+    log.debug(f"[{e}] Can't link {src} to {dst}, renaming it.")
+
+    if dst.exists():
+      raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), str(dst))
+
+    return src.rename(dst)
+
+  src.unlink()
+  return dst
+
+
+def move(src: Path, dst: Path) -> Path:
+  try:
+    return src.replace(dst)
+
+  except OSError as e:
+    if e.errno != errno.EXDEV:
+      raise
+
+  log.info(f'Copying {src} to {dst} across filesystems')
+  partial = get_partial(dst)
+
+  try:
+    shutil.copyfile(src, partial)
+    fsync_path(partial)
+    partial.replace(dst)
+    fsync_path(dst.parent)
+
+  except BaseException:
+    partial.unlink(missing_ok=True)
+    raise
+
+  src.unlink()
+  return dst
+
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import logging
+import re
+import shutil
+from pathlib import Path
+from typing import Final, TYPE_CHECKING
+
+import ffmpeg
+from ffmpeg.nodes import OutputStream
+
+from .process import Process
+from .transcode import TranscodeFormats
+from ..base import NEW_LINE
+from ..enums import Priority
+from ..media.codecs import Subtitle
+from ..model.video import Video
+
+
+if TYPE_CHECKING:
+  from ..model.device import Device
+
+
+log = logging.getLogger(__name__)
+
+ENCODING: Final[str] = 'utf-8'
+SRT_ENCODING: Final[str] = 'utf-8-sig'
+BOM: Final[str] = '\ufeff'
+
+VTT_SUFFIX: Final[str] = '.vtt'
+SRT_SUFFIX: Final[str] = '.srt'
+VTT_HEADER: Final[str] = 'WEBVTT'
+VTT_CODEC: Final[str] = 'webvtt'
+OVERWRITE: Final[str] = '-y'
+
+SUBTITLE_STREAM: Final[str] = 's:{}'
+SRT_TIMESTAMP: Final[re.Pattern] = re.compile(r'(\d{2}:\d{2}:\d{2}),(\d{3})')
+VTT_TIMESTAMP: Final[str] = r'\1.\2'
+
+# subtitles the webvtt encoder can convert, bitmap subtitles like PGS and VobSub can't be
+TEXT_SUBTITLES: Final[frozenset[Subtitle]] = frozenset({Subtitle.srt, Subtitle.ass, Subtitle.ssa, Subtitle.webvtt})
+
+# captions carried inside the video stream, not separate subtitle streams
+EMBEDDED_CAPTIONS: Final[frozenset[Subtitle]] = frozenset({Subtitle.eia608, Subtitle.eia708})
+
+
+class SidecarFormats(TranscodeFormats):
+  """Formats fixed by writing subtitles to sidecar WebVTT files"""
+
+
+def get_text_tracks(video: Video) -> list[int]:
+  """Return the subtitle stream indexes of text subtitles"""
+  tracks = list[int]()
+  index = 0
+
+  for track in video.data.text_tracks:
+    subtitle = Subtitle.from_info(track.format)
+
+    if subtitle in EMBEDDED_CAPTIONS:
+      continue
+
+    if subtitle in TEXT_SUBTITLES:
+      tracks.append(index)
+
+    index += 1
+
+  return tracks
+
+
+def is_subtitle_only(formats: TranscodeFormats) -> bool:
+  container, video_profile, audio_profile, subtitle = formats
+  return bool(subtitle) and not (container or video_profile or audio_profile)
+
+
+def get_sidecar(device: Device, video: Video, subtitle: Path | None = None) -> SidecarFormats | None:
+  """Return a plan if the subtitles are the only problem, or if an external subtitle needs converting"""
+  if not (formats := device.transcode_to(video)):
+    return SidecarFormats(subtitle=Subtitle.webvtt) if subtitle else None
+
+  if not is_subtitle_only(formats):
+    return None
+
+  if not get_text_tracks(video) and not subtitle:
+    log.info(f'{video.path} only has bitmap subtitles, they must be converted in the container.')
+    return None
+
+  log.info(f'Only the subtitles of {video.path} are incompatible, planning sidecar WebVTT files')
+  return SidecarFormats(subtitle=Subtitle.webvtt)
+
+
+def get_sidecar_path(path: Path, index: int = 0) -> Path:
+  if not index:
+    return path.with_suffix(VTT_SUFFIX)
+
+  return path.with_suffix(f'.{index}{VTT_SUFFIX}')
+
+
+def srt_to_vtt(text: str) -> str:
+  text = text.lstrip(BOM).replace('\r\n', NEW_LINE).replace('\r', NEW_LINE)
+  text = SRT_TIMESTAMP.sub(VTT_TIMESTAMP, text)
+
+  return f'{VTT_HEADER}{NEW_LINE * 2}{text.strip()}{NEW_LINE}'
+
+
+def write_vtt(subtitle: Path, output: Path) -> Path | None:
+  suffix = subtitle.suffix.lower()
+
+  if suffix == VTT_SUFFIX:
+    shutil.copyfile(subtitle, output)
+
+  elif suffix == SRT_SUFFIX:
+    text = subtitle.read_text(encoding=SRT_ENCODING, errors='replace')
+    output.write_text(srt_to_vtt(text), encoding=ENCODING)
+
+  else:
+    log.warning(f"Can't convert {suffix} subtitles to WebVTT: {subtitle}")
+    return None
+
+  log.info(f'Wrote sidecar subtitles {output}')
+  return output
+
+
+def get_sidecar_stream(video: Video, tracks: list[int]) -> OutputStream:
+  source = ffmpeg.input(str(video.path))
+
+  outputs = [
+    source[SUBTITLE_STREAM.format(track)].output(
+      str(get_sidecar_path(video.path, number)),
+      scodec=VTT_CODEC,
+    )
+    for number, track in enumerate(tracks)
+  ]
+
+  return ffmpeg.merge_outputs(*outputs).global_args(OVERWRITE)
+
+
+def extract_sidecars(video: Video, priority: Priority = Priority.normal) -> list[Path]:
+  if not (tracks := get_text_tracks(video)):
+    return []
+
+  stream = get_sidecar_stream(video, tracks)
+  log.info(f'Extracting {len(tracks)} subtitle tracks from {video.path}')
+
+  Process(stream.compile(), priority).run()
+  return [get_sidecar_path(video.path, number) for number in range(len(tracks))]
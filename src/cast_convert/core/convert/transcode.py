@@ -4,20 +4,22 @@ from collections.abc import Iterable
 from dataclasses import dataclass
 from operator import itemgetter
 from pathlib import Path
-from typing import Any, Final, TYPE_CHECKING, cast
+from typing import Any, Final, TYPE_CHECKING
 import logging
 
-from more_itertools import unzip
 from rich import print
 
+from .cost import Cost, estimate_profile_cost
+from .encoders import get_available
 from ..base import first
 from ..protocols import get_name
 from ..fmt import esc
-from ..media.codecs import Container, Subtitle
+from ..media.codecs import AudioCodec, Container, Subtitle
 from ..media.formats import Formats
 from ..media.profiles import AudioProfile, Profile, VideoProfile, is_codec_compatible, \
   is_fps_compatible, is_level_compatible, is_resolution_compatible
 from ..model.video import Video
+from ..parse import AUDIO_ENCODERS
 
 
 if TYPE_CHECKING:
@@ -29,11 +31,16 @@ log = logging.getLogger(__name__)
 SCORE_INDEX: Final[int] = 1
 ALL_SAME: Final[int] = 1
 
+# lossless audio is as big as the source, only choose it if nothing else plays
+LOSSLESS_AUDIO: Final[frozenset[AudioCodec]] = frozenset({AudioCodec.flac, AudioCodec.wav})
+
 
 type Weight = int
 type ProfileWeight = tuple[Profile, Weight]
 type ProfileWeights = Iterable[ProfileWeight]
 type WeightMap = dict[Profile, Weight]
+type ProfileCost = tuple[Cost, Weight]
+type CostMap = dict[Profile, ProfileCost]
 
 
 class TranscodeFormats(Formats):
@@ -45,6 +52,12 @@ class TranscodeVideoProfile(VideoProfile):
   """Intermediary VideoProfile"""
 
 
+@dataclass(eq=True, frozen=True)
+class TranscodeAudioProfile(AudioProfile):
+  """Intermediary AudioProfile"""
+  track: int | None = None  # index of the audio track to map
+
+
 compare_weight = itemgetter(SCORE_INDEX)
 
 
@@ -87,25 +100,29 @@ def get_default_video_profile(device: Device, video: Video) -> VideoProfile | No
 
   video_profile: VideoProfile
 
-  weights: WeightMap = {
-    profile: transcoded.weight
+  costs: CostMap = {
+    profile: (estimate_profile_cost(video, transcoded), transcoded.weight)
     for profile in device.video_profiles
     if profile and (transcoded := transcode_video_profile(video_profile, profile))
   }
 
-  unique_weights: set[Weight] = set(weights.values())
-
-  if len(unique_weights) == ALL_SAME:
+  if not costs:
     log.info(f'Choosing first {get_name(VideoProfile)} from {device.name}')
     return first(device.video_profiles)
 
-  profile_weights = sorted(weights.items(), key=compare_weight)
-  profile_weights = cast(ProfileWeights, profile_weights)
+  # cheapest conversion first, then the one that changes the fewest attributes
+  profile, (cost, _) = min(costs.items(), key=compare_weight)
+  log.info(f'Choosing {profile} from {device.name}, with estimated cost {cost:.1f}')
+
+  return profile
 
-  profiles: Iterable[Profile]
-  profiles, _ = unzip(profile_weights)
 
-  return first(profiles)
+def get_default_audio_profile(device: Device) -> AudioProfile | None:
+  for profile in device.audio_profiles:
+    if profile.codec not in LOSSLESS_AUDIO and get_available(AUDIO_ENCODERS.get(profile.codec, [])):
+      return profile
+
+  return first(device.audio_profiles)
 
 
 def transcode_audio(
@@ -116,15 +133,30 @@ def transcode_audio(
   if device.can_play_audio(video):
     return None
 
+  if (track := get_compatible_audio_track(device, video)) is not None:
+    log.info(f'Copying compatible audio track {track} of {video.path} instead of transcoding')
+    return TranscodeAudioProfile(codec=None, track=track)
+
   *_, audio_profile, _ = video.formats
 
   if not default_audio:
-    log.info(f'Choosing first {get_name(AudioProfile)} from {device.name}')
-    default_audio = first(device.audio_profiles)
+    default_audio = get_default_audio_profile(device)
+    log.info(f'Choosing {default_audio} from {device.name}')
 
   return transcode_audio_profile(audio_profile, default_audio)
 
 
+def get_compatible_audio_track(device: Device, video: Video) -> int | None:
+  for track, profile in enumerate(video.audio_profiles):
+    if profile.codec is AudioCodec.unknown:
+      continue
+
+    if any(is_codec_compatible(profile.codec, supported.codec) for supported in device.audio_profiles):
+      return track
+
+  return None
+
+
 def transcode_container(
   device: Device,
   video: Video,
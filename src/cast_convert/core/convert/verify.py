@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import logging
+from math import isclose
+from pathlib import Path
+from time import monotonic
+from typing import Final, TYPE_CHECKING
+
+import ffmpeg
+from ffmpeg.nodes import OutputStream
+
+from .process import Process
+from ..enums import Priority
+from ..exceptions import TranscodeError, VerifyError
+from ..model.video import Video
+
+
+if TYPE_CHECKING:
+  from ..model.device import Device
+
+
+log = logging.getLogger(__name__)
+
+NO_SAMPLES: Final[int] = 0
+
+DURATION_TOLERANCE: Final[float] = 1.0  # seconds
+DURATION_REL_TOLERANCE: Final[float] = 0.01
+
+NULL_OUTPUT: Final[str] = '-'
+NULL_FORMAT: Final[str] = 'null'
+FRAMES_OPT: Final[str] = 'frames:v'
+SAMPLE_ARGS: Final[tuple[str, ...]] = ('-v', 'error', '-xerror')
+
+
+def get_stream_counts(video: Video) -> tuple[int, int]:
+  data = video.data
+  return len(data.video_tracks), len(data.audio_tracks)
+
+
+def get_timestamps(duration: float, samples: int) -> list[float]:
+  """Evenly spaced timestamps, excluding the very start and end"""
+  return [duration * index / (samples + 1) for index in range(1, samples + 1)]
+
+
+def get_sample_stream(path: Path, timestamp: float) -> OutputStream:
+  return (
+    ffmpeg
+    .input(str(path), ss=f'{timestamp:.3f}')
+    .output(NULL_OUTPUT, f=NULL_FORMAT, **{FRAMES_OPT: 1})
+    .global_args(*SAMPLE_ARGS)
+  )
+
+
+def decode_samples(path: Path, duration: float, samples: int, priority: Priority = Priority.normal):
+  for timestamp in get_timestamps(duration, samples):
+    try:
+      Process(get_sample_stream(path, timestamp).compile(), priority).run()
+
+    except TranscodeError as e:
+      raise VerifyError(f"[{e}] Can't decode a frame at {timestamp:.1f}s") from e
+
+
+def get_problems(video: Video, converted: Video, device: Device) -> list[str]:
+  problems = list[str]()
+
+  if not isclose(converted.duration, video.duration, rel_tol=DURATION_REL_TOLERANCE, abs_tol=DURATION_TOLERANCE):
+    problems.append(f'duration changed from {video.duration:.1f}s to {converted.duration:.1f}s')
+
+  # FFmpeg writes one stream of each kind unless streams are mapped
+  for kind, source, output in zip(('video', 'audio'), get_stream_counts(video), get_stream_counts(converted)):
+    if source and not output:
+      problems.append(f'{kind} stream is missing')
+
+  if not device.can_play(converted):
+    problems.append(f"{device.name} can't play it")
+
+  return problems
+
+
+def verify_output(
+  video: Video,
+  device: Device,
+  path: Path,
+  samples: int = NO_SAMPLES,
+  priority: Priority = Priority.normal,
+) -> Video:
+  """Probe the converted video, and decode sampled frames, before it can replace the original"""
+  start = monotonic()
+
+  try:
+    converted = Video.from_path(path)
+
+    if problems := get_problems(video, converted, device):
+      raise VerifyError(f"Conversion of {video.path} failed verification: {', '.join(problems)}")
+
+    if samples:
+      decode_samples(path, converted.duration, samples, priority)
+
+  except Exception:
+    path.unlink(missing_ok=True)
+    raise
+
+  log.info(f'Verified {path} in {monotonic() - start:.2f}s, decoded {samples} sampled frames')
+  return converted
@@ -1,5 +1,5 @@
 import logging
-from asyncio import BoundedSemaphore, TaskGroup, gather, sleep, to_thread
+from asyncio import TaskGroup, gather, sleep, to_thread
 from collections.abc import AsyncIterable
 from pathlib import Path
 
@@ -7,11 +7,16 @@ import psutil
 from aiopath import AsyncPath
 from watchfiles import Change, awatch
 
-from .run import convert_from_name_path
-from ..base import DEFAULT_JOBS, DEFAULT_MODEL, DEFAULT_REPLACE, DEFAULT_THREADS, \
-  FILESIZE_CHECK_WAIT, NO_SIZE, get_error_handler
+from .governor import governed
+from .journal import Journal
+from .run import get_planner, schedule_job
+from .schedule import Scheduler
+from .settings import DEFAULT_SETTINGS, Settings
+from .storage import Storage
+from ..base import DEFAULT_MODEL, FILESIZE_CHECK_WAIT, NO_SIZE, get_error_handler
 from ..enums import Strategy
 from ..exceptions import UnknownFormat
+from ..model.device import load_device_with_name
 from ..model.video import Video
 from ..types import Paths
 
@@ -118,39 +123,56 @@ async def gen_new_files(
 async def convert(
   device: str,
   path: Path,
-  sem: BoundedSemaphore,
-  replace: bool = DEFAULT_REPLACE,
-  threads: int = DEFAULT_THREADS,
-  subtitle: Path | None = None,
+  scheduler: Scheduler,
+  settings: Settings = DEFAULT_SETTINGS,
+  journal: Journal | None = None,
+  storage: Storage | None = None,
 ) -> Video | None:
   path = path.absolute()
 
-  async with sem:
-    await gather(wait_for_stable_size(path), wait_until_closed(path))
+  await gather(wait_for_stable_size(path), wait_until_closed(path))
 
-    if not await is_video(path):
-      return None
+  if journal and journal.is_done(path, load_device_with_name(device).name):
+    log.info(f'Already converted {path}, skipping.')
+    return None
+
+  if not await is_video(path):
+    return None
+
+  job = await to_thread(
+    get_planner(settings), device, path, settings.subtitle, journal,
+    settings.fixup, settings.faststart, settings.sidecar,
+  )
 
-    return await to_thread(convert_from_name_path, device, path, replace, threads, subtitle)
+  if not job:
+    return None
+
+  return await schedule_job(job, scheduler, settings, journal, storage)
 
 
 async def convert_videos(
   *paths: Path,
   device: str = DEFAULT_MODEL,
   seen: Paths | None = None,
-  jobs: int = DEFAULT_JOBS,
-  replace: bool = DEFAULT_REPLACE,
-  threads: int = DEFAULT_THREADS,
+  settings: Settings = DEFAULT_SETTINGS,
   error: Strategy = Strategy.quit,
-  subtitle: Path | None = None,
+  journal: Journal | None = None,
 ):
   if seen is None:
     seen = Paths()
 
-  sem = BoundedSemaphore(jobs)
+  scheduler = Scheduler(settings)
+  storage = Storage()
   handled_converter = get_error_handler(convert, UnknownFormat, strategy=error)
 
-  async with TaskGroup() as tg:
+  async with governed(scheduler, settings.pause_load), TaskGroup() as tg:
+    if journal:
+      name = load_device_with_name(device).name
+
+      for path in journal.recover(name):
+        coro = handled_converter(device, path, scheduler, settings, journal, storage)
+        tg.create_task(coro)
+
     async for path in gen_new_files(*paths, seen=seen):
-      coro = handled_converter(device, path, sem, replace, threads, subtitle)
+      coro = handled_converter(device, path, scheduler, settings, journal, storage)
       tg.create_task(coro)
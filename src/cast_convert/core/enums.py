@@ -19,6 +19,34 @@ class Strategy(StrEnum):
   force = auto()
 
 
+class Priority(StrEnum):
+  normal = auto()
+  low = auto()
+  idle = auto()
+
+
+class Speed(StrEnum):
+  """Encoder speed, from best compression to fastest"""
+  quality = auto()
+  balanced = auto()
+  fast = auto()
+  fastest = auto()
+
+
+class Action(StrEnum):
+  """Planned conversion, from cheapest to most expensive"""
+  skip = auto()
+  reject = auto()  # would fail preflight checks
+  rename = auto()
+  faststart = auto()
+  sidecar = auto()
+  copy = auto()
+  fixup = auto()
+  audio = auto()
+  video = auto()
+  scale = auto()
+
+
 class Rc(IntEnum):
   """Return codes"""
   ok: Self = 0
@@ -21,9 +21,37 @@ class UnknownFormat(FormatError):
   pass
 
 
+class PreflightError(FormatError):
+  pass
+
+
 class FileNotVideo(FormatError):
   pass
 
 
 class DeviceError(CastConvertException):
   pass
+
+
+class StorageError(CastConvertException, OSError):
+  pass
+
+
+class TranscodeError(CastConvertException):
+  pass
+
+
+class EncoderError(TranscodeError):
+  """An encoder couldn't be opened or failed, another encoder might work"""
+
+
+class VerifyError(TranscodeError):
+  """The output was written, but it isn't what was planned"""
+
+
+class PlanError(CastConvertException, ValueError):
+  pass
+
+
+class GraphError(CastConvertException, ValueError):
+  pass
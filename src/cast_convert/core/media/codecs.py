@@ -95,12 +95,14 @@ class Subtitle(NormalizedFormat, StrEnum):
   ass = auto()
   eia608 = auto()
   eia708 = auto()
+  pgs = auto()
   srt = auto()
   utf8 = alias(srt)
   ssa = auto()
   ttml = auto()
   timedtext = alias(ttml)
   unknown = auto()
+  vobsub = auto()
   webvtt = auto()
   vtt = alias(webvtt)
   dwebvtt = alias(webvtt)
@@ -5,22 +5,27 @@ from dataclasses import dataclass, field
 from functools import cache
 from itertools import chain
 from pathlib import Path
-from typing import Self, Type
+from typing import Final, Self, Type
 import logging
 
 from ..base import MIN_FUZZY_MATCH_SCORE, first, get_fuzzy_match
 from ..protocols import IsCompatible, get_name
 from ..convert.transcode import transcode_to
-from ..exceptions import UnknownFormat
+from ..exceptions import DeviceError, UnknownFormat
 from ..media.codecs import AudioCodec, Container, Containers, Subtitle, Subtitles, VideoCodec
 from ..media.formats import Formats, Metadata, VideoFormat, VideoFormats, are_compatible
-from ..media.profiles import AudioProfile, AudioProfiles, VideoProfile, VideoProfiles
+from ..media.profiles import AudioProfile, AudioProfiles, VideoProfile, VideoProfiles, is_codec_compatible, \
+  is_video_profile_compatible
 from ..parse import DEVICE_INFO, Fmts, Yaml, get_yaml
+from ..types import Resolution
 from .video import Video, get_video_profiles
 
 
 log = logging.getLogger(__name__)
 
+DEVICE_SEP: Final[str] = ','
+COMMON_NAME_SEP: Final[str] = ' + '
+
 
 @dataclass(eq=True, frozen=True)
 class Device(IsCompatible):
@@ -217,11 +222,93 @@ def is_compatible(device: Device, other: Metadata) -> bool:
 type Devices = tuple[Device, ...]
 
 
+def lowest[T](value: T | None, other: T | None) -> T | None:
+  if value is None or other is None:
+    return other if value is None else value
+
+  return min(value, other)
+
+
+def get_common_resolution(resolution: Resolution | None, other: Resolution | None) -> Resolution | None:
+  if resolution is None or other is None:
+    return lowest(resolution, other)
+
+  return Resolution.new(min(int(resolution.width), int(other.width)), min(int(resolution.height), int(other.height)))
+
+
+def get_common_profile(profile: VideoProfile, other: VideoProfile) -> VideoProfile | None:
+  """Return the most demanding profile both profiles can play"""
+  if not is_codec_compatible(profile.codec, other.codec):
+    return None
+
+  return VideoProfile(
+    codec=profile.codec,
+    resolution=get_common_resolution(profile.resolution, other.resolution),
+    fps=lowest(profile.fps, other.fps),
+    level=lowest(profile.level, other.level),
+  )
+
+
+def get_common_profiles(profiles: VideoProfiles, others: VideoProfiles) -> VideoProfiles:
+  common = [
+    shared
+    for profile in profiles
+    for other in others
+    if (shared := get_common_profile(profile, other))
+  ]
+
+  # profiles that another profile already covers are redundant
+  return [
+    profile
+    for index, profile in enumerate(common)
+    if not any(
+      is_video_profile_compatible(profile, other) and (profile != other or later < index)
+      for later, other in enumerate(common)
+      if later != index
+    )
+  ]
+
+
+def get_common_device(devices: Iterable[Device]) -> Device:
+  """Return a device that only plays what every device can play"""
+  base, *rest = devices
+  video_profiles = base.video_profiles
+
+  for device in rest:
+    video_profiles = get_common_profiles(video_profiles, device.video_profiles)
+
+  def is_common(fmt: VideoFormat) -> bool:
+    return all(device.is_compatible(fmt) for device in rest)
+
+  name = COMMON_NAME_SEP.join(device.name for device in (base, *rest))
+  common = Device(name)
+  common.add_formats(chain(
+    video_profiles,
+    filter(is_common, base.audio_profiles),
+    filter(is_common, base.containers),
+    filter(is_common, base.subtitles),
+  ))
+
+  if not (common.video_profiles and common.audio_profiles and common.containers):
+    raise DeviceError(f'{name} have no video, audio or container formats in common')
+
+  log.info(f'Common profiles of {name}: {common.video_profiles}')
+  return common
+
+
+def split_names(name: str) -> list[str]:
+  return [part for part in map(str.strip, name.split(DEVICE_SEP)) if part]
+
+
 @cache
 def load_device_with_name(
   name: str,
   device_file: Path = DEVICE_INFO,
 ) -> Device | None:
+  if len(names := split_names(name)) > 1:
+    devices = [load_device_with_name(part, device_file) for part in names]
+    return get_common_device(devices) if all(devices) else None
+
   name = name.casefold()
   devices = get_devices_from_file(device_file)
 
@@ -2,26 +2,29 @@ from __future__ import annotations
 
 import logging
 from collections.abc import Iterable
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Self, cast
+from typing import Final, Self, cast
 
-from pymediainfo import MediaInfo
+from pymediainfo import MediaInfo, Track
 
 from ..base import (
-  AT, LEVEL_SEP,
+  AT, LEVEL_SEP, MS_PER_SECOND, NO_SIZE,
 )
 from ..types import DEFAULT_VIDEO_FPS, DEFAULT_VIDEO_LEVEL, Fps, Level, Resolution, VariableFps
 from ..protocols import IsCompatible
 from ..fmt import normalize
 from ..media.codecs import AudioCodec, Container, Subtitle, VideoCodec
 from ..media.formats import Formats, VideoFormat, is_compatible
-from ..media.profiles import AudioProfile, VideoProfile
+from ..media.profiles import AudioProfile, AudioProfiles, VideoProfile, VideoProfiles
 from ..parse import Yaml
 
 
 log = logging.getLogger(__name__)
 
+# MediaInfo's XML output that pymediainfo parses, see: MediaInfo.parse()
+INFO_OUTPUT: Final[str] = 'OLDXML'
+
 
 @dataclass
 class Video(IsCompatible):
@@ -30,11 +33,19 @@ class Video(IsCompatible):
 
   formats: Formats
   data: MediaInfo
+  info: str = field(default='', repr=False, compare=False)  # MediaInfo's XML, to load the video without probing it
 
   @classmethod
   def from_path(cls, path: Path | str) -> Self:
     path = Path(path)
-    data: MediaInfo = MediaInfo.parse(path)
+    info: str = MediaInfo.parse(path, output=INFO_OUTPUT)
+
+    return cls.from_info(path, info)
+
+  @classmethod
+  def from_info(cls, path: Path | str, info: str) -> Self:
+    path = Path(path)
+    data = MediaInfo(info)
 
     [general] = data.general_tracks
     title = general.file_name or general.complete_name
@@ -68,8 +79,55 @@ class Video(IsCompatible):
       path=path.absolute(),
       formats=formats,
       data=data,
+      info=info,
     )
 
+  @property
+  def general(self) -> Track:
+    [general] = self.data.general_tracks
+    return general
+
+  @property
+  def duration(self) -> float:
+    """Duration in seconds"""
+    if not (duration := self.general.duration):
+      return 0.0
+
+    return float(duration) / MS_PER_SECOND
+
+  @property
+  def bitrate(self) -> int | None:
+    """Overall bitrate in bits per second"""
+    if not (bitrate := self.general.overall_bit_rate):
+      return None
+
+    return int(bitrate)
+
+  @property
+  def audio_profiles(self) -> AudioProfiles:
+    """Profiles of every audio track, in stream order"""
+    return [get_track_audio_profile(track) for track in self.data.audio_tracks]
+
+  @property
+  def video_profiles(self) -> VideoProfiles:
+    """Profiles of every video track, in stream order"""
+    return [get_track_video_profile(track) for track in self.data.video_tracks]
+
+  @property
+  def invalid_extension(self) -> bool:
+    return bool(self.general.fileextension_invalid)
+
+  @property
+  def size(self) -> int:
+    if (size := self.general.file_size) is not None:
+      return int(size)
+
+    try:
+      return self.path.stat().st_size
+
+    except OSError:
+      return NO_SIZE
+
   def is_compatible(self, other: VideoFormat) -> bool:
     return is_compatible(self.formats, other)
 
@@ -79,7 +137,10 @@ def get_audio_profile(data: MediaInfo) -> AudioProfile | None:
     return None
 
   audio, *_ = data.audio_tracks
+  return get_track_audio_profile(audio)
 
+
+def get_track_audio_profile(audio: Track) -> AudioProfile:
   name: str = audio.codec_id_hint or audio.format
   codec = AudioCodec.from_info(name)
 
@@ -90,7 +151,15 @@ def get_video_profile(data: MediaInfo) -> VideoProfile | None:
   if not data.video_tracks:
     return None
 
-  [video] = data.video_tracks
+  video, *rest = data.video_tracks
+
+  if rest:
+    log.info(f'Found {len(rest) + 1} video tracks, using the first one.')
+
+  return get_track_video_profile(video)
+
+
+def get_track_video_profile(video: Track) -> VideoProfile:
   fmts = video.format, video.codec_id, video.codec_id_hint
   codec: VideoCodec = cast(VideoCodec, VideoCodec.unknown)
 
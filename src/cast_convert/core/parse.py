@@ -47,6 +47,7 @@ AUDIO_ENCODERS: Final[FmtAliases] = ENCODERS['audio']
 SUBTITLE_ENCODERS: Final[FmtAliases] = ENCODERS['subtitles']
 
 DECODERS: Final[FfmpegCodecs] = DEVICE_DATA['decoders']
+CODEC_CONTAINER_COMPAT: Final[FfmpegCodecs] = DEVICE_DATA['codec_container_compat']
 SUBTITLES: Final[Fmts] = DEVICE_DATA['subtitles']
 CONTAINERS: Final[Fmts] = DEVICE_DATA['containers']
 AUDIO: Final[Fmts] = DEVICE_DATA['audio']
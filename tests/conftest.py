@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import os
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+import pytest
+
+from cast_convert.core.convert import encoders
+from cast_convert.core.convert.encoders import get_capabilities, get_probes
+from cast_convert.core.model.video import Video
+
+
+INFO: str = (
+  '<?xml version="1.0"?>\n'
+  '<Mediainfo><File>\n'
+  '<track type="General"><Duration>{duration}</Duration><Overall_bit_rate>{bitrate}</Overall_bit_rate>'
+  '<Format>MPEG-4</Format><FileExtension>mp4</FileExtension>{text}</track>\n'
+  '<track type="Video"><Format>{codec}</Format>{codec_id}<Format_profile>{profile}</Format_profile>'
+  '<Width>{width}</Width><Height>{height}</Height><Frame_rate>{fps}</Frame_rate></track>\n'
+  '<track type="Audio"><Format>{audio}</Format></track>\n'
+  '</File></Mediainfo>'
+)
+
+
+ENCODERS: str = '''Encoders:
+ V..... = Video
+ A..... = Audio
+ ------
+ V....D libx264              libx264 H.264 / AVC / MPEG-4 AVC / MPEG-4 part 10 (codec h264)
+ V....D h264_nvenc           NVIDIA NVENC H.264 encoder (codec h264)
+ V....D h264_vaapi           H.264/AVC (VAAPI) (codec h264)
+ A....D aac                  AAC (Advanced Audio Coding)
+'''
+
+HWACCELS: str = '''Hardware acceleration methods:
+cuda
+vaapi
+
+'''
+
+# answers like FFmpeg on a host with VAAPI but without an NVIDIA GPU
+FFMPEG: str = f'''#!/bin/sh
+echo "$*" >> "$FFMPEG_CALLS"
+
+case "$*" in
+  *-version*) echo "ffmpeg version $FFMPEG_VERSION Copyright (c) 2000-2024 the FFmpeg developers" ;;
+  *-encoders*) printf '%s' '{ENCODERS}' ;;
+  *-hwaccels*) printf '%s' '{HWACCELS}' ;;
+  *h264_nvenc*) echo "Cannot load libcuda.so.1" >&2; exit 1 ;;
+esac
+'''
+
+
+type MakeVideo = Callable[..., Video]
+
+
+@pytest.fixture
+def make_video(tmp_path: Path) -> MakeVideo:
+  def make_video(
+    width: int = 1920,
+    height: int = 1080,
+    fps: float = 24.0,
+    duration: int = 60_000,
+    bitrate: int = 8_000_000,
+    audio: str = 'AAC',
+    subtitle: str | None = None,
+    codec: str = 'AVC',
+    profile: str = 'High@L4.1',
+    codec_id: str | None = None,
+  ) -> Video:
+    info = INFO.format(
+      width=width, height=height, fps=fps, duration=duration, bitrate=bitrate, audio=audio, codec=codec,
+      profile=profile,
+      codec_id=f'<Codec_ID>{codec_id}</Codec_ID>' if codec_id else '',
+      text=f'<Text_codecs>{subtitle}</Text_codecs>' if subtitle else '',
+    )
+    return Video.from_info(tmp_path / 'video.mp4', info)
+
+  return make_video
+
+
+def clear_caches():
+  get_capabilities.cache_clear()
+  get_probes.cache_clear()
+
+
+@pytest.fixture
+def ffmpeg(tmp_path, monkeypatch) -> Iterator[Path]:
+  """Fake FFmpeg on the PATH, returns the file it logs its arguments to"""
+  bin_dir = tmp_path / 'bin'
+  bin_dir.mkdir()
+
+  script = bin_dir / 'ffmpeg'
+  script.write_text(FFMPEG)
+  script.chmod(0o755)
+
+  calls = tmp_path / 'calls'
+  calls.touch()
+
+  monkeypatch.setenv('PATH', f'{bin_dir}{os.pathsep}{os.environ["PATH"]}')
+  monkeypatch.setenv('FFMPEG_VERSION', '6.1')
+  monkeypatch.setenv('FFMPEG_CALLS', str(calls))
+  monkeypatch.setattr(encoders, 'CACHE_DIR', tmp_path / 'cache')
+
+  clear_caches()
+  yield calls
+  clear_caches()
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import pytest
+
+from cast_convert.core.convert.affinity import CorePool, get_numa_nodes, parse_cpulist
+
+
+@pytest.mark.parametrize('text, cpus', [
+  ('0', {0}),
+  ('0-3', {0, 1, 2, 3}),
+  ('0-1,4,6-7\n', {0, 1, 4, 6, 7}),
+  ('', set()),
+])
+def test_parse_cpulist(text, cpus):
+  assert parse_cpulist(text) == frozenset(cpus)
+
+
+def test_numa_nodes(tmp_path, monkeypatch):
+  monkeypatch.setattr('cast_convert.core.convert.affinity.get_usable_cpus', lambda: frozenset(range(6)))
+
+  for name, cpulist in {'node0': '0-3', 'node1': '4-7', 'node2': ''}.items():
+    (tmp_path / name).mkdir()
+    (tmp_path / name / 'cpulist').write_text(cpulist)
+
+  assert get_numa_nodes(tmp_path) == [frozenset(range(4)), frozenset({4, 5})]
+
+
+def test_numa_nodes_fallback(tmp_path, monkeypatch):
+  monkeypatch.setattr('cast_convert.core.convert.affinity.get_usable_cpus', lambda: frozenset(range(2)))
+  assert get_numa_nodes(tmp_path) == [frozenset(range(2))]
+
+
+def test_allocate_within_node():
+  pool = CorePool([frozenset(range(4)), frozenset(range(4, 8))])
+  first = pool.allocate(2)
+  second = pool.allocate(4)
+
+  assert first is not None and second is not None
+  assert not first & second
+  assert any(second <= node for node in pool.nodes)
+  assert pool.free == 2
+
+
+def test_allocate_smallest_fitting_node():
+  pool = CorePool([frozenset(range(8)), frozenset(range(8, 10))])
+  assert pool.allocate(2) == frozenset({8, 9})
+
+
+def test_allocate_across_nodes():
+  pool = CorePool([frozenset(range(2)), frozenset(range(2, 4))])
+  assert pool.allocate(3) is not None
+  assert pool.free == 1
+
+
+@pytest.mark.parametrize('count', [0, 5])
+def test_allocate_impossible(count):
+  pool = CorePool([frozenset(range(4))])
+
+  assert pool.allocate(count) is None
+  assert pool.free == 4
+
+
+def test_release():
+  pool = CorePool([frozenset(range(4))])
+  cpus = pool.allocate(3)
+  pool.release(cpus)
+  pool.release(None)
+
+  assert pool.free == 4
+  assert pool.allocate(4) == frozenset(range(4))
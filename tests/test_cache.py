@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import os
+from dataclasses import replace
+from pathlib import Path
+
+import pytest
+
+from conftest import clear_caches
+
+from cast_convert.core.convert.cache import OutputCache, get_content_digest
+from cast_convert.core.convert.jobs import Job, Target
+from cast_convert.core.convert.run import get_cache_key
+from cast_convert.core.convert.settings import DEFAULT_SETTINGS
+from cast_convert.core.convert.storage import PARTIAL_PREFIX, PARTIAL_SUFFIX
+from cast_convert.core.convert.transcode import TranscodeFormats
+from cast_convert.core.enums import Speed
+from cast_convert.core.media.codecs import Container
+from cast_convert.core.model.device import Device
+
+
+MKV: TranscodeFormats = TranscodeFormats(container=Container.matroska)
+WEBM: TranscodeFormats = TranscodeFormats(container=Container.webm)
+
+
+@pytest.fixture
+def job(ffmpeg, make_video) -> Job:
+  video = make_video()
+  video.path.write_bytes(b'video' * 1_000)
+
+  return Job(video.path, Device('a'), video, MKV)
+
+
+def write(path: Path, size: int, mtime: float) -> Path:
+  path.write_bytes(b'\0' * size)
+  os.utime(path, (mtime, mtime))
+
+  return path
+
+
+def test_content_digest(tmp_path):
+  a = write(tmp_path / 'a', 100, 0)
+  b = write(tmp_path / 'b', 100, 1)
+
+  assert get_content_digest(a) == get_content_digest(b)
+
+  b.write_bytes(b'\1' * 100)
+  assert get_content_digest(a) != get_content_digest(b)
+
+  b.write_bytes(b'\0' * 101)
+  assert get_content_digest(a) != get_content_digest(b)
+
+
+def test_cache_key(job):
+  key = get_cache_key(job)
+
+  assert get_cache_key(job) == key
+  assert get_cache_key(job, target=Target(MKV, (Device('a'),))) == key
+
+
+def test_cache_key_per_device_group(job):
+  a, b = Device('a'), Device('b')
+  keys = {
+    get_cache_key(job, target=Target(MKV, devices))
+    for devices in ((a,), (b,), (a, b))
+  }
+
+  assert len(keys) == 3
+
+
+def test_cache_key_per_formats(job):
+  assert get_cache_key(job) != get_cache_key(replace(job, formats=WEBM))
+
+  devices = (job.device,)
+  assert get_cache_key(job, target=Target(MKV, devices)) != get_cache_key(job, target=Target(WEBM, devices))
+
+
+def test_cache_key_inputs(job, tmp_path, monkeypatch):
+  key = get_cache_key(job)
+  subtitle = write(tmp_path / 'video.srt', 10, 0)
+
+  assert get_cache_key(replace(job, speed=Speed.fast)) != key
+  assert get_cache_key(job, replace(DEFAULT_SETTINGS, subtitle=subtitle)) != key
+
+  monkeypatch.setenv('FFMPEG_VERSION', '7.0')
+  clear_caches()
+  assert get_cache_key(job) != key
+
+  job.path.write_bytes(b'other' * 1_000)
+  assert get_cache_key(job) != key
+
+
+def test_store_and_fetch(tmp_path):
+  cache = OutputCache(tmp_path / 'cache')
+  src = write(tmp_path / 'output.mkv', 100, 0)
+  dst = tmp_path / 'fetched.mkv'
+
+  assert cache.fetch('key', dst) is None
+
+  cache.store('key', src)
+
+  assert cache.fetch('key', tmp_path / 'fetched.mp4') is None
+  assert cache.fetch('key', dst) == dst
+  assert dst.read_bytes() == src.read_bytes()
+
+  # the cache keeps its own copy
+  src.unlink()
+  dst.unlink()
+  assert cache.fetch('key', dst) == dst
+  assert sorted(path.name for path in cache.path.iterdir()) == ['.lock', 'key.mkv']
+
+
+def test_fetch_touches_entry(tmp_path):
+  cache = OutputCache(tmp_path / 'cache')
+  cache.store('key', write(tmp_path / 'output.mkv', 100, 0))
+  entry = cache.get_entry_path('key', '.mkv')
+  os.utime(entry, (0, 0))
+
+  cache.fetch('key', tmp_path / 'fetched.mkv')
+  assert entry.stat().st_mtime > 0
+
+
+def test_evict_least_recently_used(tmp_path):
+  cache = OutputCache(tmp_path / 'cache', max_size=250)
+  cache.path.mkdir()
+
+  for name, mtime in (('old', 1), ('new', 3), ('mid', 2)):
+    write(cache.get_entry_path(name, '.mkv'), 100, mtime)
+
+  cache.evict()
+  assert sorted(path.name for path in cache.path.iterdir()) == ['mid.mkv', 'new.mkv']
+
+  # storing one more evicts the least recently used again
+  cache.store('newest', write(tmp_path / 'output.mkv', 100, 0))
+  assert sorted(path.name for path in cache.path.iterdir()) == ['.lock', 'new.mkv', 'newest.mkv']
+
+
+def test_evict_skips_partial_outputs(tmp_path):
+  cache = OutputCache(tmp_path / 'cache', max_size=0)
+  cache.path.mkdir()
+
+  entry = write(cache.get_entry_path('key', '.mkv'), 100, 0)
+  partial = write(cache.path / f'{PARTIAL_PREFIX}{entry.name}-host-1{PARTIAL_SUFFIX}', 100, 0)
+
+  cache.evict()
+  assert not entry.exists()
+  assert partial.exists()
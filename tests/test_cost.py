@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import pytest
+
+from cast_convert.core.convert.cost import (
+  ACTION_COSTS, NO_BYTES, estimate_cost, estimate_size, get_fps_ratio, get_megapixels, get_profile_action,
+)
+from cast_convert.core.enums import Action
+from cast_convert.core.media.codecs import VideoCodec
+from cast_convert.core.media.profiles import VideoProfile
+from cast_convert.core.types import Fps, Level, Resolution
+
+
+def test_megapixels(make_video):
+  video = make_video(1920, 1080)
+
+  assert get_megapixels(video) == pytest.approx(2.0736)
+  assert get_megapixels(video, Resolution.new(1280, 720)) == pytest.approx(0.9216)
+
+
+def test_megapixels_never_upscale(make_video):
+  video = make_video(1280, 720)
+  assert get_megapixels(video, Resolution.new(3840, 2160)) == pytest.approx(0.9216)
+
+
+def test_fps_ratio(make_video):
+  video = make_video(fps=60.0)
+
+  assert get_fps_ratio(video) == 1.0
+  assert get_fps_ratio(video, Fps('30')) == pytest.approx(0.5)
+  assert get_fps_ratio(video, Fps('120')) == 1.0
+
+
+def test_cost_scales_with_duration(make_video):
+  short, long = make_video(duration=60_000), make_video(duration=120_000)
+  assert estimate_cost(Action.copy, long) == pytest.approx(2 * estimate_cost(Action.copy, short))
+
+
+def test_cost_of_pixel_bound_actions(make_video):
+  video = make_video(1920, 1080, fps=60.0, duration=10_000)
+  full = estimate_cost(Action.video, video)
+  scaled = estimate_cost(Action.scale, video, Resolution.new(960, 540), Fps('30'))
+
+  assert full == pytest.approx(ACTION_COSTS[Action.video] * 2.0736 * 10)
+  assert scaled == pytest.approx(ACTION_COSTS[Action.scale] * 2.0736 / 4 / 2 * 10)
+
+
+@pytest.mark.parametrize('action', [Action.skip, Action.reject, Action.rename])
+def test_free_actions(make_video, action):
+  assert estimate_cost(action, make_video()) == 0.0
+
+
+@pytest.mark.parametrize('profile, action', [
+  (None, Action.copy),
+  (VideoProfile(codec=None, resolution=None, fps=None, level=None), Action.copy),
+  (VideoProfile(codec=None, resolution=Resolution.new(1280, 720), fps=None, level=None), Action.scale),
+  (VideoProfile(codec=VideoCodec.hevc, resolution=None, fps=None, level=None), Action.video),
+  (VideoProfile(codec=None, resolution=None, fps=None, level=Level('4.1')), Action.video),
+])
+def test_profile_action(profile, action):
+  assert get_profile_action(profile) is action
+
+
+def test_size_without_output(make_video):
+  video = make_video()
+
+  for action in (Action.skip, Action.reject, Action.rename, Action.sidecar):
+    assert estimate_size(action, video) == NO_BYTES
+
+
+def test_size_of_pixel_bound_actions(make_video):
+  video = make_video(1920, 1080, duration=8_000, bitrate=8_000_000)
+  copy = estimate_size(Action.copy, video)
+
+  assert copy >= 8_000_000
+  assert estimate_size(Action.scale, video, Resolution.new(960, 540)) == pytest.approx(copy / 4, abs=1)
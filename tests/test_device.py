@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import pytest
+
+from cast_convert.core.exceptions import DeviceError
+from cast_convert.core.media.codecs import AudioCodec, Container, VideoCodec
+from cast_convert.core.media.profiles import AudioProfile, VideoProfile
+from cast_convert.core.model.device import (
+  Device, get_common_device, get_common_profile, get_common_profiles, get_common_resolution, split_names,
+)
+from cast_convert.core.types import Fps, Level, Resolution
+
+
+FHD: Resolution = Resolution.new(1920, 1080)
+UHD: Resolution = Resolution.new(3840, 2160)
+
+
+def avc(resolution: Resolution = FHD, fps: str = '30', level: str = '4.1') -> VideoProfile:
+  return VideoProfile(VideoCodec.avc, resolution, Fps(fps), Level(level))
+
+
+def hevc(resolution: Resolution = UHD, fps: str = '60', level: str = '5.1') -> VideoProfile:
+  return VideoProfile(VideoCodec.hevc, resolution, Fps(fps), Level(level))
+
+
+def test_common_resolution():
+  assert get_common_resolution(FHD, UHD) == FHD
+  assert get_common_resolution(Resolution.new(1920, 2160), Resolution.new(3840, 1080)) == FHD
+  assert get_common_resolution(None, UHD) == UHD
+  assert get_common_resolution(None, None) is None
+
+
+def test_common_profile():
+  assert get_common_profile(avc(UHD, '60', '5.1'), avc(FHD, '30', '4.1')) == avc()
+  assert get_common_profile(avc(), hevc()) is None
+
+
+def test_common_profiles():
+  profiles = [avc(UHD, '60', '5.1'), hevc()]
+  others = [avc(FHD, '30', '4.1'), hevc(FHD, '30', '4.1')]
+
+  assert get_common_profiles(profiles, others) == [avc(), hevc(FHD, '30', '4.1')]
+
+
+def test_common_profiles_drop_covered():
+  profiles = [avc(UHD, '60', '5.1'), avc(FHD, '60', '4.2')]
+  others = [avc(FHD, '30', '4.1'), avc(Resolution.new(1280, 720), '30', '4.0')]
+
+  assert get_common_profiles(profiles, others) == [avc()]
+
+
+def test_common_profiles_keep_one_duplicate():
+  assert get_common_profiles([avc(), avc()], [avc()]) == [avc()]
+
+
+def test_no_common_profiles():
+  assert get_common_profiles([avc()], [hevc()]) == []
+
+
+def device(name: str, *formats) -> Device:
+  device = Device(name)
+  device.add_formats(formats)
+  return device
+
+
+def test_common_device():
+  aac, mp3 = AudioProfile(AudioCodec.aac), AudioProfile(AudioCodec.mp3)
+  first = device('first', avc(UHD, '60', '5.1'), hevc(), aac, mp3, Container.mp4, Container.matroska)
+  second = device('second', avc(), aac, Container.mp4)
+
+  common = get_common_device([first, second])
+
+  assert common.name == 'first + second'
+  assert common.video_profiles == [avc()]
+  assert common.audio_profiles == [aac]
+  assert common.containers == [Container.mp4]
+
+
+def test_no_common_device():
+  first = device('first', avc(), AudioProfile(AudioCodec.aac), Container.mp4)
+  second = device('second', hevc(), AudioProfile(AudioCodec.aac), Container.mp4)
+
+  with pytest.raises(DeviceError):
+    get_common_device([first, second])
+
+
+def test_split_names():
+  assert split_names(' chromecast 1st gen, ,chromecast ultra ') == ['chromecast 1st gen', 'chromecast ultra']
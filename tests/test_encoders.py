@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from cast_convert.core.convert.encoders import (
+  get_available, get_capabilities, is_available, parse_encoders, parse_hwaccels, probe_encoder,
+)
+from cast_convert.core.convert.jobs import Job
+from cast_convert.core.convert.run import fall_back, get_encoder
+from cast_convert.core.convert.transcode import TranscodeFormats, TranscodeVideoProfile
+from cast_convert.core.exceptions import EncoderError, TranscodeError
+from cast_convert.core.media.codecs import VideoCodec
+from cast_convert.core.model.device import Device
+from cast_convert.core.parse import VIDEO_ENCODERS
+from conftest import ENCODERS, HWACCELS, clear_caches
+
+
+AVC: TranscodeFormats = TranscodeFormats(
+  video_profile=TranscodeVideoProfile(codec=VideoCodec.avc, resolution=None, fps=None, level=None),
+)
+
+
+def count_calls(calls: Path, arg: str) -> int:
+  return sum(arg in line.split() for line in calls.read_text().splitlines())
+
+
+def test_parse_encoders():
+  assert parse_encoders(ENCODERS) == {'libx264', 'h264_nvenc', 'h264_vaapi', 'aac'}
+  assert parse_encoders('') == frozenset()
+
+
+def test_parse_hwaccels():
+  assert parse_hwaccels(HWACCELS) == {'cuda', 'vaapi'}
+  assert parse_hwaccels('') == frozenset()
+
+
+def test_capabilities(ffmpeg):
+  capabilities = get_capabilities()
+
+  assert capabilities.version.startswith('ffmpeg version 6.1')
+  assert capabilities.encoders == parse_encoders(ENCODERS)
+  assert capabilities.hwaccels == {'cuda', 'vaapi'}
+
+
+def test_capabilities_cache(ffmpeg, monkeypatch):
+  get_capabilities()
+  clear_caches()
+  get_capabilities()
+
+  assert count_calls(ffmpeg, '-encoders') == 1
+
+  monkeypatch.setenv('FFMPEG_VERSION', '7.0')
+  clear_caches()
+
+  assert get_capabilities().version.startswith('ffmpeg version 7.0')
+  assert count_calls(ffmpeg, '-encoders') == 2
+
+
+def test_no_ffmpeg(tmp_path, monkeypatch):
+  monkeypatch.setenv('PATH', str(tmp_path))
+  clear_caches()
+
+  assert get_capabilities() is None
+  assert get_available(['h264_nvenc', 'libx264']) == ['h264_nvenc', 'libx264']
+
+  clear_caches()
+
+
+def test_probe_encoder(ffmpeg):
+  assert probe_encoder('h264_vaapi')
+  assert not probe_encoder('h264_nvenc')
+
+
+def test_available(ffmpeg):
+  assert is_available('libx264')
+  assert not is_available('libx265')
+  assert not is_available('h264_nvenc')
+  assert get_available(VIDEO_ENCODERS[VideoCodec.avc]) == ['h264_vaapi', 'libx264']
+
+
+def test_probes_cache(ffmpeg):
+  is_available('h264_nvenc')
+  clear_caches()
+
+  assert not is_available('h264_nvenc')
+  assert count_calls(ffmpeg, 'h264_nvenc') == 1
+
+
+def test_software_encoders_not_probed(ffmpeg):
+  is_available('libx264')
+  assert count_calls(ffmpeg, 'libx264') == 0
+
+
+@pytest.fixture
+def job(make_video) -> Job:
+  video = make_video()
+  return Job(video.path, Device('device'), video, AVC)
+
+
+def test_fall_back(ffmpeg, job):
+  attempts = list[str]()
+
+  def transcode() -> str:
+    attempts.append(encoder := get_encoder(VideoCodec.avc, job.skip))
+
+    if encoder == 'h264_vaapi':
+      raise EncoderError('Error while opening encoder')
+
+    return encoder
+
+  assert fall_back(job, transcode, [job.formats]) == 'libx264'
+  assert attempts == ['h264_vaapi', 'libx264']
+  assert job.skip == {'h264_vaapi'}
+
+  # the failure is kept to the job, other jobs still prefer the encoder
+  assert get_encoder(VideoCodec.avc) == 'h264_vaapi'
+  assert VIDEO_ENCODERS[VideoCodec.avc].count('h264_vaapi') == 1
+
+
+def test_fall_back_without_encoders_left(ffmpeg, job):
+  def transcode():
+    raise EncoderError('Error while opening encoder')
+
+  with pytest.raises(EncoderError):
+    fall_back(job, transcode, [job.formats])
+
+  assert job.skip == {'h264_vaapi'}
+
+
+def test_no_fall_back_for_other_errors(ffmpeg, job):
+  attempts = list[int]()
+
+  def transcode():
+    attempts.append(len(attempts))
+    raise TranscodeError('Invalid data found when processing input')
+
+  with pytest.raises(TranscodeError):
+    fall_back(job, transcode, [job.formats])
+
+  assert attempts == [0]
+  assert not job.skip
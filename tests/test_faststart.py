@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import struct
+from pathlib import Path
+
+import pytest
+
+from cast_convert.core.convert.faststart import (
+  CO64, MAX_STCO_OFFSET, MDAT, MOOF, MOOV, STCO, faststart, is_faststart, read_atoms,
+)
+from cast_convert.core.exceptions import FormatError
+
+
+FTYP: bytes = b'ftyp'
+CHUNKS: tuple[bytes, ...] = (b'first chunk', b'second chunk')
+
+
+def atom(kind: bytes, *children: bytes) -> bytes:
+  body = b''.join(children)
+  return struct.pack('>I4s', 8 + len(body), kind) + body
+
+
+def large_atom(kind: bytes, body: bytes) -> bytes:
+  return struct.pack('>I4sQ', 1, kind, 16 + len(body)) + body
+
+
+def offset_table(kind: bytes, offsets: list[int]) -> bytes:
+  fmt = '>I' if kind == STCO else '>Q'
+  entries = b''.join(struct.pack(fmt, offset) for offset in offsets)
+  return atom(kind, struct.pack('>II', 0, len(offsets)), entries)
+
+
+def moov(kind: bytes, offsets: list[int]) -> bytes:
+  stbl = atom(b'stbl', offset_table(kind, offsets))
+  return atom(MOOV, atom(b'mvhd'), atom(b'trak', atom(b'mdia', atom(b'minf', stbl))))
+
+
+def write_mp4(path: Path, kind: bytes = STCO, large: bool = False) -> Path:
+  """Writes ftyp, mdat, moov with offsets pointing at each chunk in the mdat"""
+  ftyp = atom(FTYP, b'isom')
+  mdat = large_atom(MDAT, b''.join(CHUNKS)) if large else atom(MDAT, *CHUNKS)
+  start = len(ftyp) + len(mdat) - sum(map(len, CHUNKS))
+  offsets = [start, start + len(CHUNKS[0])]
+
+  path.write_bytes(ftyp + mdat + moov(kind, offsets))
+  return path
+
+
+def get_offsets(data: bytes) -> list[int]:
+  kind = STCO if STCO in data else CO64
+  position = data.index(kind) + 4 + 4
+  count, = struct.unpack_from('>I', data, position)
+  fmt = '>I' if kind == STCO else '>Q'
+
+  return [struct.unpack_from(fmt, data, position + 4 + index * struct.calcsize(fmt))[0] for index in range(count)]
+
+
+def assert_chunks(data: bytes):
+  for offset, chunk in zip(get_offsets(data), CHUNKS, strict=True):
+    assert data[offset:offset + len(chunk)] == chunk
+
+
+def test_read_atoms(tmp_path):
+  data = write_mp4(tmp_path / 'video.mp4').read_bytes()
+  kinds = [atom.kind for atom in read_atoms(data)]
+
+  assert kinds == [FTYP, MDAT, MOOV]
+
+
+def test_read_large_atoms(tmp_path):
+  data = write_mp4(tmp_path / 'video.mp4', large=True).read_bytes()
+  _, mdat, _ = read_atoms(data)
+
+  assert mdat.header == 16
+  assert data[mdat.body:mdat.end] == b''.join(CHUNKS)
+
+
+@pytest.mark.parametrize('kind', [STCO, CO64])
+@pytest.mark.parametrize('large', [False, True])
+def test_faststart(tmp_path, kind, large):
+  path = write_mp4(tmp_path / 'video.mp4', kind, large)
+  before = path.read_bytes()
+  assert_chunks(before)
+  assert not is_faststart(path)
+
+  output = faststart(path, tmp_path / 'output.mp4')
+  data = output.read_bytes()
+
+  assert [atom.kind for atom in read_atoms(data)] == [FTYP, MOOV, MDAT]
+  assert len(data) == len(before)
+  assert is_faststart(output)
+  assert_chunks(data)
+
+
+def test_faststart_in_place(tmp_path):
+  path = write_mp4(tmp_path / 'video.mp4')
+
+  assert faststart(path) == path
+  assert is_faststart(path)
+  assert_chunks(path.read_bytes())
+  assert list(tmp_path.iterdir()) == [path]
+
+
+def test_already_faststart(tmp_path):
+  path = write_mp4(tmp_path / 'video.mp4')
+  faststart(path)
+  data = path.read_bytes()
+
+  assert faststart(path) is None
+  assert path.read_bytes() == data
+
+
+def test_stco_overflow(tmp_path):
+  path = tmp_path / 'video.mp4'
+  path.write_bytes(atom(FTYP) + atom(MDAT, b'data') + moov(STCO, [MAX_STCO_OFFSET - 4]))
+
+  with pytest.raises(FormatError):
+    faststart(path, tmp_path / 'output.mp4')
+
+  assert not (tmp_path / 'output.mp4').exists()
+
+
+@pytest.mark.parametrize('data', [
+  atom(FTYP) + atom(MOOV) + atom(MOOF) + atom(MDAT),
+  atom(FTYP) + atom(MDAT),
+  atom(FTYP) + atom(MDAT) + struct.pack('>I4s', 0xff, MOOV),
+  atom(FTYP) + atom(MDAT) + atom(MOOV, atom(b'cmov')),
+])
+def test_unsupported(tmp_path, data):
+  path = tmp_path / 'video.mp4'
+  path.write_bytes(data)
+
+  with pytest.raises(FormatError):
+    faststart(path, tmp_path / 'output.mp4')
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import pytest
+
+from cast_convert.core.convert import fixup
+from cast_convert.core.convert.fixup import (
+  FixupFormats, fits_level, get_bitstream_filter, get_level_fixup, needs_tag_fixup, verify_fixup,
+)
+from cast_convert.core.convert.transcode import TranscodeVideoProfile
+from cast_convert.core.exceptions import VerifyError
+from cast_convert.core.media.codecs import AudioCodec, Container, Subtitle, VideoCodec
+from cast_convert.core.media.formats import Formats
+from cast_convert.core.media.profiles import AudioProfile, VideoProfile
+from cast_convert.core.types import Level, Resolution
+
+
+HEVC: dict[str, str] = {'codec': 'HEVC', 'profile': 'Main@L5.1@Main'}
+LEVEL: VideoProfile = VideoProfile(None, None, None, Level('4.1'))
+FIXUP: FixupFormats = FixupFormats(video_profile=TranscodeVideoProfile(None, None, None, Level('4.1')))
+
+
+# at each level's limits: luma samples per frame, per second, and the bitrate
+@pytest.mark.parametrize('level, width, height, fps, bitrate, fits', [
+  # H.264 4.1: 8,192 macroblocks per frame, 245,760 per second, 50 Mbps
+  ('4.1', 2048, 1024, 30, 50_000_000, True),
+  ('4.1', 2048, 1040, 30, 8_000_000, False),
+  ('4.1', 2048, 1024, 31, 8_000_000, False),
+  ('4.1', 2048, 1024, 30, 50_000_001, False),
+  ('4.0', 1920, 1080, 30, 20_000_000, True),
+  ('4.0', 1920, 1080, 30, 20_000_001, False),
+  ('3.1', 1280, 720, 30, 14_000_000, True),
+  ('3.1', 1280, 720, 60, 8_000_000, False),
+  ('4.3', 1280, 720, 30, 8_000_000, False),  # not a level
+])
+def test_fits_avc_level(make_video, level, width, height, fps, bitrate, fits):
+  video = make_video(width=width, height=height, fps=fps, bitrate=bitrate)
+  assert fits_level(video, Level(level)) is fits
+
+
+@pytest.mark.parametrize('level, width, height, fps, bitrate, fits', [
+  # H.265 5.1: 8,912,896 luma samples per frame, 534,773,760 per second, 40 Mbps
+  ('5.1', 4096, 2176, 60, 40_000_000, True),
+  ('5.1', 4096, 2184, 30, 8_000_000, False),
+  ('5.1', 4096, 2176, 61, 8_000_000, False),
+  ('5.1', 4096, 2176, 60, 40_000_001, False),
+  ('4.1', 1920, 1080, 60, 20_000_000, True),
+  ('4.0', 1920, 1080, 60, 8_000_000, False),
+])
+def test_fits_hevc_level(make_video, level, width, height, fps, bitrate, fits):
+  video = make_video(width=width, height=height, fps=fps, bitrate=bitrate, **HEVC)
+  assert fits_level(video, Level(level)) is fits
+
+
+def test_fits_level_without_limits(make_video):
+  assert not fits_level(make_video(codec='VP9'), Level('4.1'))
+
+
+@pytest.mark.parametrize('formats, level', [
+  (None, None),
+  (Formats(), None),
+  (Formats(video_profile=LEVEL), Level('4.1')),
+  (Formats(Container.matroska, LEVEL), None),
+  (Formats(video_profile=LEVEL, audio_profile=AudioProfile(AudioCodec.aac)), None),
+  (Formats(video_profile=LEVEL, subtitle=Subtitle.srt), None),
+  (Formats(video_profile=VideoProfile(VideoCodec.hevc, None, None, Level('4.1'))), None),
+  (Formats(video_profile=VideoProfile(None, Resolution.new(1280, 720), None, Level('4.1'))), None),
+])
+def test_level_fixup(formats: Formats | None, level: Level | None):
+  assert get_level_fixup(formats) == level
+
+
+@pytest.mark.parametrize('video, level, bsf', [
+  ({}, '4.1', 'h264_metadata=level=41'),
+  ({}, '3.0', 'h264_metadata=level=30'),
+  (HEVC, '5.1', 'hevc_metadata=level=153'),
+  (HEVC, '4.0', 'hevc_metadata=level=120'),
+  ({'codec': 'VP9'}, '4.1', None),
+])
+def test_bitstream_filter(make_video, video: dict[str, str], level: str, bsf: str | None):
+  assert get_bitstream_filter(make_video(**video), Level(level)) == bsf
+
+
+def test_tag_fixup(make_video):
+  assert needs_tag_fixup(make_video(codec_id='hev1', **HEVC))
+  assert not needs_tag_fixup(make_video(codec_id='hvc1', **HEVC))
+  assert not needs_tag_fixup(make_video(**HEVC))
+
+
+@pytest.fixture
+def fixed(tmp_path, monkeypatch):
+  """Path of a fixed up output, returns a function that sets the video probing it finds"""
+  path = tmp_path / 'fixed.mp4'
+  path.touch()
+
+  def set_fixed(video):
+    monkeypatch.setattr(fixup.Video, 'from_path', lambda _: video)
+    return path
+
+  return set_fixed
+
+
+def test_verify_fixup(make_video, fixed):
+  video = make_video(profile='High@L5.1')
+  expected = make_video()
+  path = fixed(expected)
+
+  assert verify_fixup(video, FIXUP, path) is expected
+  assert path.exists()
+
+
+@pytest.mark.parametrize('output', [
+  {'profile': 'High@L5.1'},  # level wasn't rewritten
+  {'width': 1280, 'height': 720},
+  {'duration': 30_000},
+  HEVC,
+])
+def test_verify_fixup_fails(make_video, fixed, output: dict):
+  video = make_video(profile='High@L5.1')
+  path = fixed(make_video(**output))
+
+  with pytest.raises(VerifyError):
+    verify_fixup(video, FIXUP, path)
+
+  assert not path.exists()
+
+
+def test_verify_tag_fixup(make_video, fixed):
+  tag = FixupFormats(video_profile=TranscodeVideoProfile(None, None, None, None))
+  video = make_video(codec_id='hev1', **HEVC)
+
+  assert verify_fixup(video, tag, fixed(make_video(codec_id='hvc1', **HEVC)))
+
+  with pytest.raises(VerifyError):
+    verify_fixup(video, tag, fixed(video))
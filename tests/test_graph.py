@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import json
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from cast_convert.core.convert.graph import (
+  NINJA_ESCAPES, GraphFormat, Step, escape_make_path, escape_path, get_graph, get_partial_path,
+)
+from cast_convert.core.enums import Action
+from cast_convert.core.exceptions import GraphError
+
+
+NAMES: tuple[str, ...] = ('plain', 'with space', '50% off', 'a:b #1', 'cost $5', "it's")
+
+
+def get_steps(path: Path) -> list[Step]:
+  steps = list[Step]()
+
+  for name in NAMES:
+    source = path / f'{name}.mkv'
+    source.write_text(name)
+    output = path / f'{name}_transcoded.mkv'
+    steps.append(Step(source, output, Action.copy, (('cp', str(source), str(output)),)))
+
+  return steps
+
+
+def write_graph(path: Path, fmt: GraphFormat) -> list[Step]:
+  steps = get_steps(path)
+  (path / fmt).write_text(get_graph(steps, fmt))
+  return steps
+
+
+def assert_outputs(steps: list[Step]):
+  for step in steps:
+    assert step.output.read_text() == step.source.read_text()
+
+
+def test_partial_path():
+  assert get_partial_path(Path('/videos/movie.mkv')) == Path('/videos/.movie.partial.mkv')
+
+
+def test_escape_make_path():
+  assert escape_make_path(Path('/a b/c:d#1 $x%')) == '/a\\ b/c\\:d\\#1\\ $$x%'
+
+
+@pytest.mark.parametrize('name', ['x=y', 'a;b', 'back\\slash', 'tab\there', 'new\nline'])
+def test_unescapable_make_path(name):
+  with pytest.raises(GraphError):
+    escape_make_path(Path(name))
+
+
+def test_escape_ninja_path():
+  assert escape_path(Path('/a b/c:d$'), NINJA_ESCAPES) == '/a$ b/c$:d$$'
+
+
+def test_jsonl(tmp_path):
+  steps = get_steps(tmp_path)
+  records = [json.loads(line) for line in get_graph(steps, GraphFormat.jsonl).splitlines()]
+
+  assert [record['output'] for record in records] == [str(step.output) for step in steps]
+  assert [record['commands'] for record in records] == [[list(args) for args in step.commands] for step in steps]
+
+
+def test_sh(tmp_path):
+  steps = write_graph(tmp_path, GraphFormat.sh)
+  subprocess.run(['sh', tmp_path / GraphFormat.sh], check=True)
+
+  assert_outputs(steps)
+
+
+@pytest.mark.skipif(not shutil.which('make'), reason='make is not installed')
+def test_make(tmp_path):
+  steps = write_graph(tmp_path, GraphFormat.make)
+  subprocess.run(['make', '-s', '-C', tmp_path, '-f', GraphFormat.make], check=True)
+  assert_outputs(steps)
+
+  result = subprocess.run(['make', '-q', '-C', tmp_path, '-f', GraphFormat.make])
+  assert result.returncode == 0
+
+
+@pytest.mark.skipif(not shutil.which('ninja'), reason='ninja is not installed')
+def test_ninja(tmp_path):
+  steps = write_graph(tmp_path, GraphFormat.ninja)
+  subprocess.run(['ninja', '-C', tmp_path, '-f', GraphFormat.ninja], check=True, capture_output=True)
+
+  assert_outputs(steps)
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import os
+
+import pytest
+
+from cast_convert.core.convert.jobserver import IMPLICIT, MAKEFLAGS, Jobserver, LockPool, get_token_pool
+
+
+@pytest.fixture
+def pipe():
+  read_fd, write_fd = os.pipe()
+  yield read_fd, write_fd
+
+  for fd in (read_fd, write_fd):
+    try:
+      os.close(fd)
+
+    except OSError:
+      pass
+
+
+@pytest.mark.parametrize('flags', ['', 'k', ' -j4'])
+def test_no_jobserver(flags):
+  assert Jobserver.from_env({MAKEFLAGS: flags}) is None
+  assert Jobserver.from_env({}) is None
+
+
+@pytest.mark.parametrize('flags', [
+  ' -j4 --jobserver-auth={read},{write}',
+  'k -j --jobserver-fds={read},{write} --jobserver-auth={read},{write}',
+])
+def test_fd_auth(pipe, flags):
+  read_fd, write_fd = pipe
+  jobserver = Jobserver.from_env({MAKEFLAGS: flags.format(read=read_fd, write=write_fd)})
+
+  assert jobserver is not None
+  assert jobserver.write_fd == write_fd
+  assert os.get_blocking(read_fd)
+  assert not os.get_blocking(jobserver.read_fd)
+
+  if jobserver.read_fd != read_fd:
+    os.close(jobserver.read_fd)
+
+
+def test_fifo_auth(tmp_path):
+  fifo = tmp_path / 'jobserver'
+  os.mkfifo(fifo)
+  jobserver = Jobserver.from_env({MAKEFLAGS: f'-j2 --jobserver-auth=fifo:{fifo}'})
+
+  assert jobserver is not None
+  os.close(jobserver.read_fd)
+  os.close(jobserver.write_fd)
+
+
+def test_unusable_auth():
+  assert Jobserver.from_env({MAKEFLAGS: '--jobserver-auth=not,fds'}) is None
+  assert Jobserver.from_env({MAKEFLAGS: '--jobserver-auth=1000000,1000001'}) is None
+
+
+def test_tokens(pipe):
+  read_fd, write_fd = pipe
+  os.write(write_fd, b'++')
+  jobserver = Jobserver.from_auth(f'{read_fd},{write_fd}')
+
+  tokens = jobserver.acquire(4)
+  assert tokens == [IMPLICIT, b'+', b'+']
+  assert jobserver.acquire(1) == []
+
+  jobserver.release(tokens)
+  assert jobserver.acquire(3) == [IMPLICIT, b'+', b'+']
+
+
+def test_lock_pool(tmp_path):
+  pool = LockPool(tmp_path, size=2)
+  other = LockPool(tmp_path, size=8)
+  tokens = pool.acquire(3)
+
+  assert other.size == 2
+  assert len(tokens) == 2
+  assert other.acquire(1) == []
+
+  pool.release(tokens)
+  assert len(other.acquire(1)) == 1
+
+
+def test_token_pool(tmp_path, monkeypatch):
+  monkeypatch.delenv(MAKEFLAGS, raising=False)
+
+  assert isinstance(get_token_pool(tmp_path), LockPool)
+  assert get_token_pool() is None
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from cast_convert.core.convert.journal import Journal, JobState
+from cast_convert.core.convert.storage import get_partial
+
+
+DEVICE: str = 'Chromecast'
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+  return tmp_path / 'journal.jsonl'
+
+
+@pytest.fixture
+def source(tmp_path):
+  path = tmp_path / 'movie.mkv'
+  path.write_bytes(b'source')
+  return path
+
+
+def test_round_trip(journal_path, source):
+  journal = Journal.load(journal_path)
+  journal.record(source, DEVICE, JobState.running, source.with_suffix('.mp4'), speed='fast')
+
+  entry = Journal.load(journal_path).get(source, DEVICE)
+
+  assert entry.state is JobState.running
+  assert entry.output == source.with_suffix('.mp4')
+  assert entry.speed == 'fast'
+  assert entry.is_current()
+
+
+def test_running_output_removed(journal_path, source):
+  output = source.with_name('movie_transcoded.mp4')
+  output.write_bytes(b'half written')
+
+  Journal.load(journal_path).record(source, DEVICE, JobState.running, output)
+
+  assert Journal.load(journal_path).recover() == [source]
+  assert not output.exists()
+  assert source.exists()
+
+
+def test_faststart_partial_removed(journal_path, source):
+  partial = get_partial(source)
+  partial.write_bytes(b'half written')
+
+  Journal.load(journal_path).record(source, DEVICE, JobState.running, source)
+
+  assert Journal.load(journal_path).recover() == [source]
+  assert not partial.exists()
+  assert source.read_bytes() == b'source'
+
+
+def test_output_kept_when_source_replaced(journal_path, source):
+  output = source.with_suffix('.mp4')
+  journal = Journal.load(journal_path)
+  journal.record(source, DEVICE, JobState.running, output)
+
+  source.rename(output)
+
+  assert Journal.load(journal_path).recover() == []
+  assert output.exists()
+
+
+def test_done_skipped(journal_path, source):
+  output = source.with_suffix('.mp4')
+  output.write_bytes(b'converted')
+
+  journal = Journal.load(journal_path)
+  journal.record(source, DEVICE, JobState.running, output)
+  journal.record(source, DEVICE, JobState.done, output)
+
+  journal = Journal.load(journal_path)
+
+  assert journal.recover() == []
+  assert journal.is_done(source, DEVICE)
+  assert not journal.is_done(source, 'Other device')
+  assert output.exists()
+
+
+def test_done_redone_when_source_changes(journal_path, source):
+  output = source.with_suffix('.mp4')
+  output.write_bytes(b'converted')
+  Journal.load(journal_path).record(source, DEVICE, JobState.done, output)
+
+  source.write_bytes(b'a different source')
+
+  assert not Journal.load(journal_path).is_done(source, DEVICE)
+
+
+def test_recover_by_device(journal_path, source):
+  journal = Journal.load(journal_path)
+  journal.record(source, DEVICE, JobState.planned)
+
+  assert journal.recover('Other device') == []
+  assert journal.recover(DEVICE) == [source]
+
+
+def test_truncated_line(journal_path, source):
+  other = source.with_name('other.mkv')
+  other.write_bytes(b'other')
+
+  Journal.load(journal_path).record(source, DEVICE, JobState.done)
+  line = journal_path.read_text()
+
+  # a crash while appending leaves part of a line without its newline
+  with journal_path.open('a') as file:
+    file.write(line[:len(line) // 2])
+
+  journal = Journal.load(journal_path)
+  journal.record(other, DEVICE, JobState.running)
+  entries = Journal.load(journal_path).entries
+
+  assert {path for path, _ in entries} == {str(source), str(other)}
+
+
+def test_compacted(journal_path, source):
+  journal = Journal.load(journal_path)
+
+  for state in (JobState.planned, JobState.running, JobState.done):
+    journal.record(source, DEVICE, state)
+
+  assert len(journal_path.read_text().splitlines()) == 3
+
+  Journal.load(journal_path)
+  [line] = journal_path.read_text().splitlines()
+
+  assert json.loads(line)['state'] == JobState.done
+  assert not get_partial(journal_path).exists()
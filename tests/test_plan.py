@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+
+from cast_convert.core.convert.journal import get_stat
+from cast_convert.core.convert.plan import PLAN_VERSION, Entry, Plan, Summary, estimate_wall_time
+from cast_convert.core.enums import Action
+from cast_convert.core.exceptions import PlanError
+
+
+def get_entry(path: Path, action: Action = Action.video, **kwargs) -> Entry:
+  path.write_bytes(b'video')
+  size, mtime = get_stat(path)
+
+  return Entry(path, action, size=size, mtime=mtime, **kwargs)
+
+
+@pytest.fixture
+def plan(tmp_path, make_video) -> Plan:
+  info = make_video().info
+
+  return Plan(
+    name='tv',
+    entries=[
+      get_entry(tmp_path / 'a.mkv', Action.video, duration=60.0, cost=120.0, output_size=1_000, info=info),
+      get_entry(tmp_path / 'b.mkv', Action.copy, duration=30.0, cost=3.0, output_size=500, info=info),
+      get_entry(tmp_path / 'c.mkv', Action.skip, duration=10.0),
+      get_entry(tmp_path / 'd.mkv', Action.reject, duration=20.0, error='no audio codec fits'),
+    ],
+    fixup=True,
+    sidecar=True,
+    time=1_000.0,
+  )
+
+
+def test_save_and_load(plan, tmp_path):
+  path = tmp_path / 'plans' / 'tv.json'
+  plan.save(path)
+
+  assert Plan.load(path) == plan
+
+
+@pytest.mark.parametrize('text', [
+  '',
+  '{"version": 1}',
+  f'{{"version": {PLAN_VERSION + 1}, "name": "tv", "entries": []}}',
+  f'{{"version": {PLAN_VERSION}, "name": "tv", "entries": [{{"path": "a.mkv", "action": "unknown"}}]}}',
+])
+def test_load_invalid(tmp_path, text: str):
+  path = tmp_path / 'plan.json'
+  path.write_text(text)
+
+  with pytest.raises(PlanError):
+    Plan.load(path)
+
+
+def test_load_missing(tmp_path):
+  with pytest.raises(PlanError):
+    Plan.load(tmp_path / 'plan.json')
+
+
+def test_record_defaults(tmp_path):
+  entry = Entry.from_record({'path': str(tmp_path / 'a.mkv'), 'action': 'copy'})
+  assert entry == Entry(tmp_path / 'a.mkv', Action.copy)
+  assert json.loads(json.dumps(entry.as_record))['path'] == str(tmp_path / 'a.mkv')
+
+
+def test_is_current(tmp_path):
+  entry = get_entry(tmp_path / 'a.mkv')
+  assert entry.is_current()
+
+  entry.path.write_bytes(b'changed video')
+  assert not entry.is_current()
+
+  entry.path.unlink()
+  assert not entry.is_current()
+
+
+def test_videos_skip_changed_entries(plan):
+  a, b, *_ = plan.entries
+  b.path.write_bytes(b'changed video')
+
+  assert list(plan.get_videos()) == [a.path]
+
+
+def test_summaries(plan):
+  a, b, c, d = plan.entries
+
+  assert plan.pending == [a, b]
+  assert plan.rejected == [d]
+  assert plan.total == Summary(2, 90.0, 123.0, 1_500)
+  assert list(plan.summaries) == [Action.skip, Action.reject, Action.copy, Action.video]
+
+
+@pytest.mark.parametrize('costs, jobs, threads, cores, seconds', [
+  ([], 1, 1, 1, 0.0),
+  ([8.0], 1, 4, 4, 2.0),  # one job uses every core
+  ([4.0, 2.0, 2.0], 2, 1, 2, 4.0),  # longest first, the short jobs share the other slot
+  ([8.0, 8.0], 4, 4, 4, 8.0),  # each of the 4 jobs gets one core
+  ([1.0] * 8, 2, 2, 2, 4.0),  # jobs can't use more cores than there are
+])
+def test_estimate_wall_time(costs: list[float], jobs: int, threads: int, cores: int, seconds: float):
+  assert estimate_wall_time(costs, jobs, threads, cores) == seconds
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import pytest
+
+from cast_convert.core.convert.preflight import (
+  CONTAINER_SUPPORT, ContainerSupport, Streams, fix_container, get_container_support, preflight,
+)
+from cast_convert.core.convert.transcode import TranscodeFormats
+from cast_convert.core.exceptions import PreflightError
+from cast_convert.core.media.codecs import AudioCodec, Container, Subtitle, VideoCodec
+from cast_convert.core.media.profiles import AudioProfile
+from cast_convert.core.model.device import Device
+
+
+AAC: AudioProfile = AudioProfile(AudioCodec.aac)
+DTS: AudioProfile = AudioProfile(AudioCodec.dts)
+
+MKV: TranscodeFormats = TranscodeFormats(container=Container.matroska)
+TO_AAC: TranscodeFormats = TranscodeFormats(audio_profile=AAC)
+TO_SRT: TranscodeFormats = TranscodeFormats(subtitle=Subtitle.srt)
+NOTHING: TranscodeFormats = TranscodeFormats()
+
+
+def get_device(*containers: Container, audio: AudioProfile = AAC) -> Device:
+  return Device('tv', audio_profiles=[audio], containers=list(containers))
+
+
+@pytest.mark.parametrize('container, streams, holds', [
+  (Container.mp4, Streams(VideoCodec.avc, AudioCodec.aac), True),
+  (Container.mp4, Streams(VideoCodec.hevc, AudioCodec.ac3, Subtitle.webvtt), True),
+  (Container.mp4, Streams(VideoCodec.avc, AudioCodec.dts), False),
+  (Container.mp4, Streams(VideoCodec.avc, AudioCodec.aac, Subtitle.pgs), False),
+  (Container.matroska, Streams(VideoCodec.avc, AudioCodec.dts, Subtitle.pgs), True),
+  (Container.webm, Streams(VideoCodec.avc, AudioCodec.opus), False),
+  (Container.webm, Streams(VideoCodec.vp9, AudioCodec.opus), True),
+])
+def test_codec_container_compat(container: Container, streams: Streams, holds: bool):
+  assert CONTAINER_SUPPORT[container].holds(streams) is holds
+
+
+def test_container_support():
+  compat = {'mp4': {'video': ['avc'], 'audio': ['aac'], 'subtitles': None}}
+  support = get_container_support(compat)
+
+  assert support == {
+    Container.mp4: ContainerSupport(frozenset({VideoCodec.avc}), frozenset({AudioCodec.aac})),
+  }
+
+  streams = Streams(VideoCodec.hevc, AudioCodec.aac, Subtitle.srt)
+  assert support[Container.mp4].get_problems(streams) == [repr(VideoCodec.hevc), repr(Subtitle.srt)]
+  assert support[Container.mp4].holds(Streams(VideoCodec.avc))
+
+
+@pytest.mark.parametrize('containers, expected', [
+  ((Container.mp4, Container.matroska), Container.matroska),
+  ((Container.matroska, Container.mp4), Container.matroska),
+  ((Container.mp4, Container.webm), None),
+  ((), None),
+])
+def test_fix_container(containers: tuple[Container, ...], expected: Container | None):
+  streams = Streams(VideoCodec.avc, AudioCodec.dts)
+  assert fix_container(get_device(*containers), streams) == expected
+
+
+@pytest.mark.parametrize('audio, subtitle, formats, device, expected', [
+  # nothing to fix
+  ('AAC', None, NOTHING, get_device(Container.mp4), NOTHING),
+  ('AAC', None, MKV, get_device(Container.matroska), MKV),
+
+  # DTS doesn't fit in MP4, move it to a container the device plays
+  ('DTS', None, NOTHING, get_device(Container.mp4, Container.matroska), MKV),
+
+  # or transcode the audio when none of the device's containers hold it
+  ('DTS', None, NOTHING, get_device(Container.mp4), TO_AAC),
+
+  # transcoding the audio to DTS doesn't fit MP4 either
+  ('AAC', None, TranscodeFormats(audio_profile=DTS), get_device(Container.mp4), TO_AAC),
+
+  # image subtitles move to a container that holds them
+  ('AAC', 'PGS', NOTHING, get_device(Container.mp4, Container.matroska), MKV),
+])
+def test_preflight(ffmpeg, make_video, audio, subtitle, formats, device, expected):
+  video = make_video(audio=audio, subtitle=subtitle)
+  assert preflight(device, video, formats) == expected
+
+
+@pytest.mark.parametrize('audio, subtitle, formats, device', [
+  # image subtitles can't be converted to text
+  ('AAC', 'PGS', TO_SRT, get_device(Container.matroska)),
+  ('AAC', 'VobSub', TO_SRT, get_device(Container.matroska)),
+
+  # nor fit in MP4
+  ('AAC', 'PGS', NOTHING, get_device(Container.mp4)),
+
+  # no audio codec for the device fits in the container
+  ('DTS', None, NOTHING, get_device(Container.mp4, audio=DTS)),
+
+  # the fake FFmpeg has no encoders for text subtitles
+  ('AAC', 'UTF-8', NOTHING, get_device(Container.mp4)),
+])
+def test_preflight_rejects(ffmpeg, make_video, audio, subtitle, formats, device):
+  video = make_video(audio=audio, subtitle=subtitle)
+
+  with pytest.raises(PreflightError):
+    preflight(device, video, formats)
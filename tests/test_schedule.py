@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+
+from cast_convert.core.convert import schedule
+from cast_convert.core.convert.jobs import Job
+from cast_convert.core.convert.jobserver import MAKEFLAGS
+from cast_convert.core.convert.schedule import Scheduler, get_speed
+from cast_convert.core.convert.settings import Settings
+from cast_convert.core.convert.transcode import TranscodeFormats
+from cast_convert.core.enums import Speed
+from cast_convert.core.media.codecs import Container
+from cast_convert.core.model.device import Device
+
+
+BIG: float = 100.0
+CHEAP: float = 10.0
+AGING: float = 10.0  # core-seconds per second waited
+
+ONE_AT_A_TIME: Settings = Settings(jobs=1, threads=1)
+
+
+class Clock:
+  now: float = 0.0
+
+  def __call__(self) -> float:
+    return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+  clock = Clock()
+  monkeypatch.setattr(schedule, 'monotonic', clock)
+  monkeypatch.delenv(MAKEFLAGS, raising=False)
+
+  return clock
+
+
+@pytest.fixture
+def make_job(make_video, monkeypatch) -> Callable[[str, float], Job]:
+  costs = dict[Path, float]()
+  monkeypatch.setattr(schedule, 'get_job_cost', lambda job: costs[job.path])
+  video = make_video()
+
+  def make_job(name: str, cost: float) -> Job:
+    path = Path(name)
+    costs[path] = cost
+
+    return Job(path, Device('a'), video, TranscodeFormats(container=Container.matroska))
+
+  return make_job
+
+
+def run_order(clock: Clock, make_job: Callable[[str, float], Job], aging: float, steps: int) -> list[str]:
+  """Enqueue a big job behind a running one, then a cheap job every second as each running job finishes"""
+  started = list[str]()
+
+  async def run():
+    scheduler = Scheduler(ONE_AT_A_TIME, aging=aging)
+    running = scheduler.enqueue(make_job('running', CHEAP))
+    scheduler.dispatch()
+    big = scheduler.enqueue(make_job('big', BIG))
+
+    queued = [big]
+
+    for step in range(1, steps + 1):
+      clock.now = float(step)
+      queued.append(scheduler.enqueue(make_job(f'cheap-{step}', CHEAP)))
+      scheduler.release(running, running.future.result())
+
+      [running] = [item for item in queued if item.future.done()]
+      queued.remove(running)
+      started.append(str(running.job.path))
+
+  asyncio.run(run())
+  return started
+
+
+def test_cheaper_jobs_first(clock, make_job):
+  started = run_order(clock, make_job, AGING, 5)
+  assert started == [f'cheap-{step}' for step in range(1, 6)]
+
+
+def test_aging_runs_big_job(clock, make_job):
+  # a cheap job enqueued at t has key CHEAP + AGING * t, the big one BIG, ties go to the older job
+  started = run_order(clock, make_job, AGING, 12)
+  waited = int((BIG - CHEAP) / AGING)
+
+  assert started[:waited - 1] == [f'cheap-{step}' for step in range(1, waited)]
+  assert started[waited - 1] == 'big'
+  assert started[waited:] == [f'cheap-{step}' for step in range(waited, 12)]
+
+
+def test_no_aging_starves_big_job(clock, make_job):
+  assert 'big' not in run_order(clock, make_job, 0.0, 20)
+
+
+@pytest.mark.parametrize('backlog, depth, speed', [
+  (0, 0, Speed.quality),
+  (599, 3, Speed.quality),
+  (600, 3, Speed.balanced),
+  (599, 4, Speed.balanced),
+  (3_600, 0, Speed.fast),
+  (4 * 3_600, 0, Speed.fastest),
+  (0, 64, Speed.fastest),
+])
+def test_speed(backlog: float, depth: int, speed: Speed):
+  assert get_speed(backlog, depth) is speed
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import sqlite3
+from collections.abc import Iterator
+from contextlib import closing
+
+import pytest
+
+from cast_convert.core.convert.jobs import Job
+from cast_convert.core.convert.process import Process
+from cast_convert.core.convert.run import record_stats
+from cast_convert.core.convert.stats import MIN_SAMPLES, EncoderStats, JobStats, Stats, get_history
+from cast_convert.core.convert.transcode import TranscodeFormats
+from cast_convert.core.enums import Action
+from cast_convert.core.media.codecs import Container
+from cast_convert.core.model.device import Device
+
+
+HOST: str = 'host'
+
+# the jobs table before the verify column was added
+OLD_SCHEMA: str = """
+CREATE TABLE jobs (
+  id INTEGER PRIMARY KEY, time REAL NOT NULL, host TEXT NOT NULL, path TEXT NOT NULL, device TEXT NOT NULL,
+  container TEXT, video_codec TEXT, resolution TEXT, fps REAL, audio_codec TEXT, action TEXT NOT NULL,
+  encoder TEXT, threads INTEGER NOT NULL, duration REAL NOT NULL, work REAL NOT NULL, wall REAL NOT NULL,
+  cpu REAL NOT NULL, size INTEGER NOT NULL
+);
+INSERT INTO jobs (time, host, path, device, action, encoder, threads, duration, work, wall, cpu, size)
+VALUES (1, 'host', 'a.mkv', 'tv', 'video', 'libx264', 4, 60, 100, 30, 120, 1000);
+"""
+
+
+def get_stats(
+  action: Action = Action.video,
+  encoder: str | None = 'libx264',
+  work: float = 100.0,
+  cpu: float = 200.0,
+  verify: float = 0.0,
+  host: str = HOST,
+) -> JobStats:
+  return JobStats(
+    'a.mkv', 'tv', 'matroska', 'avc', '1920x1080', 24.0, 'aac', action, encoder, 4,
+    duration=60.0, work=work, wall=50.0, cpu=cpu, size=1_000, verify=verify, host=host,
+  )
+
+
+@pytest.fixture
+def stats(tmp_path) -> Iterator[Stats]:
+  get_history.cache_clear()
+  yield Stats(tmp_path / 'stats.sqlite3')
+  get_history.cache_clear()
+
+
+def test_no_history(stats):
+  assert get_history(stats) is None
+  assert stats.get_history(HOST).get_cost(Action.video) is None
+
+
+def test_history(stats):
+  for _ in range(MIN_SAMPLES - 1):
+    stats.record(get_stats())
+
+  assert stats.get_history(HOST).get_cost(Action.video) is None
+
+  stats.record(get_stats(encoder='libx265', work=50.0, cpu=300.0))
+  stats.record(get_stats(host='other', cpu=1_000.0))
+  history = stats.get_history(HOST)
+
+  assert history.get_cost(Action.video) == 700.0 / 250.0
+  assert history.get_cost(Action.video, 'libx264') is None
+  assert history.get_cost(Action.copy) is None
+  assert history.verify is None
+
+
+def test_history_is_cached_until_recorded(stats):
+  stats.record(get_stats())
+  assert get_history(stats) is get_history(stats)
+
+  history = get_history(stats)
+  stats.record(get_stats())
+  assert get_history(stats) is not history
+
+
+def test_verify_rate(stats):
+  for verify in (0.0, 1.0, 2.0):
+    stats.record(get_stats(verify=verify))
+
+  assert stats.get_history(HOST).verify is None
+
+  stats.record(get_stats(verify=3.0))
+  assert stats.get_history(HOST).verify == 6.0 / 180.0
+
+
+def test_encoder_stats(stats):
+  stats.record(get_stats())
+  stats.record(get_stats(action=Action.copy, encoder=None, cpu=10.0))
+
+  assert stats.get_encoder_stats(HOST) == [
+    EncoderStats(None, Action.copy, 1, 60.0, 50.0, 10.0, 4.0),
+    EncoderStats('libx264', Action.video, 1, 60.0, 50.0, 200.0, 4.0),
+  ]
+
+
+def test_add_verify_column(stats):
+  with closing(sqlite3.connect(stats.path)) as connection:
+    connection.executescript(OLD_SCHEMA)
+
+  stats.record(get_stats(verify=2.0))
+
+  with stats.connect() as connection:
+    rows = connection.execute('SELECT path, verify FROM jobs ORDER BY id').fetchall()
+
+  assert rows == [('a.mkv', 0.0), ('a.mkv', 2.0)]
+
+
+def test_record_stats(ffmpeg, make_video, stats):
+  video = make_video()
+  job = Job(video.path, Device('tv'), video, TranscodeFormats(container=Container.matroska), threads=2)
+  job.verified = 1.5
+
+  record_stats(job, 1_000, stats)
+  assert stats.get_encoder_stats() == []
+
+  job.process = Process(['ffmpeg'], started=10.0, finished=40.0, cpu_time=45.0)
+  record_stats(job, 1_000, stats)
+
+  with stats.connect() as connection:
+    connection.row_factory = sqlite3.Row
+    [row] = connection.execute('SELECT * FROM jobs').fetchall()
+
+  assert {key: row[key] for key in ('device', 'container', 'action', 'threads', 'wall', 'cpu', 'size', 'verify')} == {
+    'device': 'tv',
+    'container': 'mp4',
+    'action': Action.copy,
+    'threads': 2,
+    'wall': 30.0,
+    'cpu': 45.0,
+    'size': 1_000,
+    'verify': 1.5,
+  }
+  assert row['duration'] == row['work'] == video.duration
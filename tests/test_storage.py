@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import asyncio
+import errno
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+from cast_convert.core.convert import storage
+from cast_convert.core.convert.storage import Storage, get_partial, link, move, rename
+from cast_convert.core.exceptions import StorageError
+
+
+FREE: int = 1000
+
+
+@pytest.fixture
+def src(tmp_path) -> Path:
+  path = tmp_path / 'src.mp4'
+  path.write_bytes(b'converted')
+  return path
+
+
+@pytest.fixture
+def no_links(monkeypatch):
+  def fail(src, dst):
+    raise OSError(errno.EPERM, os.strerror(errno.EPERM))
+
+  monkeypatch.setattr(os, 'link', fail)
+
+
+@pytest.fixture
+def cross_device(monkeypatch, src):
+  """Renames of the source fail as if the destination was on another filesystem"""
+  replace = Path.replace
+
+  def fail(self, target):
+    if self == src:
+      raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+    return replace(self, target)
+
+  monkeypatch.setattr(Path, 'replace', fail)
+
+
+def test_move(tmp_path, src):
+  dst = tmp_path / 'dst.mp4'
+  dst.write_bytes(b'original')
+
+  assert move(src, dst) == dst
+  assert dst.read_bytes() == b'converted'
+  assert not src.exists()
+
+
+def test_move_across_filesystems(tmp_path, src, cross_device):
+  dst = tmp_path / 'dst.mp4'
+  dst.write_bytes(b'original')
+
+  assert move(src, dst) == dst
+  assert dst.read_bytes() == b'converted'
+  assert not src.exists()
+  assert not get_partial(dst).exists()
+
+
+def test_failed_move_across_filesystems(tmp_path, src, cross_device, monkeypatch):
+  dst = tmp_path / 'dst.mp4'
+  dst.write_bytes(b'original')
+
+  def fail(source, destination):
+    Path(destination).write_bytes(b'conv')
+    raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+
+  monkeypatch.setattr(shutil, 'copyfile', fail)
+
+  with pytest.raises(OSError):
+    move(src, dst)
+
+  assert dst.read_bytes() == b'original'
+  assert src.exists()
+  assert not get_partial(dst).exists()
+
+
+def test_rename(tmp_path, src):
+  dst = tmp_path / 'dst.mkv'
+
+  assert rename(src, dst) == dst
+  assert dst.read_bytes() == b'converted'
+  assert not src.exists()
+
+
+@pytest.mark.parametrize('links', [True, False])
+def test_rename_refuses_to_overwrite(tmp_path, src, request, links):
+  if not links:
+    request.getfixturevalue('no_links')
+
+  dst = tmp_path / 'dst.mkv'
+  dst.write_bytes(b'original')
+
+  with pytest.raises(FileExistsError):
+    rename(src, dst)
+
+  assert dst.read_bytes() == b'original'
+  assert src.read_bytes() == b'converted'
+
+
+def test_rename_without_links(tmp_path, src, no_links):
+  dst = tmp_path / 'dst.mkv'
+
+  assert rename(src, dst) == dst
+  assert not src.exists()
+
+
+def test_link(tmp_path, src):
+  dst = tmp_path / 'dst.mkv'
+
+  assert link(src, dst) == dst
+  assert dst.stat().st_ino == src.stat().st_ino
+
+  with pytest.raises(FileExistsError):
+    link(src, dst)
+
+
+def test_link_copies_without_links(tmp_path, src, no_links):
+  dst = tmp_path / 'dst.mkv'
+
+  assert link(src, dst) == dst
+  assert dst.read_bytes() == b'converted'
+  assert dst.stat().st_ino != src.stat().st_ino
+
+  with pytest.raises(FileExistsError):
+    link(src, dst)
+
+
+@pytest.fixture
+def space(monkeypatch):
+  monkeypatch.setattr(storage, 'get_free_space', lambda path: FREE)
+
+
+def test_try_reserve(tmp_path, space):
+  store = Storage()
+  reservation = store.try_reserve(600, tmp_path)
+
+  assert reservation
+  assert store.try_reserve(500, tmp_path) is None
+  assert store.try_reserve(400, tmp_path)
+
+  store.release(reservation)
+  assert store.try_reserve(600, tmp_path)
+
+
+def test_reservations_shrink_as_outputs_are_written(tmp_path, space):
+  store = Storage()
+  output = tmp_path / 'output.mp4'
+  store.try_reserve(600, tmp_path, outputs=[output])
+
+  assert store.try_reserve(800, tmp_path) is None
+
+  output.write_bytes(bytes(500))
+  assert store.get_reserved(storage.get_device_id(tmp_path)) == 100
+  assert store.try_reserve(800, tmp_path)
+
+
+def test_reserve_for_several_directories(tmp_path, space):
+  store = Storage()
+
+  # both directories are on the same filesystem, so they need twice the space there
+  assert store.try_reserve(600, tmp_path, tmp_path) is None
+  assert store.try_reserve(500, tmp_path, tmp_path)
+
+
+def test_acquire_waits_for_release(tmp_path, space):
+  store = Storage(wait=0.01, timeout=0.0)
+  held = store.try_reserve(FREE, tmp_path)
+
+  async def release():
+    await asyncio.sleep(0.05)
+    store.release(held)
+
+  async def acquire():
+    async with asyncio.TaskGroup() as tg:
+      tg.create_task(release())
+      task = tg.create_task(store.acquire(FREE, tmp_path))
+
+    return task.result()
+
+  # running jobs free their space, so there's no timeout while they hold reservations
+  assert asyncio.run(acquire()) in store.reservations
+
+
+def test_acquire_times_out(tmp_path, space):
+  store = Storage(wait=0.01, timeout=0.05)
+
+  with pytest.raises(StorageError):
+    asyncio.run(store.acquire(FREE + 1, tmp_path))
+
+  assert not store.reservations
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from cast_convert.core.convert.subtitles import BOM, get_sidecar_path, srt_to_vtt, write_vtt
+
+
+SRT: str = '''1
+00:00:01,000 --> 00:00:02,500
+Hello, world
+
+2
+00:01:02,003 --> 00:01:04,000
+Second line, at 12:00:00,000
+'''
+
+VTT: str = '''WEBVTT
+
+1
+00:00:01.000 --> 00:00:02.500
+Hello, world
+
+2
+00:01:02.003 --> 00:01:04.000
+Second line, at 12:00:00.000
+'''
+
+
+def test_srt_to_vtt():
+  assert srt_to_vtt(SRT) == VTT
+
+
+def test_srt_to_vtt_line_endings():
+  assert srt_to_vtt(SRT.replace('\n', '\r\n')) == VTT
+  assert srt_to_vtt(SRT.replace('\n', '\r')) == VTT
+
+
+def test_srt_to_vtt_bom():
+  assert srt_to_vtt(f'{BOM}{SRT}') == VTT
+
+
+def test_srt_to_vtt_keeps_text():
+  assert srt_to_vtt('1\n00:00:01,5 --> x\n1,000 apples\n') == 'WEBVTT\n\n1\n00:00:01,5 --> x\n1,000 apples\n'
+
+
+def test_sidecar_path(tmp_path):
+  video = tmp_path / 'movie.mkv'
+
+  assert get_sidecar_path(video) == tmp_path / 'movie.vtt'
+  assert get_sidecar_path(video, 2) == tmp_path / 'movie.2.vtt'
+
+
+def test_write_vtt(tmp_path):
+  srt = tmp_path / 'movie.SRT'
+  srt.write_bytes(f'{BOM}{SRT}'.replace('\n', '\r\n').encode())
+
+  output = write_vtt(srt, tmp_path / 'movie.vtt')
+
+  assert output == tmp_path / 'movie.vtt'
+  assert output.read_text() == VTT
+
+
+def test_write_vtt_copies_vtt(tmp_path):
+  vtt = tmp_path / 'other.vtt'
+  vtt.write_text(VTT)
+
+  assert write_vtt(vtt, tmp_path / 'movie.vtt').read_text() == VTT
+
+
+def test_write_vtt_unsupported(tmp_path):
+  ass = tmp_path / 'movie.ass'
+  ass.write_text('[Script Info]')
+
+  assert write_vtt(ass, tmp_path / 'movie.vtt') is None
+  assert not (tmp_path / 'movie.vtt').exists()
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import pytest
+
+from cast_convert.core.convert import run
+from cast_convert.core.convert.jobs import Job, Target
+from cast_convert.core.convert.run import get_targets_stream, plan_targets
+from cast_convert.core.convert.transcode import TranscodeFormats, TranscodeVideoProfile
+from cast_convert.core.media.codecs import Container, VideoCodec
+from cast_convert.core.model.device import Device
+from cast_convert.core.types import Resolution
+
+
+HD: TranscodeFormats = TranscodeFormats(
+  video_profile=TranscodeVideoProfile(VideoCodec.avc, Resolution.new(1280, 720), None, None),
+)
+SD: TranscodeFormats = TranscodeFormats(
+  video_profile=TranscodeVideoProfile(VideoCodec.avc, Resolution.new(640, 360), None, None),
+)
+REMUX: TranscodeFormats = TranscodeFormats(container=Container.matroska)
+
+HARDWARE: frozenset[str] = frozenset({'h264_nvenc', 'h264_qsv', 'h264_amf', 'h264_vaapi'})
+
+
+def get_maps(cmd: list[str]) -> list[str]:
+  return [arg for opt, arg in zip(cmd, cmd[1:]) if opt == '-map']
+
+
+def test_scaled_and_copied(ffmpeg, make_video):
+  video = make_video()
+  targets = [Target(HD, (Device('a'),)), Target(REMUX, (Device('b'),))]
+  stream, paths = get_targets_stream(video, targets, skip=HARDWARE)
+  cmd = stream.compile()
+
+  assert cmd.count('-i') == 1
+  assert cmd[cmd.index('-filter_complex') + 1] == '[0:v:0]scale=720:-2[s0]'
+  assert get_maps(cmd) == ['[s0]', '0:a:0?', '0:s:0?', '0:v:0', '0:a:0?', '0:s:0?']
+  assert [str(path) for path in paths] == [arg for arg in cmd if arg not in (str(video.path), '-y') and '/' in arg]
+  assert [path.name for path in paths] == ['video_transcoded-a.mp4', 'video_transcoded-b.mkv']
+
+
+def test_split_per_scaled_output(ffmpeg, make_video):
+  video = make_video()
+  targets = [Target(HD, (Device('a'),)), Target(SD, (Device('b'), Device('c')))]
+  stream, paths = get_targets_stream(video, targets, skip=HARDWARE)
+  cmd = stream.compile()
+
+  assert cmd[cmd.index('-filter_complex') + 1] == (
+    '[0:v:0]split=2[s0][s1];[s0]scale=720:-2[s2];[s1]scale=360:-2[s3]'
+  )
+  assert get_maps(cmd)[::3] == ['[s2]', '[s3]']
+  assert cmd.count('libx264') == 2
+  assert paths[1].name == 'video_transcoded-b-c.mp4'
+
+
+def test_copied_outputs_share_the_decoded_stream(ffmpeg, make_video):
+  video = make_video()
+  targets = [Target(REMUX, (Device('a'),)), Target(TranscodeFormats(container=Container.webm), (Device('b'),))]
+  cmd = get_targets_stream(video, targets, skip=HARDWARE)[0].compile()
+
+  assert '-filter_complex' not in cmd
+  assert get_maps(cmd)[::3] == ['0:v:0', '0:v:0']
+  assert cmd.count('-i') == 1
+
+
+def test_hwupload_per_output(ffmpeg, make_video):
+  video = make_video()
+  targets = [Target(HD, (Device('a'),)), Target(REMUX, (Device('b'),))]
+  cmd = get_targets_stream(video, targets)[0].compile()
+  graph = cmd[cmd.index('-filter_complex') + 1]
+
+  assert 'h264_vaapi' in cmd
+  assert graph.count('hwupload') == 1
+  assert '-vaapi_device' in cmd
+
+
+@pytest.fixture
+def plan(monkeypatch, make_video):
+  """Plan as if each named device needed the formats it maps to"""
+  video = make_video()
+
+  def plan(formats: dict[str, TranscodeFormats | None]) -> Job | None:
+    def plan_job(name: str, path, *args, **kwargs) -> Job | None:
+      if not (fmt := formats[name]):
+        return None
+
+      return Job(path, Device(name), video, fmt)
+
+    monkeypatch.setattr(run, 'plan_job', plan_job)
+    return plan_targets(','.join(formats), video.path, video=video)
+
+  return plan
+
+
+def test_devices_grouped_by_formats(plan):
+  job = plan({'a': HD, 'b': SD, 'c': HD, 'd': None})
+
+  assert [target.formats for target in job.targets] == [HD, SD]
+  assert [[device.name for device in target.devices] for target in job.targets] == [['a', 'c'], ['b']]
+
+
+def test_single_target_shortcut(plan):
+  job = plan({'a': HD, 'b': None})
+
+  assert job.device.name == 'a'
+  assert job.formats is HD
+  assert not job.targets
+
+
+def test_one_output_for_several_devices(plan):
+  job = plan({'a': HD, 'b': HD})
+
+  assert len(job.targets) == 1
+  assert [device.name for device in job.targets[0].devices] == ['a', 'b']
+
+
+def test_nothing_to_plan(plan):
+  assert plan({'a': None, 'b': None}) is None